@@ -1,13 +1,13 @@
-import copy
 import sys
 from datetime import datetime, timedelta
 
 import numpy as np
 import pandas as pd
-import peakutils as pk
-import plotly.graph_objs as go
-import plotly.offline as py
-from netCDF4 import Dataset, date2num, num2date
+
+from divebomb.kernels import (PeakDetector, _PeakCounter, _SortedSums,
+                              count_peaks, deepdive_statistics, epoch_seconds,
+                              mean_time_step)
+from divebomb.record_store import RecordStore
 
 units = 'seconds since 1970-01-01'
 
@@ -67,7 +67,7 @@ class DeepDive:
         """
 
         if data[columns['time']].dtypes != np.float64:
-            data.time = date2num(data.time.tolist(), units=units)
+            data.time = epoch_seconds(data.time)
 
         self.data = data.sort_values('time').reset_index(drop=True)
         for k, v in columns.items():
@@ -75,51 +75,28 @@ class DeepDive:
                 self.data[k] = self.data[v]
                 self.data.drop(v, axis=1)
 
-        self.max_depth = self.data.depth.max()
-        self.min_depth = self.data.depth.min()
-        self.dive_start = self.data.time.min()
-        self.dive_end = self.data.time.max()
-        self.td_total_duration = self.data.time.max() - self.data.time.min()
-        self.depth_variance = np.std(self.data.depth)
-        self.average_vertical_velocity = np.absolute(
-            ((self.data.depth.diff() / self.data.time.diff()))).mean()
-        self.average_descent_velocity = self.get_average_descent_velocity()
-        self.average_ascent_velocity = self.get_average_ascent_velocity()
-
-        self.number_of_descent_transitions = \
-            len(self.data[(self.data.depth.diff() /
-                           self.data.time.diff()) > 0])
-
-        self.number_of_ascent_transitions = \
-            len(self.data[(self.data.depth.diff() /
-                           self.data.time.diff()) < 0])
-
-        self.total_descent_distance_traveled =  \
-            self.get_descent_vertical_distance()
-
-        self.total_ascent_distance_traveled =   \
-            self.get_ascent_vertical_distance()
-
-        self.overall_change_in_depth = self.data.depth.diff().sum()
-        self.td_time_at_depth = self.get_time_at_depth(at_depth_threshold)
-        self.td_time_pre_depth = self.get_time_pre_depth(at_depth_threshold)
-        self.td_time_post_depth = self.get_time_post_depth(at_depth_threshold)
-        self.peaks = self.get_peaks()
-        self.no_skew = 0
-        self.right_skew = 0
-        self.left_skew = 0
-        self.set_skew()
+        attributes = deepdive_statistics(self.data.time.values,
+                                         self.data.depth.values,
+                                         at_depth_threshold)
+        for k, v in attributes.items():
+            setattr(self, k, v)
+
+    def _statistics(self, at_depth_threshold=0.15):
+        """
+        :param at_depth_threshold: a value from 0 - 1 indicating distance from
+            the bottom of the dive at which the animal is considered to be at
+            depth
+        :return: a dictionary of every attribute of the dive
+        """
+        return deepdive_statistics(self.data.time.values,
+                                   self.data.depth.values, at_depth_threshold)
 
     def get_peaks(self):
         """
         :return: number of peaks found within a dive
         """
-        peak_thres = (1 - (self.data.depth.min() / self.data.depth.max()))
-        peaks = pk.indexes(
-            self.data.depth * (-1),
-            thres=min([0.1, peak_thres]),
-            min_dist=max((10 / self.data.time.diff().mean()), 3))
-        self.peaks = len(peaks)
+        self.peaks = count_peaks(self.data.depth.values,
+                                 mean_time_step(self.data.time.values))
         return self.peaks
 
     def set_skew(self):
@@ -140,18 +117,7 @@ class DeepDive:
             depth
         :return: the duration at depth in seconds
         """
-        time = 0
-        dive = self.data.copy(deep=True)
-        dive['time_diff'] = dive.time.diff()
-        time_data = dive[
-            dive.depth > (dive.depth.max() - (
-                (dive.depth.max() - dive.depth.min()) * at_depth_threshold)
-            )
-        ].tail(-1)
-        if len(time_data) != 0:
-            time = time_data.time_diff.sum()
-        del dive
-        return time
+        return self._statistics(at_depth_threshold)['td_time_at_depth']
 
     def get_time_pre_depth(self, at_depth_threshold=0.15):
         """
@@ -160,19 +126,7 @@ class DeepDive:
             depth
         :return: the duration before depth in seconds
         """
-        time = 0
-        dive = self.data.copy(deep=True)
-        dive['time_diff'] = dive.time.diff()
-        at_depth_data = dive[
-            dive.depth > (dive.depth.max() - (
-                (dive.depth.max() - dive.depth.min()) * at_depth_threshold)
-            )
-        ].tail(-1)
-        time_data = dive[dive.time < at_depth_data.time.min()]
-        if len(time_data) != 0:
-            time = time_data.time_diff.sum()
-        del dive
-        return time
+        return self._statistics(at_depth_threshold)['td_time_pre_depth']
 
     def get_time_post_depth(self, at_depth_threshold=0.15):
         """
@@ -181,73 +135,53 @@ class DeepDive:
             depth
         :return: the duration after depth in seconds
         """
-        time = 0
-        dive = self.data.copy(deep=True)
-        dive['time_diff'] = dive.time.diff()
-        at_depth_data = dive[
-            dive.depth > (dive.depth.max() - (
-                (dive.depth.max() - dive.depth.min()) * at_depth_threshold)
-            )
-        ].tail(-1)
-        time_data = dive[dive.time > at_depth_data.time.max()]
-        if len(time_data) != 0:
-            time = time_data.time_diff.sum()
-        del dive
-        return time
+        return self._statistics(at_depth_threshold)['td_time_post_depth']
 
     def get_descent_vertical_distance(self):
         """
         :return: the total vertical distance travelled upwards in meters
         """
-        dive = self.data.copy(deep=True)
-        dive['depth_diff'] = dive.depth.diff()
-        distance = np.absolute(dive[(dive.depth_diff > 0)].depth_diff.sum())
-        del dive
-        return distance
+        return self._statistics()['total_descent_distance_traveled']
 
     def get_ascent_vertical_distance(self):
         """
         :return: the total vertical distance travelled downwards in meters
         """
-        dive = self.data.copy(deep=True)
-        dive['depth_diff'] = dive.depth.diff()
-        distance = np.absolute(dive[(dive.depth_diff < 0)].depth_diff.sum())
-        del dive
-        return distance
+        return self._statistics()['total_ascent_distance_traveled']
 
     def get_average_ascent_velocity(self):
         """
         :return: the average upwards velocity in m/s
         """
-        dive = self.data.copy(deep=True)
-        dive['velocity'] = dive.depth.diff() / dive.time.diff()
-        velocity = np.absolute(dive[dive.velocity < 0].velocity.mean())
-        del dive
-        return velocity
+        return self._statistics()['average_ascent_velocity']
 
     def get_average_descent_velocity(self):
         """
         :return: the average downwards velocity in m/s
         """
-        dive = self.data.copy(deep=True)
-        dive['velocity'] = dive.depth.diff() / dive.time.diff()
-        velocity = np.absolute(dive[dive.velocity > 0].velocity.mean())
-        del dive
-        return velocity
+        return self._statistics()['average_descent_velocity']
 
     def to_dict(self):
         """
 
         :return: a dictionary of the dive profile
         """
-        dive = copy.deepcopy(self.__dict__)
-        del dive['data']
-        return dive
+        return {k: v for k, v in self.__dict__.items() if k != 'data'}
+
+    def to_profile(self):
+        """
+        :return: a ``DeepDiveProfile`` of the dive that does not keep the data
+        """
+        return DeepDiveProfile(**self.to_dict())
 
     def plot(self):
         """
         :return: a plotly graph showing the phases of the dive
         """
+        import plotly.graph_objs as go
+        import plotly.offline as py
+        from netCDF4 import num2date
+
         # Set the data to plot the segments of the dive
         dive = self.data.copy(deep=True)
         dive['time_diff'] = dive.time.diff()
@@ -291,3 +225,389 @@ class DeepDive:
         plot_data = [pre_depth, post_depth, at_depth]
         fig = go.Figure(data=plot_data, layout=layout)
         return py.iplot(fig)
+
+
+class DeepDiveProfile:
+    """
+    A compact ``DeepDive`` result that only holds the profile attributes, for
+    keeping large numbers of profiled dives in memory. The samples of the dive
+    are not copied, they can be referenced by position in the record the dive
+    was split from and are only sliced out when ``data`` is read.
+
+    :ivar source: the dataframe or ``RecordStore`` of the whole record or
+        ``None``
+    :ivar start: the position of the first sample of the dive in ``source``
+    :ivar stop: the position after the last sample of the dive in ``source``
+    """
+
+    __slots__ = ('max_depth', 'min_depth', 'dive_start', 'dive_end',
+                 'td_total_duration', 'depth_variance',
+                 'average_vertical_velocity', 'average_descent_velocity',
+                 'average_ascent_velocity', 'number_of_descent_transitions',
+                 'number_of_ascent_transitions',
+                 'total_descent_distance_traveled',
+                 'total_ascent_distance_traveled', 'overall_change_in_depth',
+                 'td_time_at_depth', 'td_time_pre_depth', 'td_time_post_depth',
+                 'peaks', 'no_skew', 'right_skew', 'left_skew', 'source',
+                 'start', 'stop')
+
+    _attributes = __slots__[:-3]
+
+    def __init__(self, source=None, start=None, stop=None, **attributes):
+        """
+        :param source: an optional dataframe or ``RecordStore`` of the whole
+            record
+        :param start: the position of the first sample of the dive in
+            ``source``
+        :param stop: the position after the last sample of the dive in
+            ``source``
+        :param attributes: every attribute of the dive, as returned by
+            ``DeepDive.to_dict``
+        """
+        self.source = source
+        self.start = start
+        self.stop = stop
+        for name in self._attributes:
+            setattr(self, name, attributes[name])
+
+    @classmethod
+    def from_arrays(cls, time, depth, at_depth_threshold=0.15):
+        """
+        Profiles a dive straight from NumPy arrays without building a
+        DataFrame.
+
+        :param time: a NumPy array of times in seconds sorted by time
+        :param depth: a NumPy array of depths
+        :param at_depth_threshold: a value from 0 - 1 indicating distance from
+            the bottom of the dive at which the animal is considered to be at
+            depth
+        :return: a ``DeepDiveProfile`` of the dive
+        """
+        return cls(**deepdive_statistics(time, depth, at_depth_threshold))
+
+    @property
+    def data(self):
+        """
+        :return: the samples of the dive sliced from ``source``, or ``None``
+            when the profile does not reference a record
+        """
+        if self.source is None:
+            return None
+        if isinstance(self.source, RecordStore):
+            return self.source.frame(self.start, self.stop)
+        return self.source.iloc[self.start:self.stop]
+
+    def to_dict(self):
+        """
+        :return: a dictionary of the dive profile
+        """
+        return {name: getattr(self, name) for name in self._attributes}
+
+    def __repr__(self):
+        return 'DeepDiveProfile(dive_start={}, max_depth={})'.format(
+            self.dive_start, self.max_depth)
+
+
+class DeepDiveAccumulator:
+    """
+    Builds a ``DeepDive`` profile from samples as they arrive, for example
+    from real-time tag telemetry. Counts, extremes and running sums are
+    updated with every sample so the profile is available at any time
+    without rescanning the dive. The time at, before and after depth depend
+    on the minimum and maximum depth so far, they are looked up with binary
+    searches in the running maximum depths and in the time steps kept sorted
+    by depth. The peaks are found as the samples arrive and only the peaks
+    near new ones are suppressed again, unless peaks of the same height are
+    close enough for the order of ``DeepDive`` to matter.
+
+    :ivar at_depth_threshold: a value from 0 - 1 indicating distance from the
+        bottom of the dive at which the animal is considered to be at depth
+    :ivar count: the number of samples ingested
+    """
+
+    def __init__(self, at_depth_threshold=0.15, capacity=1024):
+        """
+        :param at_depth_threshold: a value from 0 - 1 indicating distance from
+            the bottom of the dive at which the animal is considered to be at
+            depth
+        :param capacity: the number of samples to allocate room for up front
+        """
+        self.at_depth_threshold = at_depth_threshold
+        self.count = 0
+        self._time = np.empty(max(int(capacity), 1), dtype=np.float64)
+        self._depth = np.empty_like(self._time)
+        self._time_diff = np.empty_like(self._time)
+
+        self._max_depth = np.nan
+        self._min_depth = np.nan
+        self._depth_count = 0
+        self._depth_mean = 0.0
+        self._depth_m2 = 0.0
+        self._velocity_sum = 0.0
+        self._velocity_count = 0
+        self._descent_velocity_sum = 0.0
+        self._ascent_velocity_sum = 0.0
+        self._descent_transitions = 0
+        self._ascent_transitions = 0
+        self._descent_distance = 0.0
+        self._ascent_distance = 0.0
+        self._change_in_depth = 0.0
+        self._time_step_sum = 0.0
+        self._time_step_count = 0
+
+        # The running maximum and second largest depth, and the elapsed time
+        self._running_max = np.empty_like(self._time)
+        self._running_second = np.empty_like(self._time)
+        self._elapsed = np.empty_like(self._time)
+        # The samples deeper than every later sample
+        self._last_positions = np.array([], dtype=np.int64)
+        self._last_depths = np.array([])
+        self._depth_steps = _SortedSums()
+        self._detector = PeakDetector(-np.inf)
+        self._peaks = _PeakCounter()
+        self._at_depth = 0
+        self._pre_depth = 0
+        self._post_depth = 0
+        self._peak_thres = None
+
+    def _reserve(self, size):
+        """
+        Grows the sample buffers so they can hold at least ``size`` samples.
+
+        :param size: the number of samples the buffers must hold
+        """
+        capacity = len(self._time)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for name in ('_time', '_depth', '_time_diff', '_running_max',
+                     '_running_second', '_elapsed'):
+            buffer = np.empty(capacity, dtype=np.float64)
+            buffer[:self.count] = getattr(self, name)[:self.count]
+            setattr(self, name, buffer)
+
+    def update(self, time, depth):
+        """
+        Ingests one sample or a batch of samples. Samples must arrive in time
+        order.
+
+        :param time: a time or an array of times in seconds since 1970-01-01
+        :param depth: a depth or an array of depths matching ``time``
+        """
+        time = np.atleast_1d(np.asarray(time, dtype=np.float64))
+        depth = np.atleast_1d(np.asarray(depth, dtype=np.float64))
+        if time.shape != depth.shape or time.ndim != 1:
+            raise ValueError('time and depth must be matching 1-d values')
+        if len(time) == 0:
+            return
+
+        previous_time = self._time[self.count - 1] if self.count else None
+        previous_depth = self._depth[self.count - 1] if self.count else None
+        if np.any(np.diff(time) < 0) or \
+                (previous_time is not None and time[0] < previous_time):
+            raise ValueError('Samples must be added in time order')
+
+        if previous_time is None:
+            time_diff = np.concatenate(([np.nan], np.diff(time)))
+            depth_diff = np.concatenate(([np.nan], np.diff(depth)))
+        else:
+            time_diff = np.diff(time, prepend=previous_time)
+            depth_diff = np.diff(depth, prepend=previous_depth)
+
+        self._reserve(self.count + len(time))
+        start = self.count
+        stop = self.count + len(time)
+        self._time[start:stop] = time
+        self._depth[start:stop] = depth
+        self._time_diff[start:stop] = time_diff
+        self.count = stop
+
+        valid = depth[~np.isnan(depth)]
+        if len(valid):
+            self._max_depth = np.fmax(self._max_depth, valid.max())
+            self._min_depth = np.fmin(self._min_depth, valid.min())
+            # Merge the batch into the running mean and sum of squares
+            batch_mean = valid.mean()
+            batch_m2 = np.sum((valid - batch_mean)**2)
+            total = self._depth_count + len(valid)
+            delta = batch_mean - self._depth_mean
+            self._depth_m2 += batch_m2 + \
+                delta**2 * self._depth_count * len(valid) / total
+            self._depth_mean += delta * len(valid) / total
+            self._depth_count = total
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            velocity = depth_diff / time_diff
+        descending = velocity > 0
+        ascending = velocity < 0
+        moving = ~np.isnan(velocity)
+        self._velocity_sum += np.absolute(velocity[moving]).sum()
+        self._velocity_count += int(moving.sum())
+        self._descent_velocity_sum += velocity[descending].sum()
+        self._ascent_velocity_sum += velocity[ascending].sum()
+        self._descent_transitions += int(descending.sum())
+        self._ascent_transitions += int(ascending.sum())
+        self._descent_distance += depth_diff[depth_diff > 0].sum()
+        self._ascent_distance += depth_diff[depth_diff < 0].sum()
+        self._change_in_depth += np.nansum(depth_diff)
+        steps = ~np.isnan(time_diff)
+        self._time_step_sum += time_diff[steps].sum()
+        self._time_step_count += int(steps.sum())
+
+        self._update_phases(start, stop)
+        self._update_peaks(start, stop)
+
+    def _update_phases(self, start, stop):
+        """
+        Adds the samples in ``[start, stop)`` to the running depths and time
+        steps and updates the time at, before and after depth.
+
+        :param start: the position of the first new sample
+        :param stop: the position after the last new sample
+        """
+        depth = self._depth[start:stop]
+        time_diff = self._time_diff[start:stop]
+        steps = np.where(np.isnan(time_diff), 0.0, time_diff)
+        reached = np.where(np.isnan(depth), -np.inf, depth)
+
+        previous_max = self._running_max[start - 1] if start else -np.inf
+        previous_second = self._running_second[start - 1] if start \
+            else -np.inf
+        running_max = np.maximum.accumulate(
+            np.concatenate(([previous_max], reached)))
+        self._running_max[start:stop] = running_max[1:]
+        self._running_second[start:stop] = np.maximum.accumulate(
+            np.concatenate(([previous_second],
+                            np.minimum(reached, running_max[:-1]))))[1:]
+        self._elapsed[start:stop] = self._elapsed_before(start) + \
+            np.cumsum(steps)
+
+        later = np.append(np.maximum.accumulate(reached[::-1])[::-1][1:],
+                          -np.inf)
+        deepest = np.flatnonzero(reached > later)
+        keep = self._last_depths > reached.max()
+        self._last_positions = np.concatenate(
+            (self._last_positions[keep], deepest + start))
+        self._last_depths = np.concatenate(
+            (self._last_depths[keep], reached[deepest]))
+
+        valid = ~np.isnan(depth)
+        self._depth_steps.add(depth[valid], steps[valid])
+        self._at_depth, self._pre_depth, self._post_depth = \
+            self._phase_durations()
+
+    def _elapsed_before(self, position):
+        """
+        :return: the sum of the time steps before ``position``
+        """
+        return self._elapsed[position - 1] if position else 0.0
+
+    def _phase_durations(self):
+        """
+        :return: the duration at depth, before depth and after depth in
+            seconds for the samples ingested so far
+        """
+        threshold = self._max_depth - (
+            (self._max_depth - self._min_depth) * self.at_depth_threshold)
+        # The first sample deeper than the threshold isn't counted at depth,
+        # so there has to be a second one
+        second = np.searchsorted(self._running_second[:self.count],
+                                 threshold, side='right')
+        if second == self.count:
+            return 0, 0, 0
+        first = np.searchsorted(self._running_max[:self.count], threshold,
+                                side='right')
+        last = self._last_positions[np.searchsorted(
+            -self._last_depths, -threshold, side='left') - 1]
+        time = self._time[:self.count]
+
+        at_depth = self._depth_steps.above(threshold) - (
+            self._elapsed[first] - self._elapsed_before(first))
+        pre_depth = self._elapsed_before(
+            np.searchsorted(time, time[second], side='left'))
+        post_depth = self._elapsed[self.count - 1] - self._elapsed_before(
+            np.searchsorted(time, time[last], side='right'))
+        return at_depth, pre_depth, post_depth
+
+    def _update_peaks(self, start, stop):
+        """
+        Adds the peaks of the samples in ``[start, stop)`` and updates the
+        peak count the same way as ``count_peaks()``.
+
+        :param start: the position of the first new sample
+        :param stop: the position after the last new sample
+        """
+        mean_step = self._mean(self._time_step_sum, self._time_step_count)
+        # A lone sample has no time step to space peaks by
+        min_dist = 3 if np.isnan(mean_step) else max((10 / mean_step), 3)
+        peaks = self._detector.update(self._depth[start:stop] * -1)
+        self._peaks.add(peaks, self._depth[peaks] * -1, min_dist)
+
+        self._peak_thres = None
+        if not np.isnan(mean_step) and not np.isnan(self._max_depth):
+            with np.errstate(invalid='ignore', divide='ignore'):
+                peak_thres = (1 - (self._min_depth / self._max_depth))
+            low = -self._max_depth
+            self._peak_thres = min([0.1, peak_thres]) * (
+                -self._min_depth - low) + low
+
+    def _mean(self, total, count):
+        """
+        :return: ``total / count`` or NaN when nothing was counted
+        """
+        return total / count if count else np.nan
+
+    def to_dict(self):
+        """
+        :return: a dictionary of the dive profile of the samples ingested so
+            far with the same keys as ``DeepDive.to_dict``
+        """
+        if self.count == 0:
+            raise ValueError('No samples have been added')
+        at_depth = self._at_depth
+        peaks = 0
+        if self._peak_thres is not None:
+            peaks = self._peaks.count(self._peak_thres)
+        pre_depth = self._pre_depth
+        post_depth = self._post_depth
+        left_skew = int(pre_depth > post_depth or post_depth > pre_depth)
+        start = self._time[0]
+        end = self._time[self.count - 1]
+        return {
+            'max_depth': self._max_depth,
+            'min_depth': self._min_depth,
+            'dive_start': start,
+            'dive_end': end,
+            'td_total_duration': end - start,
+            'depth_variance': np.sqrt(
+                self._mean(self._depth_m2, self._depth_count)),
+            'average_vertical_velocity': self._mean(
+                self._velocity_sum, self._velocity_count),
+            'average_descent_velocity': np.absolute(
+                self._mean(self._descent_velocity_sum,
+                           self._descent_transitions)),
+            'average_ascent_velocity': np.absolute(
+                self._mean(self._ascent_velocity_sum,
+                           self._ascent_transitions)),
+            'number_of_descent_transitions': self._descent_transitions,
+            'number_of_ascent_transitions': self._ascent_transitions,
+            'total_descent_distance_traveled': np.absolute(
+                self._descent_distance),
+            'total_ascent_distance_traveled': np.absolute(
+                self._ascent_distance),
+            'overall_change_in_depth': self._change_in_depth,
+            'td_time_at_depth': at_depth,
+            'td_time_pre_depth': pre_depth,
+            'td_time_post_depth': post_depth,
+            'peaks': peaks,
+            'no_skew': 1 - left_skew,
+            'right_skew': 0,
+            'left_skew': left_skew
+        }
+
+    def to_profile(self):
+        """
+        :return: a ``DeepDiveProfile`` of the samples ingested so far
+        """
+        return DeepDiveProfile(**self.to_dict())
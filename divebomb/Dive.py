@@ -1,13 +1,12 @@
-import copy
 import sys
 from datetime import datetime, timedelta
 
 import numpy as np
 import pandas as pd
-import peakutils as pk
-import plotly.graph_objs as go
-import plotly.offline as py
-from netCDF4 import Dataset, date2num, num2date
+
+from divebomb.kernels import (dive_statistics, epoch_seconds,
+                              find_bottom_end, find_bottom_start)
+from divebomb.record_store import RecordStore
 
 units = 'seconds since 1970-01-01'
 
@@ -49,7 +48,8 @@ class Dive:
                      'time': 'time'
                  },
                  surface_threshold=0,
-                 at_depth_threshold=0.15):
+                 at_depth_threshold=0.15,
+                 backend='pandas'):
         """
         :param data: the time and depth values for the dive
         :param columns: a dictionary of column mappings for the data
@@ -57,10 +57,15 @@ class Dive:
         :param th_threshold: a value from 0 - 1 indicating distance from
             the bottom of the dive at which the animal is considered to be at
             depth
+        :param backend: either ``pandas`` or ``numpy`` declaring how the dive
+            phases are detected, ``numpy`` gives the same results in a
+            fraction of the time
         """
+        if backend not in ('pandas', 'numpy'):
+            raise ValueError("backend must be either 'pandas' or 'numpy'")
 
         if data[columns['time']].dtypes != np.float64:
-            data.time = date2num(data.time.tolist(), units=units)
+            data.time = epoch_seconds(data.time)
 
         self.data = data.sort_values('time').reset_index(drop=True)
         self.surface_threshold = surface_threshold
@@ -79,9 +84,9 @@ class Dive:
         self.td_total_duration = self.dive_end - self.dive_start
         try:
             self.td_descent_duration = self.get_descent_duration(
-                at_depth_threshold)
+                at_depth_threshold, backend)
             self.td_ascent_duration = self.get_ascent_duration(
-                at_depth_threshold)
+                at_depth_threshold, backend)
             self.td_surface_duration = self.get_surface_duration()
             self.bottom_variance = self.set_bottom_variance()
             self.descent_velocity = self.get_descent_velocity()
@@ -98,13 +103,21 @@ class Dive:
         except:
             self.insufficient_data = True
 
-    def get_descent_duration(self, at_depth_threshold=0.15):
+    def get_descent_duration(self, at_depth_threshold=0.15, backend='pandas'):
         """
         :param at_depth_threshold: a value from 0 - 1 indicating distance from
             the bottom of the dive at which the animal is considered to be at
             depth
+        :param backend: either ``pandas`` or ``numpy``
         :return: the descent duration in seconds
         """
+        if backend == 'numpy':
+            time = self.data.time.values
+            i = find_bottom_start(self.data.depth.values, self.max_depth,
+                                  at_depth_threshold)
+            self.bottom_start = time[i]
+            return time[i] - time[0]
+
         std_dev = 0
         for i, r in self.data.iterrows():
             next_std_dev = np.std(self.data.loc[:i, 'depth'])
@@ -120,15 +133,25 @@ class Dive:
                 std_dev = next_std_dev
         return self.td_descent_duration
 
-    def get_ascent_duration(self, at_depth_threshold=0.15):
+    def get_ascent_duration(self, at_depth_threshold=0.15, backend='pandas'):
         """
         This function also sets the bottom duration.
 
         :param at_depth_threshold: a value from 0 - 1 indicating distance from
             the bottom of the dive at which the animal is considered to be at
             depth
+        :param backend: either ``pandas`` or ``numpy``
         :return: the ascent duration in seconds
         """
+        if backend == 'numpy':
+            time = self.data.time.values
+            i, end_index = find_bottom_end(self.data.depth.values,
+                                           self.max_depth,
+                                           self.surface_threshold,
+                                           at_depth_threshold)
+            self.td_bottom_duration = time[i] - self.bottom_start
+            return time[end_index] - time[i]
+
         end_index = -1
         std_dev = 0
 
@@ -246,6 +269,8 @@ class Dive:
         """
         :return: number of peaks found within a dive
         """
+        import peakutils as pk
+
         self.peaks = 0
         # Get and set the bottom data
         bottom_data = self.data[(self.data.time >= self.bottom_start) & (
@@ -273,15 +298,23 @@ class Dive:
         """
         :return: a dictionary of the dive profile
         """
-        dive = copy.deepcopy(self.__dict__)
-        del dive['data']
-        return dive
+        return {k: v for k, v in self.__dict__.items() if k != 'data'}
+
+    def to_profile(self):
+        """
+        :return: a ``DiveProfile`` of the dive that does not keep the data
+        """
+        return DiveProfile(**self.to_dict())
 
     # Used to plot the dive
     def plot(self):
         """
         :return: a plotly graph showing the phases of the dive
         """
+        import plotly.graph_objs as go
+        import plotly.offline as py
+        from netCDF4 import num2date
+
         # Get and set the descent data
         descent_data = self.data[self.data.time <= self.bottom_start]
         descent = go.Scatter(
@@ -331,3 +364,88 @@ class Dive:
         plot_data = [descent, bottom, ascent, surface]
         fig = go.Figure(data=plot_data, layout=layout)
         return py.iplot(fig)
+
+
+class DiveProfile:
+    """
+    A compact ``Dive`` result that only holds the profile attributes, for
+    keeping large numbers of profiled dives in memory. The samples of the dive
+    are not copied, they can be referenced by position in the record the dive
+    was split from and are only sliced out when ``data`` is read. Attributes
+    that could not be profiled are ``NaN``.
+
+    :ivar source: the dataframe or ``RecordStore`` of the whole record or
+        ``None``
+    :ivar start: the position of the first sample of the dive in ``source``
+    :ivar stop: the position after the last sample of the dive in ``source``
+    """
+
+    __slots__ = ('surface_threshold', 'max_depth', 'dive_start', 'dive_end',
+                 'bottom_start', 'td_bottom_duration', 'bottom_difference',
+                 'td_total_duration', 'td_descent_duration',
+                 'td_ascent_duration', 'td_surface_duration', 'dive_variance',
+                 'bottom_variance', 'descent_velocity', 'ascent_velocity',
+                 'td_dive_duration', 'no_skew', 'right_skew', 'left_skew',
+                 'peaks', 'insufficient_data', 'source', 'start', 'stop')
+
+    _attributes = __slots__[:-3]
+
+    def __init__(self, source=None, start=None, stop=None, **attributes):
+        """
+        :param source: an optional dataframe or ``RecordStore`` of the whole
+            record
+        :param start: the position of the first sample of the dive in
+            ``source``
+        :param stop: the position after the last sample of the dive in
+            ``source``
+        :param attributes: the attributes of the dive, as returned by
+            ``Dive.to_dict``
+        """
+        self.source = source
+        self.start = start
+        self.stop = stop
+        for name in self._attributes:
+            setattr(self, name, attributes.get(name, np.nan))
+
+    @classmethod
+    def from_arrays(cls,
+                    time,
+                    depth,
+                    surface_threshold=0,
+                    at_depth_threshold=0.15):
+        """
+        Profiles a dive straight from NumPy arrays without building a
+        DataFrame.
+
+        :param time: a NumPy array of times in seconds sorted by time
+        :param depth: a NumPy array of depths
+        :param surface_threshold: minmum depth to constitute a dive
+        :param at_depth_threshold: a value from 0 - 1 indicating distance from
+            the bottom of the dive at which the animal is considered to be at
+            depth
+        :return: a ``DiveProfile`` of the dive
+        """
+        return cls(**dive_statistics(time, depth, surface_threshold,
+                                     at_depth_threshold))
+
+    @property
+    def data(self):
+        """
+        :return: the samples of the dive sliced from ``source``, or ``None``
+            when the profile does not reference a record
+        """
+        if self.source is None:
+            return None
+        if isinstance(self.source, RecordStore):
+            return self.source.frame(self.start, self.stop)
+        return self.source.iloc[self.start:self.stop]
+
+    def to_dict(self):
+        """
+        :return: a dictionary of the dive profile
+        """
+        return {name: getattr(self, name) for name in self._attributes}
+
+    def __repr__(self):
+        return 'DiveProfile(dive_start={}, max_depth={})'.format(
+            self.dive_start, self.max_depth)
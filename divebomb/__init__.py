@@ -4,23 +4,24 @@ import math
 import os
 import shutil
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 
-import ipywidgets as widgets
 import numpy as np
 import pandas as pd
-import peakutils as pku
-import plotly.graph_objs as go
-import plotly.offline as py
-import xarray as xr
-from ipywidgets import Layout, fixed, interact, interact_manual, interactive
-from netCDF4 import Dataset, date2num, num2date
-from sklearn.cluster import AgglomerativeClustering
-from sklearn.decomposition import PCA
-from sklearn.mixture import GaussianMixture
-from sklearn.preprocessing import StandardScaler
-
-from divebomb.DeepDive import DeepDive
-from divebomb.Dive import Dive
+
+from divebomb.cache import ProfileCache
+from divebomb.clustering import (DiveClusterModel, _cluster_dataset,
+                                 clustering_methods, select_n_clusters)
+from divebomb.DeepDive import DeepDive, DeepDiveProfile
+from divebomb.Dive import Dive, DiveProfile
+from divebomb.dive_index import DiveIndex
+from divebomb.kernels import (epoch_seconds, find_peaks, local_maxima,
+                              peak_threshold,
+                              profile_deepdive_segments, profile_dive_segments,
+                              refine_dive_starts, select_peaks)
+from divebomb.parquet import export_to_parquet, read_parquet
+from divebomb.record_store import RecordStore
 
 __author__ = "Alex Nunes"
 __credits__ = ["Alex Nunes", "Fran Broell"]
@@ -40,14 +41,17 @@ def display_dive(index,
                  starts,
                  type='dive',
                  surface_threshold=0,
-                 at_depth_threshold=0.15):
+                 at_depth_threshold=0.15,
+                 backend='numpy',
+                 dive_index=None):
     """
     This function just takes the index, the data, and the starts and displays
     the dive using plotly. It is used as a helper method for viewing the dives
     if ``ipython_display`` is ``True`` in ``profile_dives()``.
 
     :param index: the index of the dive profile to plot
-    :param data: the dataframe of the original dive data
+    :param data: the dataframe of the original dive data, or a
+        ``RecordStore``
     :param starts: the dataframe of the dive starts
     :param type: s tring that indicates using either the ``Dive`` or
         ``DeepDive`` class
@@ -55,24 +59,28 @@ def display_dive(index,
         animal length
     :param at_depth_threshold: a value from 0 - 1 indicating distance from the
         bottom of the dive at which the animal is considered to be at depth
+    :param backend: either ``pandas`` or ``numpy`` declaring how the ``Dive``
+        phases are detected
+    :param dive_index: an optional ``DiveIndex`` of ``data`` and ``starts``
+        to take the samples of the dive from
     :return: a dive plot from plotly
     """
 
     index = int(index)
+    if dive_index is None:
+        dive_index = DiveIndex.from_starts(data, starts)
     print("Data Indices - " +
           str(starts.loc[index, 'start_block']) + ":" +
           str(starts.loc[index, 'end_block']))
     if type == 'deepdive':
         dive_profile = DeepDive(
-            data[starts.loc[index, 'start_block']:starts.loc[index,
-                                                             'end_block']],
-            at_depth_threshold=at_depth_threshold)
+            dive_index.frame(index), at_depth_threshold=at_depth_threshold)
     else:
         dive_profile = Dive(
-            data[starts.loc[index, 'start_block']:starts.loc[index,
-                                                             'end_block']],
+            dive_index.frame(index),
             surface_threshold=surface_threshold,
-            at_depth_threshold=at_depth_threshold)
+            at_depth_threshold=at_depth_threshold,
+            backend=backend)
 
     if not dive_profile.insufficient_data:
         return dive_profile.plot()
@@ -83,7 +91,17 @@ def display_dive(index,
         print(dive_profile.to_dict())
 
 
-def cluster_dives(dives, pca_components=8, n_clusters=None, attributes=None):
+def cluster_dives(dives,
+                  pca_components=8,
+                  n_clusters=None,
+                  attributes=None,
+                  n_jobs=1,
+                  executor=None,
+                  subsample=None,
+                  warm_start=False,
+                  early_stopping=None,
+                  clustering='ward',
+                  model=None):
     """
     This function takes advantage of sklearn and reduces the dimensionality
     with Principal Component Analysis, finds the optimal number of n_clusters
@@ -96,130 +114,291 @@ def cluster_dives(dives, pca_components=8, n_clusters=None, attributes=None):
     :param n_clusters: An override for the number of clusters to find when clustering
     :param attributes: A list of variable/columns to use during the process. This can
         be a subset of the columns in the data.
+    :param n_jobs: the number of worker processes fitting the Gaussian Mixed
+        Models when finding the number of clusters, ``-1`` uses every CPU
+    :param executor: an optional ``concurrent.futures.Executor`` to fit the
+        Gaussian Mixed Models on
+    :param subsample: an optional number of dives to fit the Gaussian Mixed
+        Models on instead of every dive
+    :param warm_start: whether to refit the Gaussian Mixed Models fitted on the
+        ``subsample`` on every dive
+    :param early_stopping: an optional number of models without a lower BIC
+        after which the search for the number of clusters stops
+    :param clustering: the method used to group the dives, ``ward`` (the
+        default) for Agglomerative Clustering, or ``minibatch_kmeans``,
+        ``birch``, and ``connectivity_ward`` which scale to more dives
+    :param model: an optional fitted ``DiveClusterModel`` to assign the dives
+        to instead of fitting a new one
 
     :return: the clustered dives, the PCA loadings matrix,
-             and the PCA output matrix
+             and the PCA output matrix. The ``DiveClusterModel`` is in the
+             ``cluster_model`` entry of the clustered dives ``attrs`` and
+             when the number of clusters was found, the table from
+             ``select_n_clusters()`` is in the ``cluster_selection`` entry
 
     """
-    # Subset the data
-
-    dataset = dives.fillna(0).copy(deep=True)
-
-    if 'dive_start' in dataset.columns:
-        dataset.drop('dive_start', axis=1, inplace=True)
+    if clustering not in clustering_methods:
+        raise ValueError("clustering must be 'ward', 'minibatch_kmeans', "
+                         "'birch', or 'connectivity_ward'")
 
-    if 'dive_end' in dataset.columns:
-        dataset.drop('dive_end', axis=1, inplace=True)
-
-    if 'insufficient_data' in dataset.columns:
-        dataset.drop('insufficient_data', axis=1, inplace=True)
-
-    if 'surface_threshold' in dataset.columns:
-        dataset.drop('surface_threshold', axis=1, inplace=True)
-    if attributes is not None:
-        for column in dataset.columns:
-            if column not in attributes:
-                dataset.drop(column, axis=1, inplace=True)
+    # Subset the data
+    if model is not None:
+        attributes = model.attributes
+    dataset = _cluster_dataset(dives, attributes)
 
     cluster_columns = dataset.columns.tolist()
     print("Clustering on " + ', '.join(cluster_columns[:-1]) +
           ' and ' + cluster_columns[-1])
+    X = dataset.values
     try:
-        # Scale all values
-        X = dataset.values
-        sc_X = StandardScaler()
-        X = sc_X.fit_transform(X)
-
-        # Apply principle component analysis
-        if pca_components > len(dataset.columns):
-            print("You can't have more PCA components than attributes, reducing pca_components to " +
-                  str(len(dataset.columns)) + ".")
-            pca_components = len(dataset.columns)
-        pca = PCA(n_components=pca_components)
-        X = pca.fit_transform(X)
-
-        # Get the loadings matrix
-        loadings = pd.DataFrame(pca.components_).T
-        loadings.reset_index(inplace=True)
-        column_heading = ['component']
-        for column in loadings.columns:
-            if column != 'index':
-                column_heading.append('PC_' + str(column))
-        loadings.columns = column_heading
-        loadings['component'] = dataset.columns
-
-        # Get the PCA output matrix
-        pca_output_matrix = pd.DataFrame(X)
-        column_heading = []
-        for column in pca_output_matrix.columns:
-            if column != 'index':
-                column_heading.append('PC_' + str(column))
-        pca_output_matrix.columns = column_heading
-
-        if n_clusters is None:
-                # Find the optimal number of clusters
-            n_components = np.arange(1, 11)
-            models = [
-                GaussianMixture(n, covariance_type='full',
-                                random_state=0).fit(X)
-                for n in n_components
-            ]
-            bics = y = [m.bic(X) for m in models]
-            diffs = np.diff(bics).tolist()
-            n_clusters = (diffs.index(max(diffs[4:])))
+        if model is None:
+            # Apply principle component analysis
+            if pca_components > len(dataset.columns):
+                print("You can't have more PCA components than attributes, reducing pca_components to " +
+                      str(len(dataset.columns)) + ".")
+                pca_components = len(dataset.columns)
+
+            # Scale all values, find the number of clusters, and apply the
+            # clustering
+            model = DiveClusterModel(
+                pca_components=pca_components,
+                n_clusters=n_clusters,
+                attributes=cluster_columns,
+                clustering=clustering).fit(
+                    dataset,
+                    n_jobs=n_jobs,
+                    executor=executor,
+                    subsample=subsample,
+                    warm_start=warm_start,
+                    early_stopping=early_stopping)
+            if model.selection is not None:
+                print(model.selection.to_string(index=False))
+            dataset['cluster'] = model.labels
+        else:
+            dataset['cluster'] = model.predict(dataset)
 
-        # Apply Agglomerative clustering
-        hc = AgglomerativeClustering(
-            n_clusters=n_clusters, affinity='euclidean', linkage='ward')
-        y_hc = hc.fit_predict(X)
-        dataset['cluster'] = y_hc
+        # Get the loadings matrix and the PCA output matrix
+        loadings = model.loadings
+        pca_output_matrix = model.transform(dataset)
 
         clustered_dives = dives.join(dataset[['cluster']])
+        if model.selection is not None:
+            clustered_dives.attrs['cluster_selection'] = model.selection
+        clustered_dives.attrs['cluster_model'] = model
         return clustered_dives, loadings, pca_output_matrix
     except ValueError as e:
         if len(X) < 10:
             sys.exit("It is possible not enough dives were extracted to apply clustering. Try lowering the `dive_detection_sensitivity` value: https://divebomb.readthedocs.io/en/latest/divebomb.html#dive-detection")
 
 
-def export_dives(dives, data, folder, is_surface_events=False):
+def assign_clusters(new_dives, model):
     """
-    This function exports each dive to its own netCDF file grouped by cluster
+    Assigns dives to the clusters of a fitted ``DiveClusterModel`` without
+    refitting the model, for example the dives of a new tag deployment.
 
-    :param dives: a Pandas DataFrame of dive profiles to export
-    :param data: a Pandas dataframe of the original dive data
-    :param folder: a string indicating the parent folder for the files and sub
+    :param new_dives: a pandas DataFrame of dive attributes, such as the
+        dives from ``profile_dives()``
+    :param model: a fitted ``DiveClusterModel`` or the path to one saved with
+        ``DiveClusterModel.save()``
+
+    :return: the dives with a ``cluster`` column
+    """
+    if not isinstance(model, DiveClusterModel):
+        model = DiveClusterModel.load(model)
+    clustered_dives = new_dives.copy()
+    clustered_dives['cluster'] = model.predict(new_dives)
+    return clustered_dives
+
+
+def _write_dive_files(folder,
+                      dive_ids,
+                      attributes,
+                      dive_index,
+                      is_surface_events=False):
+    """
+    Writes a group of dives to their own netCDF files for ``export_dives()``.
+
+    :param folder: a string indicating the parent folder of the cluster
         folders
+    :param dive_ids: the id of each dive
+    :param attributes: a list with a dictionary of the profile of each dive
+    :param dive_index: a ``DiveIndex`` of the samples of the dives
     :param is_surface_events: a boolean indicating if the dive profiles are
         entirely surface events
-
     """
-    for index, dive in dives.iterrows():
-        filename = '%s/cluster_%d/dive_%05d.nc' % (folder, dive.cluster,
-                                                   (index + 1))
+    from netCDF4 import Dataset
+
+    for position, (dive_id, dive) in enumerate(zip(dive_ids, attributes)):
+        filename = '%s/cluster_%d/dive_%05d.nc' % (folder, dive['cluster'],
+                                                   dive_id)
         rootgrp = Dataset(filename, 'w')
-        rootgrp.setncattr('dive_id', index + 1)
+        rootgrp.setncattr('dive_id', dive_id)
         rootgrp.setncattr('is_surface_event', int(is_surface_events))
         rootgrp.setncattr('time_units', units)
-        for key, value in dive.to_dict().items():
+        for key, value in dive.items():
             try:
-                if value.is_integer():
+                if float(value).is_integer():
                     rootgrp.setncattr(key, int(value))
                 else:
                     rootgrp.setncattr(key, value)
-            except TypeError:
+            except (TypeError, ValueError):
                 rootgrp.setncattr(key, str(value))
         rootgrp.createDimension('time', None)
 
-        time = rootgrp.createVariable("time", "f8", ("time", ), zlib=True)
-        time.units = units
-        depth = rootgrp.createVariable("depth", "f8", ("time", ), zlib=True)
+        dive_time = rootgrp.createVariable(
+            "time", "f8", ("time", ), zlib=True)
+        dive_time.units = units
+        dive_depth = rootgrp.createVariable(
+            "depth", "f8", ("time", ), zlib=True)
 
-        time[:] = data[rootgrp.dive_start:rootgrp.dive_end].time.tolist()
-        depth[:] = data[rootgrp.dive_start:rootgrp.dive_end].depth.tolist()
+        dive_time[:] = dive_index.dive_time(position)
+        dive_depth[:] = dive_index.dive_depth(position)
 
         rootgrp.close()
 
 
+def export_dives(dives,
+                 data,
+                 folder,
+                 is_surface_events=False,
+                 n_jobs=1,
+                 executor=None,
+                 chunksize=500,
+                 dive_index=None):
+    """
+    This function exports each dive to its own netCDF file grouped by cluster
+
+    The samples of each dive are found with ``searchsorted`` on the sorted
+    times of ``data``. When ``n_jobs`` is more than 1 or an ``executor`` is
+    given, the dives of each cluster are split into groups of ``chunksize``
+    dives and the groups are written by the workers.
+
+    :param dives: a Pandas DataFrame of dive profiles to export
+    :param data: a Pandas dataframe of the original dive data sorted by time,
+        or a ``RecordStore`` whose path is sent to the workers instead of the
+        samples
+    :param folder: a string indicating the parent folder for the files and sub
+        folders
+    :param is_surface_events: a boolean indicating if the dive profiles are
+        entirely surface events
+    :param n_jobs: the number of worker processes writing files at the same
+        time, ``-1`` uses every CPU, default is 1
+    :param executor: an optional ``concurrent.futures.Executor`` to write the
+        files with instead of a new process pool
+    :param chunksize: the largest number of dives written by one task
+    :param dive_index: an optional ``DiveIndex`` of ``data`` and ``dives``
+        from ``DiveIndex.from_dives()``
+
+    """
+    if dive_index is None:
+        dive_index = DiveIndex.from_dives(data, dives)
+    dive_ids = dives.index.values + 1
+    attributes = dives.to_dict('records')
+
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    if executor is None and n_jobs <= 1:
+        _write_dive_files(folder, dive_ids.tolist(), attributes, dive_index,
+                          is_surface_events)
+        return
+
+    pool = None
+    try:
+        if executor is None:
+            pool = executor = ProcessPoolExecutor(max_workers=n_jobs)
+        futures = []
+        clusters = dives.cluster.values
+        for cluster in pd.unique(clusters):
+            members = np.flatnonzero(clusters == cluster)
+            for chunk in np.array_split(
+                    members, int(np.ceil(len(members) / chunksize))):
+                # Send each task only the samples of its own dives, or the
+                # path of the record when it is memory mapped
+                if dive_index.is_mapped:
+                    samples = dive_index.select(chunk)
+                else:
+                    samples = dive_index.take(chunk)
+                futures.append(
+                    executor.submit(_write_dive_files, folder,
+                                    dive_ids[chunk].tolist(),
+                                    [attributes[i] for i in chunk], samples,
+                                    is_surface_events))
+        for future in futures:
+            future.result()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def export_dive_archive(dives,
+                        data,
+                        filename,
+                        is_surface_events=False,
+                        dive_index=None):
+    """
+    This function exports every dive to a single netCDF file as a contiguous
+    ragged array. The samples of all of the dives are concatenated along the
+    ``sample`` dimension in the order of the dives, and the ``sample_offset``
+    and ``sample_count`` variables give the position of the samples of each
+    dive. Every dive profile attribute is a variable along the ``dive``
+    dimension.
+
+    :param dives: a Pandas DataFrame of dive profiles to export
+    :param data: a Pandas dataframe of the original dive data sorted by time
+    :param filename: the path of the netCDF file
+    :param is_surface_events: a boolean indicating if the dive profiles are
+        entirely surface events
+    :param dive_index: an optional ``DiveIndex`` of ``data`` and ``dives``
+        from ``DiveIndex.from_dives()``
+
+    """
+    from netCDF4 import Dataset
+
+    if dive_index is None:
+        dive_index = DiveIndex.from_dives(data, dives)
+    samples = dive_index.take(np.arange(len(dive_index)))
+
+    rootgrp = Dataset(filename, 'w')
+    rootgrp.setncattr('is_surface_event', int(is_surface_events))
+    rootgrp.setncattr('time_units', units)
+    rootgrp.createDimension('dive', len(dives))
+    rootgrp.createDimension('sample', len(samples.time))
+
+    sample_time = rootgrp.createVariable(
+        'time', 'f8', ('sample', ), zlib=True)
+    sample_time.units = units
+    sample_time[:] = samples.time
+    sample_depth = rootgrp.createVariable(
+        'depth', 'f8', ('sample', ), zlib=True)
+    sample_depth[:] = samples.depth
+
+    dive_id = rootgrp.createVariable('dive_id', 'i8', ('dive', ), zlib=True)
+    dive_id[:] = dives.index.values + 1
+    sample_offset = rootgrp.createVariable(
+        'sample_offset', 'i8', ('dive', ), zlib=True)
+    sample_offset[:] = samples.starts
+    sample_count = rootgrp.createVariable(
+        'sample_count', 'i8', ('dive', ), zlib=True)
+    sample_count.sample_dimension = 'sample'
+    sample_count[:] = samples.counts
+
+    for column in dives.columns:
+        if column in rootgrp.variables:
+            continue
+        values = dives[column].values
+        if values.dtype.kind == 'b':
+            values = values.astype(np.int8)
+        if values.dtype.kind not in 'iuf':
+            continue
+        variable = rootgrp.createVariable(
+            column, values.dtype, ('dive', ), zlib=True)
+        if column in ('dive_start', 'dive_end', 'bottom_start'):
+            variable.units = units
+        variable[:] = values
+
+    rootgrp.close()
+
+
 def export_to_csv(folder, dives, loadings, pca_output_matrix, insufficient_dives=None):
     """
     Will output dive profiles, loadings, PCA Matrix, and inssufficent dive into
@@ -250,7 +429,7 @@ def export_to_csv(folder, dives, loadings, pca_output_matrix, insufficient_dives
     print(f"Files have been exported to {os.getcwd()}/{folder}")
 
 
-def export_to_netcdf(folder, data, dives, loadings, pca_output_matrix, insufficient_dives=None):
+def export_to_netcdf(folder, data, dives, loadings, pca_output_matrix, insufficient_dives=None, model=None, layout='files', n_jobs=1, executor=None):
     """
     Will output dive profiles, loadings, PCA Matrix, and inssufficent dive into
     the indicated folder as netCDF files. Additionally subfolders will be output
@@ -266,23 +445,46 @@ def export_to_netcdf(folder, data, dives, loadings, pca_output_matrix, insuffici
         Analysis results from ``cluster_dives()``
     :param insufficent_dives: a Pandas DataFrame of dives that could not be
         profiled from ``cluster_dives()``
+    :param model: an optional fitted ``DiveClusterModel``, such as the
+        ``cluster_model`` in the ``attrs`` of the dives from
+        ``cluster_dives()``, to save as ``cluster_model.nc``
+    :param layout: ``files`` to write each dive to its own file in a folder
+        per cluster or ``archive`` to write every dive to a single
+        ``dive_archive.nc`` with ``export_dive_archive()``
+    :param n_jobs: the number of worker processes ``export_dives()`` writes
+        the dive files with, default is 1
+    :param executor: an optional ``concurrent.futures.Executor`` for
+        ``export_dives()`` to write the dive files with
     """
+    import xarray as xr
+    from netCDF4 import Dataset
+
+    if layout not in ('files', 'archive'):
+        raise ValueError("layout must be either 'files' or 'archive'")
+
     # Export the dives to netCDF
     if os.path.exists(folder):
         shutil.rmtree(folder)
     os.makedirs(folder)
 
-    for cluster in dives.cluster.unique():
-        os.makedirs(folder + '/cluster_' + str(cluster))
+    if layout == 'files':
+        for cluster in dives.cluster.unique():
+            os.makedirs(folder + '/cluster_' + str(cluster))
 
     # export the dives
-    data.set_index('time', inplace=True, drop=False)
-
     dives.dive_start = dives.dive_start.astype(int)
     dives.dive_end = dives.dive_end.astype(int)
 
-    data.time = data.time.astype(int)
-    export_dives(dives, data, folder)
+    if not isinstance(data, RecordStore):
+        data.time = data.time.astype(int)
+    dive_index = DiveIndex.from_dives(data, dives)
+    if layout == 'archive':
+        export_dive_archive(dives, data,
+                            os.path.join(folder, 'dive_archive.nc'),
+                            dive_index=dive_index)
+    else:
+        export_dives(dives, data, folder, n_jobs=n_jobs, executor=executor,
+                     dive_index=dive_index)
 
     # Export the PCA Matrices
     pca_group = Dataset(folder + '/pca_matrices_data.nc', 'w')
@@ -307,6 +509,10 @@ def export_to_netcdf(folder, data, dives, loadings, pca_output_matrix, insuffici
         pc[column][:] = loadings[column].tolist()
     pca_group.close()
 
+    # Export the clustering model
+    if model is not None:
+        model.save(os.path.join(folder, 'cluster_model.nc'))
+
     # Write an overall summary netcdf
     xarray_data = xr.Dataset(dives)
     if 'bottom_start' in xarray_data.variables:
@@ -344,50 +550,55 @@ def clean_dive_data(data, columns={'depth': 'depth', 'time': 'time'}):
             data.drop(v, axis=1)
     # Convert time to seconds since
     if data[columns['time']].dtypes != np.float64:
-        data[columns['time']] = date2num(
-            pd.to_datetime(data[columns['time']]).tolist(), units=units)
+        data[columns['time']] = epoch_seconds(data[columns['time']])
 
     return data
 
 
-def get_dive_starting_points(data,
-                             dive_detection_sensitivity,
-                             is_surfacing_animal=True,
-                             minimal_time_between_dives=120,
-                             surface_threshold=0,
-                             columns={
-                                 'depth': 'depth',
-                                 'time': 'time'
-                             }):
+def _prepare_dive_data(data, columns):
     """
     :param data: a dataframe needing a time and a depth column
-    :param is_surfacing_animal: a boolean indicating whether it's an animal
-        that is gaurantedd to surface between dives
-    :param dive_detection_sensitivity: a value bteween 0 and 1 indicating the
-        peak detection threshold, the lower the value the deeper the threshold
-    :param minimal_time_between_dives: the minimum time in seconds that needs
-        to occur before there can be a new dive segement
-    :param surface_threshold: the threshold at which is considered surface for
-        surfacing animals, default is 0
     :param columns: column renaming dictionary if needed
-    """
 
+    :return: the cleaned data sorted by time with a ``time_diff`` column
+    """
     # drop all columns in the dataframe that aren't time or depth
     data = clean_dive_data(data, columns=columns)
 
     data = data.sort_values(by=columns['time']).reset_index(drop=True)
     data['time_diff'] = data.time.diff()
+    return data
+
 
+def _default_sensitivity(dive_detection_sensitivity, is_surfacing_animal):
+    """
+    :param dive_detection_sensitivity: a value bteween 0 and 1 or ``None``
+    :param is_surfacing_animal: a boolean indicating whether it's an animal
+        that is gaurantedd to surface between dives
+
+    :return: the sensitivity to use for ``dive_detection_sensitivity``
+    """
     if is_surfacing_animal and dive_detection_sensitivity is None:
-        dive_detection_sensitivity = 0.98
+        return 0.98
     elif dive_detection_sensitivity is None:
-        dive_detection_sensitivity = 0.5
+        return 0.5
+    return dive_detection_sensitivity
 
-    starts = pku.indexes(
-        (data.depth * -1),
-        thres=dive_detection_sensitivity,
-        min_dist=(minimal_time_between_dives / data.time.diff().mean()))
-    starts = np.insert(starts, 0, 0)
+
+def _starts_from_peaks(data, peaks, is_surfacing_animal, surface_threshold):
+    """
+    Splits the data into dive segments at the peaks of the negated depth.
+
+    :param data: the data from ``_prepare_dive_data()``
+    :param peaks: a NumPy array of the positions of the peaks
+    :param is_surfacing_animal: a boolean indicating whether it's an animal
+        that is gaurantedd to surface between dives
+    :param surface_threshold: the threshold at which is considered surface for
+        surfacing animals
+
+    :return: a dataframe of the dive starts
+    """
+    starts = np.insert(peaks, 0, 0)
     starts = data[data.index.isin(starts)]
 
     starts['start_block'] = starts.index
@@ -401,30 +612,14 @@ def get_dive_starting_points(data,
                'end_block'] = starts.end_block - 1
 
     if is_surfacing_animal:
-        starts['new_start'] = None
-        for index, row in starts.iterrows():
-            sub_data = data[starts.loc[index, 'start_block']:starts.loc[index, 'end_block']]
-            starts.loc[index, 'max_depth'] = sub_data.depth.max()
-
-            if sub_data.depth.max() > surface_threshold:
-                start_index = sub_data[sub_data.depth
-                                       > surface_threshold].index[0] - sub_data.index.min()
-                pre_dive_data = sub_data[:start_index].sort_values(
-                    'time', ascending=False)
-                if len(pre_dive_data[pre_dive_data.depth <= 1]) > 1:
-                    starts.loc[index,
-                               'start_block'] = pre_dive_data[pre_dive_data.depth <= 1].index[0]
-                elif not pre_dive_data.empty:
-                    starts.loc[index, 'start_block'] = pre_dive_data.index[0]
-
-            if data.time.diff().mean() >= 10:
-                starts.loc[index, 'new_start'] = sub_data[sub_data.depth >
-                                                          surface_threshold].head(1).index.min() - 1
-
-        starts = starts[(starts.max_depth > surface_threshold)]
-
-        starts.loc[~starts.new_start.isnull(
-        ), 'start_block'] = starts.new_start
+        refined, is_dive = refine_dive_starts(
+            data.depth.values,
+            starts.start_block.values,
+            starts.end_block.values,
+            surface_threshold=surface_threshold,
+            first_below=data.time_diff.mean() >= 10)
+        starts['start_block'] = refined
+        starts = starts[is_dive]
 
         starts = data[data.index.isin(starts.start_block)]
 
@@ -440,6 +635,464 @@ def get_dive_starting_points(data,
     return starts
 
 
+def get_dive_starting_points(data,
+                             dive_detection_sensitivity,
+                             is_surfacing_animal=True,
+                             minimal_time_between_dives=120,
+                             surface_threshold=0,
+                             columns={
+                                 'depth': 'depth',
+                                 'time': 'time'
+                             }):
+    """
+    :param data: a dataframe needing a time and a depth column, or a
+        ``RecordStore`` that is read a chunk at a time with
+        ``divebomb.streaming.compute_dive_starting_points()``
+    :param is_surfacing_animal: a boolean indicating whether it's an animal
+        that is gaurantedd to surface between dives
+    :param dive_detection_sensitivity: a value bteween 0 and 1 indicating the
+        peak detection threshold, the lower the value the deeper the threshold
+    :param minimal_time_between_dives: the minimum time in seconds that needs
+        to occur before there can be a new dive segement
+    :param surface_threshold: the threshold at which is considered surface for
+        surfacing animals, default is 0
+    :param columns: column renaming dictionary if needed
+    """
+    if isinstance(data, RecordStore):
+        from divebomb.streaming import compute_dive_starting_points
+
+        return compute_dive_starting_points(
+            data,
+            dive_detection_sensitivity=dive_detection_sensitivity,
+            is_surfacing_animal=is_surfacing_animal,
+            minimal_time_between_dives=minimal_time_between_dives,
+            surface_threshold=surface_threshold)
+
+    data = _prepare_dive_data(data, columns)
+    dive_detection_sensitivity = _default_sensitivity(
+        dive_detection_sensitivity, is_surfacing_animal)
+
+    starts = find_peaks(
+        (data.depth.values * -1),
+        thres=dive_detection_sensitivity,
+        min_dist=(minimal_time_between_dives / data.time.diff().mean()))
+    return _starts_from_peaks(data, starts, is_surfacing_animal,
+                              surface_threshold)
+
+
+def sweep_dive_detection(data,
+                         sensitivities,
+                         min_gaps,
+                         is_surfacing_animal=True,
+                         surface_threshold=0,
+                         at_depth_threshold=0.15,
+                         columns={
+                             'depth': 'depth',
+                             'time': 'time'
+                         },
+                         n_jobs=1,
+                         executor=None):
+    """
+    Runs ``get_dive_starting_points()`` and profiles the dives for every
+    combination of ``dive_detection_sensitivity`` and
+    ``minimal_time_between_dives`` to help choose them for a species.
+
+    The data is cleaned and sorted once and every candidate peak is found
+    once, then each combination only applies its threshold and minimum
+    distance to the candidates. Dive segments that are the same in several
+    combinations are profiled once.
+
+    :param data: a dataframe needing a time and a depth column
+    :param sensitivities: a list of ``dive_detection_sensitivity`` values,
+        ``None`` uses the default of ``get_dive_starting_points()``
+    :param min_gaps: a list of ``minimal_time_between_dives`` values in
+        seconds
+    :param is_surfacing_animal: a boolean indicating whether it's an animal
+        that is gaurantedd to surface between dives
+    :param surface_threshold: the threshold at which is considered surface for
+        surfacing animals, default is 0
+    :param at_depth_threshold: a value from 0 - 1 indicating distance from the
+        bottom of the dive at which the animal is considered to be at depth
+    :param columns: column renaming dictionary if needed
+    :param n_jobs: the number of worker processes used to profile the dives,
+        ``-1`` uses every CPU, default is 1
+    :param executor: an optional ``concurrent.futures.Executor`` used to
+        profile the dives
+
+    :return: a dataframe with a row per combination of the number of dives,
+        the median ``td_total_duration`` of the dives, and the number of
+        insufficient dives
+    """
+    data = _prepare_dive_data(data.copy(deep=True), columns)
+    y = data.depth.values * -1
+    candidates, heights = local_maxima(y)
+    mean_step = data.time.diff().mean()
+
+    combinations = []
+    for sensitivity in sensitivities:
+        for min_gap in min_gaps:
+            if np.isnan(y).all():
+                peaks = np.array([], dtype=np.int64)
+            else:
+                thres = peak_threshold(
+                    np.nanmin(y), np.nanmax(y),
+                    _default_sensitivity(sensitivity, is_surfacing_animal))
+                peaks = select_peaks(candidates, heights, thres,
+                                     min_gap / mean_step)
+            starts = _starts_from_peaks(data, peaks, is_surfacing_animal,
+                                        surface_threshold)
+            combinations.append((sensitivity, min_gap, starts))
+
+    # Profile every distinct segment once
+    segments = pd.concat(
+        [starts[['start_block', 'end_block']]
+         for sensitivity, min_gap, starts in combinations],
+        ignore_index=True).drop_duplicates().reset_index(drop=True)
+    profiles = profile_dives_batch(
+        data,
+        segments,
+        is_surfacing_animal=is_surfacing_animal,
+        surface_threshold=surface_threshold,
+        at_depth_threshold=at_depth_threshold,
+        n_jobs=n_jobs,
+        executor=executor)
+    profiles.index = pd.MultiIndex.from_frame(segments)
+
+    rows = []
+    for sensitivity, min_gap, starts in combinations:
+        dives = profiles.iloc[profiles.index.get_indexer(
+            pd.MultiIndex.from_frame(starts[['start_block', 'end_block']]))]
+        if 'insufficient_data' in dives.columns:
+            insufficient = dives.insufficient_data.values.astype(bool)
+        else:
+            insufficient = np.zeros(len(dives), dtype=bool)
+        rows.append({
+            'dive_detection_sensitivity': sensitivity,
+            'minimal_time_between_dives': min_gap,
+            'dives': int((~insufficient).sum()),
+            'median_duration': dives.td_total_duration[~insufficient].median(),
+            'insufficient_dives': int(insufficient.sum())
+        })
+    return pd.DataFrame(rows)
+
+
+def _profile_segments(time,
+                      depth,
+                      start_blocks,
+                      end_blocks,
+                      is_surfacing_animal,
+                      surface_threshold,
+                      at_depth_threshold):
+    """
+    :param time: a NumPy array of times in seconds sorted by time
+    :param depth: a NumPy array of depths
+    :param start_blocks: a NumPy array of the first position of each dive
+    :param end_blocks: a NumPy array of the position after the last position
+        of each dive
+    :param is_surfacing_animal: a boolean indicating whether to profile the
+        dives as a ``Dive`` or a ``DeepDive``
+    :param surface_threshold: the threshold at which is considered surface
+    :param at_depth_threshold: a value from 0 - 1 indicating distance from the
+        bottom of the dive at which the animal is considered to be at depth
+
+    :return: a dictionary of attribute arrays with one value per dive
+    """
+    if is_surfacing_animal:
+        return profile_dive_segments(
+            time,
+            depth,
+            start_blocks,
+            end_blocks,
+            surface_threshold=surface_threshold,
+            at_depth_threshold=at_depth_threshold)
+    return profile_deepdive_segments(
+        time,
+        depth,
+        start_blocks,
+        end_blocks,
+        at_depth_threshold=at_depth_threshold)
+
+
+def _profile_chunk(name,
+                   length,
+                   start_blocks,
+                   end_blocks,
+                   is_surfacing_animal,
+                   surface_threshold,
+                   at_depth_threshold):
+    """
+    Profiles a contiguous chunk of dives from a record held in shared memory.
+    This is the function run by each worker in ``profile_dives_batch()``.
+
+    :param name: the name of the shared memory block holding the time and
+        depth arrays
+    :param length: the number of samples in the record
+    :param start_blocks: a NumPy array of the first position of each dive
+    :param end_blocks: a NumPy array of the position after the last position
+        of each dive
+    :param is_surfacing_animal: a boolean indicating whether to profile the
+        dives as a ``Dive`` or a ``DeepDive``
+    :param surface_threshold: the threshold at which is considered surface
+    :param at_depth_threshold: a value from 0 - 1 indicating distance from the
+        bottom of the dive at which the animal is considered to be at depth
+
+    :return: a dictionary of attribute arrays with one value per dive
+    """
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        record = np.ndarray((2, length), dtype=np.float64, buffer=block.buf)
+        attributes = _profile_segments(record[0], record[1], start_blocks,
+                                       end_blocks, is_surfacing_animal,
+                                       surface_threshold, at_depth_threshold)
+        del record
+    finally:
+        block.close()
+    return attributes
+
+
+def _profile_index_chunk(dive_index, is_surfacing_animal, surface_threshold,
+                         at_depth_threshold):
+    """
+    Profiles the dives of a ``DiveIndex`` of a memory mapped record. This is
+    the function run by each worker in ``profile_dives_batch()`` when the
+    record is a ``RecordStore``.
+
+    :param dive_index: a ``DiveIndex`` of the dives to profile
+    :param is_surfacing_animal: a boolean indicating whether to profile the
+        dives as a ``Dive`` or a ``DeepDive``
+    :param surface_threshold: the threshold at which is considered surface
+    :param at_depth_threshold: a value from 0 - 1 indicating distance from the
+        bottom of the dive at which the animal is considered to be at depth
+
+    :return: a dictionary of attribute arrays with one value per dive
+    """
+    return _profile_segments(dive_index.time, dive_index.depth,
+                             dive_index.starts, dive_index.stops,
+                             is_surfacing_animal, surface_threshold,
+                             at_depth_threshold)
+
+
+def _profile_with_cache(dive_index,
+                        cache,
+                        is_surfacing_animal,
+                        surface_threshold,
+                        at_depth_threshold,
+                        n_jobs,
+                        executor):
+    """
+    Looks up every dive of ``dive_index`` in ``cache`` and profiles the
+    missing dives with ``profile_dives_batch()``.
+
+    :param dive_index: a ``DiveIndex`` of the dives to profile
+    :param cache: a ``ProfileCache``
+    :param is_surfacing_animal: a boolean indicating whether to profile the
+        dives as a ``Dive`` or a ``DeepDive``
+    :param surface_threshold: the threshold at which is considered surface
+    :param at_depth_threshold: a value from 0 - 1 indicating distance from the
+        bottom of the dive at which the animal is considered to be at depth
+    :param n_jobs: the number of worker processes for the missing dives
+    :param executor: an optional ``concurrent.futures.Executor`` for the
+        missing dives
+
+    :return: a dataframe of the dive profiles
+    """
+    parameters = {
+        'is_surfacing_animal': bool(is_surfacing_animal),
+        'surface_threshold': float(surface_threshold),
+        'at_depth_threshold': float(at_depth_threshold)
+    }
+    keys = [
+        cache.key(dive_index.dive_time(i), dive_index.dive_depth(i),
+                  parameters) for i in range(len(dive_index))
+    ]
+    profiles = cache.get_many(keys)
+    missing = [i for i, key in enumerate(keys) if key not in profiles]
+    if missing:
+        profiled = profile_dives_batch(
+            None,
+            None,
+            is_surfacing_animal=is_surfacing_animal,
+            surface_threshold=surface_threshold,
+            at_depth_threshold=at_depth_threshold,
+            n_jobs=n_jobs,
+            executor=executor,
+            dive_index=dive_index.take(missing)).to_dict('records')
+        new_profiles = {keys[i]: row for i, row in zip(missing, profiled)}
+        cache.put_many(new_profiles.items())
+        profiles.update(new_profiles)
+    return pd.DataFrame.from_records([profiles[key] for key in keys])
+
+
+def profile_dives_batch(data,
+                        starts,
+                        is_surfacing_animal=True,
+                        surface_threshold=0,
+                        at_depth_threshold=0.15,
+                        n_jobs=1,
+                        executor=None,
+                        dive_index=None,
+                        cache=None):
+    """
+    Profiles every dive in ``starts`` in one pass over the time and depth
+    arrays instead of building a ``Dive`` or ``DeepDive`` object per dive. The
+    attributes are the same as the ``to_dict()`` output of those classes.
+
+    When ``n_jobs`` is more than 1 or an ``executor`` is given, the time and
+    depth arrays are copied once into shared memory and contiguous chunks of
+    ``starts`` are profiled by the workers. The record of a ``RecordStore`` is
+    not copied, the workers map its file instead. The chunks are put back
+    together in the order of ``starts`` so the result is the same as a single
+    process.
+
+    :param data: a dataframe with a time (in seconds) and a depth column,
+        sorted by time
+    :param starts: a dataframe of dive starts with a ``start_block`` and an
+        ``end_block`` column, usually from ``get_dive_starting_points()``
+    :param is_surfacing_animal: a boolean indicating whether to profile the
+        dives as a ``Dive`` or a ``DeepDive``
+    :param surface_threshold: the threshold at which is considered surface for
+        surfacing animals, default is 0
+    :param at_depth_threshold: a value from 0 - 1 indicating distance from the
+        bottom of the dive at which the animal is considered to be at depth
+    :param n_jobs: the number of worker processes, ``-1`` uses every CPU,
+        default is 1
+    :param executor: an optional ``concurrent.futures.Executor`` to run the
+        chunks on instead of a new process pool
+    :param dive_index: an optional ``DiveIndex`` of ``data`` and ``starts``
+        from ``DiveIndex.from_starts()``
+    :param cache: an optional ``ProfileCache`` to reuse the profiles of dives
+        with the same samples and parameters from, only the other dives are
+        profiled and added to it
+
+    :return: a dataframe of the dive profiles
+    """
+    if dive_index is None:
+        dive_index = DiveIndex.from_starts(data, starts)
+    if cache is not None and len(dive_index) > 0:
+        return _profile_with_cache(dive_index, cache, is_surfacing_animal,
+                                   surface_threshold, at_depth_threshold,
+                                   n_jobs, executor)
+    time = dive_index.time
+    depth = dive_index.depth
+    start_blocks = dive_index.starts
+    end_blocks = dive_index.stops
+
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+
+    if (executor is None and n_jobs <= 1) or len(dive_index) < 2:
+        return pd.DataFrame(
+            _profile_segments(time, depth, start_blocks, end_blocks,
+                              is_surfacing_animal, surface_threshold,
+                              at_depth_threshold))
+
+    if dive_index.is_mapped:
+        # The workers map the file of the record instead of shared memory
+        pool = None
+        try:
+            if executor is None:
+                pool = executor = ProcessPoolExecutor(max_workers=n_jobs)
+            chunks = np.array_split(np.arange(len(dive_index)),
+                                    min(len(dive_index), max(n_jobs, 1) * 4))
+            futures = [
+                executor.submit(_profile_index_chunk,
+                                dive_index.select(chunk), is_surfacing_animal,
+                                surface_threshold, at_depth_threshold)
+                for chunk in chunks
+            ]
+            results = [future.result() for future in futures]
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return pd.DataFrame({
+            key: np.concatenate([result[key] for result in results])
+            for key in results[0]
+        })
+
+    block = shared_memory.SharedMemory(create=True,
+                                       size=max(time.nbytes * 2, 1))
+    pool = None
+    try:
+        record = np.ndarray((2, len(time)), dtype=np.float64,
+                            buffer=block.buf)
+        record[0] = time
+        record[1] = depth
+        del record
+
+        if executor is None:
+            pool = executor = ProcessPoolExecutor(max_workers=n_jobs)
+        chunks = np.array_split(np.arange(len(dive_index)),
+                                min(len(dive_index), max(n_jobs, 1) * 4))
+        futures = [
+            executor.submit(_profile_chunk, block.name, len(time),
+                            start_blocks[chunk], end_blocks[chunk],
+                            is_surfacing_animal, surface_threshold,
+                            at_depth_threshold)
+            for chunk in chunks
+        ]
+        # Collect the chunks in submission order to keep the dive order
+        results = [future.result() for future in futures]
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        block.close()
+        block.unlink()
+
+    return pd.DataFrame({
+        key: np.concatenate([result[key] for result in results])
+        for key in results[0]
+    })
+
+
+def profile_dive_records(data,
+                         starts,
+                         is_surfacing_animal=True,
+                         surface_threshold=0,
+                         at_depth_threshold=0.15,
+                         n_jobs=1,
+                         executor=None):
+    """
+    Profiles every dive in ``starts`` with ``profile_dives_batch()`` and
+    returns a compact record per dive instead of a dataframe. Each record
+    references its samples by position in ``data`` instead of copying them,
+    so the dives can be kept around for review.
+
+    :param data: a dataframe with a time (in seconds) and a depth column,
+        sorted by time
+    :param starts: a dataframe of dive starts with a ``start_block`` and an
+        ``end_block`` column, usually from ``get_dive_starting_points()``
+    :param is_surfacing_animal: a boolean indicating whether to profile the
+        dives as a ``Dive`` or a ``DeepDive``
+    :param surface_threshold: the threshold at which is considered surface for
+        surfacing animals, default is 0
+    :param at_depth_threshold: a value from 0 - 1 indicating distance from the
+        bottom of the dive at which the animal is considered to be at depth
+    :param n_jobs: the number of worker processes, ``-1`` uses every CPU,
+        default is 1
+    :param executor: an optional ``concurrent.futures.Executor`` to run the
+        chunks on instead of a new process pool
+
+    :return: a list of ``DiveProfile`` or ``DeepDiveProfile`` objects
+    """
+    dive_index = DiveIndex.from_starts(data, starts)
+    dives = profile_dives_batch(
+        data,
+        starts,
+        is_surfacing_animal=is_surfacing_animal,
+        surface_threshold=surface_threshold,
+        at_depth_threshold=at_depth_threshold,
+        n_jobs=n_jobs,
+        executor=executor,
+        dive_index=dive_index)
+    record = DiveProfile if is_surfacing_animal else DeepDiveProfile
+    return [
+        record(source=data, start=start, stop=stop, **attributes)
+        for start, stop, attributes in zip(dive_index.starts.tolist(),
+                                           dive_index.stops.tolist(),
+                                           dives.to_dict('records'))
+    ]
+
+
 def profile_dives(data,
                   columns={
                       'depth': 'depth',
@@ -450,13 +1103,18 @@ def profile_dives(data,
                   minimal_time_between_dives=120,
                   surface_threshold=0,
                   ipython_display_mode=False,
-                  at_depth_threshold=0.15):
+                  at_depth_threshold=0.15,
+                  backend='numpy',
+                  n_jobs=1,
+                  executor=None,
+                  cache=None):
     """
     Calls the other functions to split and profile each dive. This function
     uses the ``divebomb.Dive`` or ``divebomb.DeepDive`` class to profile the
     dives.
 
-    :param data: a dataframe needing a time and a depth column
+    :param data: a dataframe needing a time and a depth column, or a
+        ``RecordStore`` that is profiled from its memory map without a copy
     :param columns: column renaming dictionary if needed
     :param is_surfacing_animal: a boolean indicating whether it's an animal
         that is gauranteed to surface between dives
@@ -467,10 +1125,22 @@ def profile_dives(data,
     :param surface_threshold: the threshold at which is considered surface for
         surfacing animals, default is 0
     :param ipython_display_mode: whether or not to display the dives
+    :param at_depth_threshold: a value from 0 - 1 indicating distance from the
+        bottom of the dive at which the animal is considered to be at depth
+    :param backend: either ``pandas`` or ``numpy``, ``numpy`` profiles all of
+        the dives at once with ``profile_dives_batch()`` and ``pandas`` builds
+        a ``Dive`` or ``DeepDive`` for each dive, default is ``numpy``
+    :param n_jobs: the number of worker processes used to profile the dives
+        with the ``numpy`` backend, ``-1`` uses every CPU, default is 1
+    :param executor: an optional ``concurrent.futures.Executor`` used to
+        profile the dives with the ``numpy`` backend
+    :param cache: an optional ``ProfileCache`` of dive profiles from earlier
+        runs, the ``numpy`` backend only profiles the dives that are not in it
 
     :return: two dataframes for the dive profiles, inssufficient dives, and the original data
     """
-    data = data.copy(deep=True)
+    if not isinstance(data, RecordStore):
+        data = data.copy(deep=True)
     starts = get_dive_starting_points(
         data,
         is_surfacing_animal=is_surfacing_animal,
@@ -478,6 +1148,7 @@ def profile_dives(data,
         dive_detection_sensitivity=dive_detection_sensitivity,
         surface_threshold=surface_threshold,
         columns=columns)
+    dive_index = DiveIndex.from_starts(data, starts)
 
     type = 'Dive'
     if not is_surfacing_animal:
@@ -486,6 +1157,10 @@ def profile_dives(data,
     # Use the interact widget to display the dives using a slider to indicate
     # the index.
     if ipython_display_mode:
+        import ipywidgets as widgets
+        import plotly.offline as py
+        from ipywidgets import Layout, fixed, interact
+
         py.init_notebook_mode()
         return interact(
             display_dive,
@@ -499,23 +1174,36 @@ def profile_dives(data,
             starts=fixed(starts),
             type=fixed(type),
             surface_threshold=fixed(surface_threshold),
-            at_depth_threshold=fixed(at_depth_threshold))
+            at_depth_threshold=fixed(at_depth_threshold),
+            backend=fixed(backend),
+            dive_index=fixed(dive_index))
     else:
-        dives = pd.DataFrame()
-        if type == 'DeepDive':
-            for index, row in starts.iterrows():
+        if backend == 'numpy':
+            dives = profile_dives_batch(
+                data,
+                starts,
+                is_surfacing_animal=is_surfacing_animal,
+                surface_threshold=surface_threshold,
+                at_depth_threshold=at_depth_threshold,
+                n_jobs=n_jobs,
+                executor=executor,
+                dive_index=dive_index,
+                cache=cache)
+        elif type == 'DeepDive':
+            dives = pd.DataFrame()
+            for index in range(len(dive_index)):
                 dive_profile = DeepDive(
-                    data[starts.loc[index, 'start_block']:starts.loc[
-                        index, 'end_block']],
+                    dive_index.frame(index),
                     at_depth_threshold=at_depth_threshold)
                 dives = dives.append(dive_profile.to_dict(), ignore_index=True)
         else:
-            for index, row in starts.iterrows():
+            dives = pd.DataFrame()
+            for index in range(len(dive_index)):
                 dive_profile = Dive(
-                    data[starts.loc[index, 'start_block']:starts.loc[
-                        index, 'end_block']],
+                    dive_index.frame(index),
                     surface_threshold=surface_threshold,
-                    at_depth_threshold=at_depth_threshold)
+                    at_depth_threshold=at_depth_threshold,
+                    backend=backend)
                 dives = dives.append(dive_profile.to_dict(), ignore_index=True)
 
         # Pull out insufficient dives
@@ -539,7 +1227,11 @@ def profile_cluster_export(data,
                            dive_detection_sensitivity=None,
                            minimal_time_between_dives=120,
                            surface_threshold=0,
-                           at_depth_threshold=0.15):
+                           at_depth_threshold=0.15,
+                           n_jobs=1,
+                           executor=None,
+                           clustering='ward',
+                           layout='files'):
     """
     Calls `profile_dives`, `cluster_dives`, and `export_to_netcdf`
 
@@ -554,6 +1246,18 @@ def profile_cluster_export(data,
         to occur before there can be a new dive segement
     :param surface_threshold: the threshold at which is considered surface for
         surfacing animals, default is 0
+    :param n_jobs: the number of worker processes used to profile the dives,
+        find the number of clusters and write the dive files, ``-1`` uses
+        every CPU, default is 1
+    :param executor: an optional ``concurrent.futures.Executor`` used to
+        profile the dives, find the number of clusters and write the dive
+        files
+    :param clustering: the method ``cluster_dives()`` uses to group the dives,
+        default is ``ward``
+    :param layout: ``files`` to export each dive to its own netCDF file,
+        ``archive`` to export every dive to a single ``dive_archive.nc``, or
+        ``parquet`` to export the record and dives to Parquet with
+        ``export_to_parquet()``
 
     :return: two dataframes for the dive profiles and the original data
     """
@@ -562,8 +1266,17 @@ def profile_cluster_export(data,
                                                     minimal_time_between_dives=minimal_time_between_dives,
                                                     dive_detection_sensitivity=dive_detection_sensitivity,
                                                     surface_threshold=surface_threshold,
-                                                    columns=columns)
-    dives, loadings, pca_output_matrix = cluster_dives(dives)
-    export_to_netcdf(folder, data, dives, loadings,
-                     pca_output_matrix, insufficient_dives)
+                                                    columns=columns,
+                                                    n_jobs=n_jobs,
+                                                    executor=executor)
+    dives, loadings, pca_output_matrix = cluster_dives(
+        dives, n_jobs=n_jobs, executor=executor, clustering=clustering)
+    if layout == 'parquet':
+        export_to_parquet(folder, data, dives, loadings, pca_output_matrix,
+                          insufficient_dives)
+    else:
+        export_to_netcdf(folder, data, dives, loadings,
+                         pca_output_matrix, insufficient_dives,
+                         model=dives.attrs.get('cluster_model'),
+                         layout=layout, n_jobs=n_jobs, executor=executor)
     return data, dives, loadings, pca_output_matrix, insufficient_dives
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import sqlite3
+from time import time as now
+
+import numpy as np
+
+# Increase when the profiling kernels change so older profiles are not reused
+cache_version = 1
+
+
+class ProfileCache:
+    """
+    An on-disk cache of dive profiles in a SQLite file. Each profile is
+    stored under a hash of the times and depths of the dive and the profiling
+    parameters, so a dive is only profiled again when its samples or the
+    parameters change. Profiles are evicted by age since they were last used
+    and by the total size of the cache, least recently used first.
+
+    :ivar path: the path of the SQLite file
+    :ivar max_size: the largest total size of the stored profiles in bytes,
+        or ``None`` for no limit
+    :ivar max_age: the longest time in seconds a profile is kept without
+        being used, or ``None`` for no limit
+    :ivar hits: the number of profiles found in the cache
+    :ivar misses: the number of profiles not found in the cache
+    :ivar evictions: the number of profiles evicted from the cache
+    """
+
+    def __init__(self, path='divebomb_cache.sqlite', max_size=None,
+                 max_age=None):
+        """
+        :param path: the path of the SQLite file, created if it does not
+            exist
+        :param max_size: the largest total size of the stored profiles in
+            bytes, default is no limit
+        :param max_age: the longest time in seconds a profile is kept without
+            being used, default is no limit
+        """
+        self.path = path
+        self.max_size = max_size
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._connection = sqlite3.connect(path, timeout=60)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS profiles ('
+            'key TEXT PRIMARY KEY, attributes TEXT NOT NULL, '
+            'size INTEGER NOT NULL, accessed REAL NOT NULL)')
+        self._connection.commit()
+
+    @staticmethod
+    def key(time, depth, parameters):
+        """
+        :param time: a NumPy array of the times of a dive
+        :param depth: a NumPy array of the depths of a dive
+        :param parameters: a dictionary of the profiling parameters
+
+        :return: the hexadecimal hash of the dive samples and parameters
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(
+            json.dumps([cache_version, parameters],
+                       sort_keys=True).encode())
+        digest.update(np.ascontiguousarray(time, dtype=np.float64).tobytes())
+        digest.update(np.ascontiguousarray(depth, dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+    def get_many(self, keys):
+        """
+        :param keys: a list of profile keys from ``key()``
+
+        :return: a dictionary of the attributes of every key in the cache
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            rows = self._connection.execute(
+                'SELECT key, attributes FROM profiles WHERE key IN (%s)' %
+                ','.join('?' * len(batch)), batch)
+            found.update((key, json.loads(attributes))
+                         for key, attributes in rows)
+        self._connection.executemany(
+            'UPDATE profiles SET accessed = ? WHERE key = ?',
+            [(now(), key) for key in found])
+        self._connection.commit()
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, profiles):
+        """
+        Stores profiles and then evicts old profiles if the cache is over its
+        limits.
+
+        :param profiles: an iterable of keys and dictionaries of dive
+            attributes
+        """
+        accessed = now()
+        rows = []
+        for key, attributes in profiles:
+            attributes = json.dumps(attributes)
+            rows.append((key, attributes, len(attributes), accessed))
+        self._connection.executemany(
+            'INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?)', rows)
+        self._connection.commit()
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the profiles that were not used within ``max_age`` and then
+        the least recently used profiles until the cache is within
+        ``max_size``.
+
+        :return: the number of profiles removed
+        """
+        removed = 0
+        if self.max_age is not None:
+            removed += self._connection.execute(
+                'DELETE FROM profiles WHERE accessed < ?',
+                (now() - self.max_age, )).rowcount
+        if self.max_size is not None:
+            total = self.size
+            if total > self.max_size:
+                keys = []
+                for key, size in self._connection.execute(
+                        'SELECT key, size FROM profiles ORDER BY accessed'):
+                    if total <= self.max_size:
+                        break
+                    keys.append((key, ))
+                    total -= size
+                self._connection.executemany(
+                    'DELETE FROM profiles WHERE key = ?', keys)
+                removed += len(keys)
+        self._connection.commit()
+        self.evictions += removed
+        return removed
+
+    @property
+    def size(self):
+        """
+        :return: the total size of the stored profiles in bytes
+        """
+        return self._connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM profiles').fetchone()[0]
+
+    def __len__(self):
+        return self._connection.execute(
+            'SELECT COUNT(*) FROM profiles').fetchone()[0]
+
+    def stats(self):
+        """
+        :return: a dictionary of the hits, misses, evictions, number of
+            profiles, and size of the cache
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'profiles': len(self),
+            'size': self.size
+        }
+
+    def clear(self):
+        """
+        Removes every profile from the cache.
+        """
+        self._connection.execute('DELETE FROM profiles')
+        self._connection.commit()
+
+    def close(self):
+        """
+        Closes the SQLite file.
+        """
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,426 @@
+import argparse
+import contextlib
+import glob
+import json
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from divebomb import (ProfileCache, clean_dive_data, cluster_dives,
+                      clustering_methods, export_to_netcdf, export_to_parquet,
+                      profile_dives)
+from divebomb.streaming import iter_record_chunks
+
+input_extensions = ('.csv', '.nc', '.parquet')
+
+
+def find_input_files(sources):
+    """
+    :param sources: a list of directories, files, or glob patterns
+
+    :return: a sorted list of the CSV, netCDF, and Parquet files in
+        ``sources``
+    """
+    files = set()
+    for source in sources:
+        if os.path.isdir(source):
+            matches = [
+                os.path.join(source, name) for name in os.listdir(source)
+            ]
+        else:
+            matches = glob.glob(source)
+        files.update(
+            os.path.abspath(match) for match in matches
+            if os.path.isfile(match) and match.endswith(input_extensions))
+    return sorted(files)
+
+
+def input_root(input_files):
+    """
+    :param input_files: a list of absolute paths of input files
+
+    :return: the deepest folder that holds every input file
+    """
+    if not input_files:
+        return os.getcwd()
+    return os.path.commonpath([os.path.dirname(f) for f in input_files])
+
+
+def output_folder(output, input_file, root=None):
+    """
+    :param output: the folder the results of every input file are written to
+    :param input_file: the path of an input file
+    :param root: the folder the results folders mirror, usually from
+        ``input_root()``, default is the folder of ``input_file``
+
+    :return: the results folder of ``input_file``, its path relative to
+        ``root`` without the extension
+    """
+    if root is None:
+        root = os.path.dirname(os.path.abspath(input_file))
+    return os.path.join(
+        output,
+        os.path.splitext(os.path.relpath(os.path.abspath(input_file),
+                                         root))[0])
+
+
+def output_folders(output, input_files):
+    """
+    :param output: the folder the results of every input file are written to
+    :param input_files: a list of absolute paths of input files
+
+    :return: a dictionary of the results folder of each input file
+    """
+    root = input_root(input_files)
+    folders = {}
+    for input_file in input_files:
+        folder = output_folder(output, input_file, root)
+        if folder in folders.values():
+            other = next(f for f, o in folders.items() if o == folder)
+            raise ValueError(
+                "{} and {} would both write their results to {}, rename one "
+                "of them or process them separately".format(
+                    other, input_file, folder))
+        folders[input_file] = folder
+    return folders
+
+
+def _stamp_path(folder):
+    """
+    :param folder: the results folder of an input file
+
+    :return: the path of the file recording the run that wrote ``folder``
+    """
+    return folder + '.divebomb.json'
+
+
+def is_up_to_date(input_file, folder, parameters):
+    """
+    Checks whether the results of an input file were written by an earlier
+    run with the same parameters after the input file last changed.
+
+    :param input_file: the path of an input file
+    :param folder: the results folder of ``input_file``
+    :param parameters: a dictionary of the run parameters
+
+    :return: a boolean indicating whether the input file can be skipped
+    """
+    stamp = _stamp_path(folder)
+    if not os.path.isdir(folder) or not os.path.exists(stamp):
+        return False
+    with open(stamp) as f:
+        previous = json.load(f)
+    return (previous.get('parameters') == parameters
+            and previous.get('input_mtime') == os.path.getmtime(input_file))
+
+
+def read_input_file(input_file, columns):
+    """
+    :param input_file: the path of a CSV, netCDF, or Parquet file with a time
+        and a depth column
+    :param columns: column renaming dictionary if needed
+
+    :return: a Pandas DataFrame with ``time`` in seconds since 1970-01-01
+        and ``depth``
+    """
+    chunks = list(iter_record_chunks(input_file, columns=columns))
+    return pd.DataFrame({
+        'time': np.concatenate([time for time, depth in chunks]),
+        'depth': np.concatenate([depth for time, depth in chunks])
+    })
+
+
+def process_file(input_file, output, parameters, folder=None):
+    """
+    Runs every stage of ``profile_cluster_export()`` on one input file and
+    times each stage. This is the function run by each worker of ``run()``.
+    The messages of the stages are written to a log file next to the
+    results folder.
+
+    :param input_file: the path of a CSV, netCDF, or Parquet file
+    :param output: the folder the results of every input file are written to
+    :param parameters: a dictionary of the run parameters from
+        ``parse_args()``
+    :param folder: the results folder of ``input_file``, default is from
+        ``output_folder()``
+
+    :return: a dictionary of the manifest entry of the input file
+    """
+    if folder is None:
+        folder = output_folder(output, input_file)
+    os.makedirs(os.path.dirname(folder), exist_ok=True)
+    entry = {
+        'input': input_file,
+        'output': folder,
+        'status': 'completed',
+        'timings': {}
+    }
+    timings = entry['timings']
+    start = perf_counter()
+    with open(folder + '.log', 'w') as log, contextlib.redirect_stdout(log):
+        try:
+            stage = perf_counter()
+            data = read_input_file(input_file, parameters['columns'])
+            timings['read'] = perf_counter() - stage
+
+            stage = perf_counter()
+            data = clean_dive_data(data)
+            data = data.dropna().sort_values('time').reset_index(drop=True)
+            timings['clean'] = perf_counter() - stage
+
+            if parameters['correct_depth_offset']:
+                from divebomb.preprocessing import correct_depth_offset
+
+                stage = perf_counter()
+                offset_data = pd.DataFrame({
+                    'time': pd.to_datetime(data.time, unit='s'),
+                    'depth': data.depth
+                })
+                corrected = correct_depth_offset(
+                    offset_data,
+                    window=parameters['offset_window'],
+                    aux_file=folder + '.offset.nc',
+                    method=parameters['offset_method'],
+                    surface_threshold=parameters['surface_threshold'],
+                    max_gap=parameters['offset_max_gap'])
+                data['depth'] = corrected.depth.values
+                timings['correct_depth_offset'] = perf_counter() - stage
+
+            cache = None
+            if parameters['cache'] is not None:
+                cache = ProfileCache(parameters['cache'])
+
+            stage = perf_counter()
+            dives, insufficient_dives, data = profile_dives(
+                data,
+                is_surfacing_animal=parameters['is_surfacing_animal'],
+                dive_detection_sensitivity=parameters[
+                    'dive_detection_sensitivity'],
+                minimal_time_between_dives=parameters[
+                    'minimal_time_between_dives'],
+                surface_threshold=parameters['surface_threshold'],
+                at_depth_threshold=parameters['at_depth_threshold'],
+                cache=cache)
+            timings['profile'] = perf_counter() - stage
+            if cache is not None:
+                entry['cache'] = {
+                    'hits': cache.hits,
+                    'misses': cache.misses
+                }
+                cache.close()
+            entry['dives'] = len(dives)
+
+            stage = perf_counter()
+            dives, loadings, pca_output_matrix = cluster_dives(
+                dives,
+                n_clusters=parameters['n_clusters'],
+                clustering=parameters['clustering'])
+            timings['cluster'] = perf_counter() - stage
+
+            stage = perf_counter()
+            if parameters['layout'] == 'parquet':
+                export_to_parquet(folder, data, dives, loadings,
+                                  pca_output_matrix, insufficient_dives)
+            else:
+                export_to_netcdf(folder, data, dives, loadings,
+                                 pca_output_matrix, insufficient_dives,
+                                 model=dives.attrs.get('cluster_model'),
+                                 layout=parameters['layout'])
+            timings['export'] = perf_counter() - stage
+        except (Exception, SystemExit) as error:
+            # cluster_dives exits when there are too few dives to cluster
+            entry['status'] = 'failed'
+            entry['error'] = '{}: {}'.format(type(error).__name__, error)
+            traceback.print_exc(file=log)
+    entry['total_seconds'] = perf_counter() - start
+
+    if entry['status'] == 'completed':
+        with open(_stamp_path(folder), 'w') as f:
+            json.dump({
+                'parameters': parameters,
+                'input_mtime': os.path.getmtime(input_file),
+                'timings': timings
+            }, f, indent=2)
+    return entry
+
+
+def run(sources, output, parameters, n_jobs=1, force=False):
+    """
+    Runs ``process_file()`` on every input file in ``sources`` in parallel
+    and writes a ``manifest.json`` of the run to ``output``. The results
+    folders mirror the paths of the input files relative to the folder that
+    holds all of them, and two input files that would share a results folder
+    raise a ``ValueError`` before any file is processed.
+
+    :param sources: a list of directories, files, or glob patterns of CSV,
+        netCDF, and Parquet files
+    :param output: the folder to write the results of every input file to
+    :param parameters: a dictionary of the run parameters
+    :param n_jobs: the number of files processed at the same time, ``-1``
+        uses every CPU, default is 1
+    :param force: a boolean indicating whether to process files that are up
+        to date
+
+    :return: the manifest as a dictionary
+    """
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    os.makedirs(output, exist_ok=True)
+    started = datetime.now()
+    start = perf_counter()
+
+    entries = []
+    pending = []
+    folders = output_folders(output, find_input_files(sources))
+    for input_file, folder in folders.items():
+        if not force and is_up_to_date(input_file, folder, parameters):
+            entries.append({
+                'input': input_file,
+                'output': folder,
+                'status': 'skipped'
+            })
+            print("{}: skipped, up to date".format(input_file))
+        else:
+            pending.append(input_file)
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=max(n_jobs, 1)) as executor:
+            futures = [
+                executor.submit(process_file, input_file, output, parameters,
+                                folders[input_file])
+                for input_file in pending
+            ]
+            for future in as_completed(futures):
+                entry = future.result()
+                entries.append(entry)
+                print("{}: {} ({:.1f}s)".format(entry['input'],
+                                                entry['status'],
+                                                entry['total_seconds']))
+
+    manifest = {
+        'started': started.isoformat(),
+        'total_seconds': perf_counter() - start,
+        'parameters': parameters,
+        'files': sorted(entries, key=lambda entry: entry['input'])
+    }
+    with open(os.path.join(output, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def parse_args(args=None):
+    """
+    :param args: a list of command line arguments, default is ``sys.argv``
+
+    :return: the parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        prog='divebomb',
+        description='Profile, cluster, and export the dives of every CSV, '
+        'netCDF, or Parquet tag file in a folder or glob.')
+    parser.add_argument(
+        'sources',
+        nargs='+',
+        help='folders, files, or glob patterns of CSV, netCDF, and Parquet '
+        'files')
+    parser.add_argument(
+        '-o',
+        '--output',
+        default='results',
+        help='the folder to write a results folder per file to')
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=1,
+        help='the number of files processed at the same time, -1 uses every '
+        'CPU')
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='process files even if their results are up to date')
+    parser.add_argument('--time-column', default='time')
+    parser.add_argument('--depth-column', default='depth')
+    parser.add_argument(
+        '--deep-dives',
+        action='store_true',
+        help='profile the dives as DeepDives for animals that do not surface')
+    parser.add_argument('--dive-detection-sensitivity', type=float)
+    parser.add_argument(
+        '--minimal-time-between-dives', type=float, default=120)
+    parser.add_argument('--surface-threshold', type=float, default=0)
+    parser.add_argument('--at-depth-threshold', type=float, default=0.15)
+    parser.add_argument('--n-clusters', type=int)
+    parser.add_argument(
+        '--clustering', choices=clustering_methods, default='ward')
+    parser.add_argument(
+        '--layout', choices=('files', 'archive', 'parquet'), default='files')
+    parser.add_argument(
+        '--correct-depth-offset',
+        action='store_true',
+        help='correct the depth offset with correct_depth_offset() before '
+        'profiling')
+    parser.add_argument('--offset-window', type=int, default=3600)
+    parser.add_argument(
+        '--offset-method', choices=('max', 'mean', 'rolling'), default='max')
+    parser.add_argument(
+        '--offset-max-gap',
+        type=float,
+        help='the longest gap in seconds before the window of the rolling '
+        'offset method is restarted')
+    parser.add_argument(
+        '--cache',
+        help='a SQLite file of dive profiles to reuse between runs')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    """
+    The entry point of the ``divebomb`` console script.
+
+    :param args: a list of command line arguments, default is ``sys.argv``
+    """
+    args = parse_args(args)
+    parameters = {
+        'columns': {
+            'time': args.time_column,
+            'depth': args.depth_column
+        },
+        'is_surfacing_animal': not args.deep_dives,
+        'dive_detection_sensitivity': args.dive_detection_sensitivity,
+        'minimal_time_between_dives': args.minimal_time_between_dives,
+        'surface_threshold': args.surface_threshold,
+        'at_depth_threshold': args.at_depth_threshold,
+        'n_clusters': args.n_clusters,
+        'clustering': args.clustering,
+        'layout': args.layout,
+        'correct_depth_offset': args.correct_depth_offset,
+        'offset_window': args.offset_window,
+        'offset_method': args.offset_method,
+        'offset_max_gap': args.offset_max_gap,
+        'cache': args.cache
+    }
+    try:
+        manifest = run(args.sources, args.output, parameters,
+                       n_jobs=args.jobs, force=args.force)
+    except ValueError as error:
+        print(error)
+        return 1
+    if not manifest['files']:
+        print("No CSV, netCDF, or Parquet files were found")
+        return 1
+    failed = [entry for entry in manifest['files']
+              if entry['status'] == 'failed']
+    for entry in failed:
+        print("{}: {}".format(entry['input'], entry['error']))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
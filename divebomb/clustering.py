@@ -0,0 +1,610 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+clustering_methods = ('ward', 'minibatch_kmeans', 'birch', 'connectivity_ward')
+
+
+def _cluster_dataset(dives, attributes=None):
+    """
+    :param dives: a pandas DataFrame of dive attributes
+    :param attributes: an optional list of the columns to keep
+
+    :return: the dive attributes used for clustering, without the dive times,
+        ``insufficient_data``, and ``surface_threshold`` and with missing
+        values set to 0
+    """
+    dataset = dives.fillna(0).copy(deep=True)
+
+    if 'dive_start' in dataset.columns:
+        dataset.drop('dive_start', axis=1, inplace=True)
+
+    if 'dive_end' in dataset.columns:
+        dataset.drop('dive_end', axis=1, inplace=True)
+
+    if 'insufficient_data' in dataset.columns:
+        dataset.drop('insufficient_data', axis=1, inplace=True)
+
+    if 'surface_threshold' in dataset.columns:
+        dataset.drop('surface_threshold', axis=1, inplace=True)
+    if attributes is not None:
+        for column in dataset.columns:
+            if column not in attributes:
+                dataset.drop(column, axis=1, inplace=True)
+    return dataset
+
+
+def _loadings_matrix(components, columns):
+    """
+    :param components: the PCA components with one row per component
+    :param columns: the attribute of each column of the components
+
+    :return: the PCA loadings matrix as a dataframe with a ``component``
+        column naming the attribute and a ``PC_`` column per component
+    """
+    loadings = pd.DataFrame(
+        np.asarray(components).T,
+        columns=['PC_' + str(i) for i in range(len(components))])
+    loadings.insert(0, 'component', list(columns))
+    return loadings
+
+
+def _fit_mixture(X, n_clusters, random_state=0, sample=None):
+    """
+    Fits one candidate ``GaussianMixture`` for ``select_n_clusters()``.
+
+    :param X: the matrix to fit and score
+    :param n_clusters: the number of mixture components
+    :param random_state: the random state of the model
+    :param sample: optional rows to fit first, the model is then refitted on
+        ``X`` starting from that fit
+
+    :return: a row of the selection table
+    """
+    from sklearn.mixture import GaussianMixture
+
+    start = perf_counter()
+    model = GaussianMixture(
+        n_clusters, covariance_type='full', random_state=random_state)
+    if sample is not None:
+        model.fit(sample)
+        model = GaussianMixture(
+            n_clusters,
+            covariance_type='full',
+            random_state=random_state,
+            weights_init=model.weights_,
+            means_init=model.means_,
+            precisions_init=model.precisions_)
+    model.fit(X)
+    return {
+        'n_clusters': n_clusters,
+        'bic': model.bic(X),
+        'fit_seconds': perf_counter() - start,
+        'converged': model.converged_,
+        'n_iter': model.n_iter_
+    }
+
+
+def _stratified_sample(X, size, random_state=0, strata=10):
+    """
+    Draws rows from ``X`` in proportion to their share of quantile bins of the
+    first column, so the sample covers the whole range of the first principal
+    component.
+
+    :param X: the matrix to sample
+    :param size: the number of rows to draw
+    :param random_state: the seed of the draw
+    :param strata: the number of quantile bins
+
+    :return: the sampled rows of ``X``
+    """
+    if size >= len(X):
+        return X
+    rng = np.random.RandomState(random_state)
+    ranks = np.argsort(np.argsort(X[:, 0], kind='stable'), kind='stable')
+    # Shuffle within each bin, then take evenly spaced rows across the bins
+    keys = (ranks * strata // len(X)) + rng.random_sample(len(X))
+    order = np.argsort(keys)
+    return X[order[np.linspace(0, len(X) - 1, size).astype(np.int64)]]
+
+
+def select_n_clusters(X,
+                      max_clusters=10,
+                      n_jobs=1,
+                      executor=None,
+                      subsample=None,
+                      warm_start=False,
+                      early_stopping=None,
+                      random_state=0):
+    """
+    Fits a full covariance ``GaussianMixture`` for 1 to ``max_clusters``
+    clusters and picks the number of clusters from the differences in the
+    Bayesian Information Criterion, the same way as ``cluster_dives()``.
+
+    :param X: the PCA output matrix as a NumPy array
+    :param max_clusters: the largest number of clusters to try, at least 6,
+        default is 10
+    :param n_jobs: the number of worker processes fitting candidates at the
+        same time, ``-1`` uses every CPU, default is 1
+    :param executor: an optional ``concurrent.futures.Executor`` to fit the
+        candidates on instead of a new process pool
+    :param subsample: an optional number of dives to fit the candidates on,
+        drawn across the range of the first principal component
+    :param warm_start: whether to refit the candidates fitted on the
+        ``subsample`` on every dive, starting from the subsample fit, so the
+        BIC is computed on every dive
+    :param early_stopping: an optional number of candidates without a new
+        lowest BIC after which no more candidates are fitted, at least 6
+        candidates are always fitted
+    :param random_state: the random state of the models and the subsample
+
+    :return: the number of clusters and a dataframe with the BIC, fit time,
+        convergence and iterations of each candidate
+    """
+    if max_clusters < 6:
+        raise ValueError("max_clusters must be at least 6")
+    X = np.asarray(X)
+    sample = None
+    if subsample is not None:
+        sample = _stratified_sample(X, subsample, random_state)
+        if not warm_start:
+            X, sample = sample, None
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+
+    # Without early stopping every candidate is needed, so all of them are
+    # submitted at once, otherwise they are fitted a wave of n_jobs at a time
+    candidates = list(range(1, max_clusters + 1))
+    wave_size = len(candidates) if early_stopping is None else max(n_jobs, 1)
+
+    rows = []
+    pool = None
+    try:
+        if executor is None and n_jobs > 1:
+            pool = executor = ProcessPoolExecutor(max_workers=n_jobs)
+        for i in range(0, len(candidates), wave_size):
+            wave = candidates[i:i + wave_size]
+            if executor is None:
+                rows.extend(
+                    _fit_mixture(X, n, random_state, sample) for n in wave)
+            else:
+                futures = [
+                    executor.submit(_fit_mixture, X, n, random_state, sample)
+                    for n in wave
+                ]
+                rows.extend(future.result() for future in futures)
+
+            if early_stopping is not None and len(rows) >= 6:
+                bics = [row['bic'] for row in rows]
+                if len(bics) - 1 - int(np.argmin(bics)) >= early_stopping:
+                    break
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    table = pd.DataFrame(rows)
+    diffs = np.diff(table.bic.values).tolist()
+    n_clusters = (diffs.index(max(diffs[4:])))
+    table['selected'] = table.n_clusters == n_clusters
+    return n_clusters, table
+
+
+def _connectivity_graph(X, n_neighbors=10):
+    """
+    Builds a nearest neighbours graph of the dives for connectivity
+    constrained clustering. Separate groups of dives are joined through the
+    minimum spanning tree of one dive from each group, so the clustering does
+    not have to compare every pair of dives in different groups.
+
+    :param X: the PCA output matrix as a NumPy array
+    :param n_neighbors: the number of neighbours each dive is connected to
+
+    :return: a sparse connectivity matrix
+    """
+    from scipy.sparse import csgraph
+    from sklearn.neighbors import kneighbors_graph
+
+    graph = kneighbors_graph(
+        X, n_neighbors=min(n_neighbors, len(X) - 1), include_self=False)
+    n_components, labels = csgraph.connected_components(graph,
+                                                        directed=False)
+    if n_components == 1:
+        return graph
+
+    # Use the dive closest to the middle of each group to join the groups
+    counts = np.bincount(labels)
+    centres = np.zeros((n_components, X.shape[1]))
+    np.add.at(centres, labels, X)
+    centres /= counts[:, None]
+    distance = np.sum((X - centres[labels])**2, axis=1)
+    order = np.lexsort((distance, labels))
+    members = order[np.concatenate(([0], np.cumsum(counts)[:-1]))]
+
+    gaps = np.sqrt(np.sum(
+        (X[members][:, None, :] - X[members][None, :, :])**2, axis=2))
+    tree = csgraph.minimum_spanning_tree(gaps).tocoo()
+    links = graph.tolil()
+    links[members[tree.row], members[tree.col]] = 1
+    return links.tocsr()
+
+
+def _fit_clusters(X, n_clusters, clustering='ward', random_state=0):
+    """
+    Splits the PCA output matrix into clusters with one of the
+    ``cluster_dives()`` clustering methods.
+
+    :param X: the PCA output matrix as a NumPy array
+    :param n_clusters: the number of clusters
+    :param clustering: ``ward`` for Agglomerative Clustering of every dive,
+        ``minibatch_kmeans`` for Mini-Batch K-Means, ``birch`` for BIRCH
+        subclusters (with a radius of 1 in PCA units) joined with
+        Agglomerative Clustering, or
+        ``connectivity_ward`` for Agglomerative Clustering limited to the 10
+        nearest neighbours of each dive
+    :param random_state: the random state of the methods that use one
+
+    :return: a NumPy array with the cluster of each dive
+    """
+    from sklearn.cluster import (AgglomerativeClustering, Birch,
+                                 MiniBatchKMeans)
+
+    if clustering == 'minibatch_kmeans':
+        model = MiniBatchKMeans(
+            n_clusters=n_clusters,
+            batch_size=1024,
+            n_init=3,
+            random_state=random_state)
+    elif clustering == 'birch':
+        model = Birch(
+            threshold=1.0,
+            n_clusters=AgglomerativeClustering(
+                n_clusters=n_clusters, linkage='ward'))
+    elif clustering == 'connectivity_ward':
+        connectivity = _connectivity_graph(X)
+        model = AgglomerativeClustering(
+            n_clusters=n_clusters, connectivity=connectivity, linkage='ward')
+    else:
+        model = AgglomerativeClustering(
+            n_clusters=n_clusters, affinity='euclidean', linkage='ward')
+    return model.fit_predict(X)
+
+
+def _incremental_pca(pca, X):
+    """
+    Copies a fitted ``PCA`` into an ``IncrementalPCA`` so it can keep being
+    updated with ``partial_fit``.
+
+    :param pca: the fitted ``PCA``
+    :param X: the matrix the PCA was fitted on
+    :return: the ``IncrementalPCA``
+    """
+    from sklearn.decomposition import IncrementalPCA
+
+    incremental = IncrementalPCA(n_components=pca.n_components_)
+    incremental.components_ = pca.components_
+    incremental.n_components_ = pca.n_components_
+    incremental.n_features_in_ = pca.n_features_in_
+    incremental.mean_ = pca.mean_
+    incremental.var_ = np.var(X, axis=0)
+    incremental.singular_values_ = pca.singular_values_
+    incremental.explained_variance_ = pca.explained_variance_
+    incremental.explained_variance_ratio_ = pca.explained_variance_ratio_
+    incremental.noise_variance_ = pca.noise_variance_
+    incremental.n_samples_seen_ = len(X)
+    return incremental
+
+
+class DiveClusterModel:
+    """
+    A clustering model of dive profiles that is fitted once, with ``fit()``
+    the same way as ``cluster_dives()``, or one batch of dives at a time, such
+    as one tag deployment at a time, with ``partial_fit()``. Fitted models
+    assign new dives to their clusters with ``predict()`` without refitting
+    and are saved to netCDF. The clusters are kept as centres in the units of
+    the dive attributes, so they stay valid as the scaling and PCA are
+    updated.
+
+    :ivar attributes: the dive attributes the model clusters on
+    :ivar pca_components: the number of PCA components
+    :ivar n_clusters: the number of clusters
+    :ivar clustering: the ``cluster_dives()`` clustering method used to find
+        the clusters in the first batch of dives
+    :ivar scaler: the fitted ``StandardScaler``
+    :ivar pca: the fitted ``IncrementalPCA``
+    :ivar centers: the mean attributes of the dives in each cluster
+    :ivar counts: the number of dives in each cluster
+    :ivar labels: the clusters of the dives in the last fitted batch
+    :ivar selection: the table from ``select_n_clusters()`` when the number
+        of clusters was found by the model
+    """
+
+    def __init__(self,
+                 pca_components=8,
+                 n_clusters=None,
+                 attributes=None,
+                 clustering='ward'):
+        """
+        :param pca_components: the number of components for dimensionality
+            reduction
+        :param n_clusters: an override for the number of clusters, otherwise
+            it is found with ``select_n_clusters()`` on the first batch
+        :param attributes: a list of the dive attributes to cluster on,
+            default is every attribute
+        :param clustering: the ``cluster_dives()`` clustering method used to
+            find the clusters in the first batch of dives
+        """
+        if clustering not in clustering_methods:
+            raise ValueError("clustering must be 'ward', 'minibatch_kmeans', "
+                             "'birch', or 'connectivity_ward'")
+        self.attributes = attributes
+        self.pca_components = pca_components
+        self.n_clusters = n_clusters
+        self.clustering = clustering
+        self.scaler = None
+        self.pca = None
+        self.centers = None
+        self.counts = None
+        self.labels = None
+        self.selection = None
+
+    @property
+    def fitted(self):
+        """
+        :return: whether the model has clusters to assign dives to
+        """
+        return self.centers is not None
+
+    @property
+    def loadings(self):
+        """
+        :return: the PCA loadings matrix, the same as from ``cluster_dives()``
+        """
+        self._check_fitted()
+        return _loadings_matrix(self.pca.components_, self.attributes)
+
+    def _check_fitted(self):
+        if not self.fitted:
+            raise ValueError("The model has not been fitted")
+
+    def _values(self, dives):
+        """
+        :param dives: a pandas DataFrame of dive attributes
+        :return: a NumPy array of the attributes the model clusters on
+        """
+        if self.scaler is None:
+            dataset = _cluster_dataset(dives, self.attributes)
+            self.attributes = dataset.columns.tolist()
+            return dataset.values.astype(np.float64)
+        missing = [a for a in self.attributes if a not in dives.columns]
+        if missing:
+            raise ValueError("The dives are missing the attributes " +
+                             ', '.join(missing))
+        return dives[self.attributes].fillna(0).values.astype(np.float64)
+
+    def _project(self, X):
+        """
+        :param X: a NumPy array of dive attributes
+        :return: the PCA output matrix of ``X``
+        """
+        return self.pca.transform(self.scaler.transform(X))
+
+    def _nearest(self, X):
+        """
+        :param X: a NumPy array of dive attributes
+        :return: the cluster with the closest centre in PCA space for each
+            dive
+        """
+        from sklearn.metrics import pairwise_distances_argmin
+
+        # Distances are computed in chunks of dives from the dot products
+        # instead of an array of every dive and centre difference
+        return pairwise_distances_argmin(self._project(X),
+                                         self._project(self.centers))
+
+    def _set_centers(self, X, labels):
+        """
+        Moves each centre to the mean of every dive assigned to it so far.
+
+        :param X: a NumPy array of dive attributes
+        :param labels: the cluster of each dive in ``X``
+        """
+        counts = np.bincount(labels, minlength=self.n_clusters)
+        sums = np.zeros_like(self.centers)
+        np.add.at(sums, labels, X)
+        self.counts += counts
+        updated = counts > 0
+        self.centers[updated] += (
+            sums[updated] - counts[updated, None] * self.centers[updated]
+        ) / self.counts[updated, None]
+        self.labels = labels
+
+    def fit(self,
+            dives,
+            n_jobs=1,
+            executor=None,
+            subsample=None,
+            warm_start=False,
+            early_stopping=None):
+        """
+        Fits the scaling, PCA, number of clusters, and clusters on every dive
+        at once, the same way as ``cluster_dives()``. The clusters of the
+        dives are in ``labels``.
+
+        :param dives: a pandas DataFrame of dive attributes
+        :param n_jobs: the number of worker processes fitting the Gaussian
+            Mixed Models when finding the number of clusters
+        :param executor: an optional ``concurrent.futures.Executor`` to fit
+            the Gaussian Mixed Models on
+        :param subsample: an optional number of dives to fit the Gaussian
+            Mixed Models on instead of every dive
+        :param warm_start: whether to refit the Gaussian Mixed Models fitted
+            on the ``subsample`` on every dive
+        :param early_stopping: an optional number of models without a lower
+            BIC after which the search for the number of clusters stops
+        :return: the model
+        """
+        from sklearn.decomposition import PCA
+        from sklearn.preprocessing import StandardScaler
+
+        self.scaler = None
+        X = self._values(dives)
+        self.scaler = StandardScaler()
+        scaled = self.scaler.fit_transform(X)
+        pca = PCA(n_components=min(self.pca_components, X.shape[1]))
+        points = pca.fit_transform(scaled)
+        self.pca = _incremental_pca(pca, scaled)
+
+        if self.n_clusters is None:
+            self.n_clusters, self.selection = select_n_clusters(
+                points,
+                n_jobs=n_jobs,
+                executor=executor,
+                subsample=subsample,
+                warm_start=warm_start,
+                early_stopping=early_stopping)
+        labels = _fit_clusters(points, self.n_clusters, self.clustering)
+        self.counts = np.zeros(self.n_clusters)
+        self.centers = np.zeros((self.n_clusters, X.shape[1]))
+        self._set_centers(X, labels)
+        return self
+
+    def partial_fit(self, dives):
+        """
+        Updates the scaling, the PCA, and the cluster centres with a batch of
+        dives. The first batch also finds the clusters, so it should be large
+        enough to contain every kind of dive. Each batch must have at least
+        ``pca_components`` dives.
+
+        :param dives: a pandas DataFrame of dive attributes
+        :return: the model
+        """
+        from sklearn.decomposition import IncrementalPCA
+        from sklearn.preprocessing import StandardScaler
+
+        X = self._values(dives)
+        if self.scaler is None:
+            self.scaler = StandardScaler()
+            self.pca = IncrementalPCA(
+                n_components=min(self.pca_components, X.shape[1]))
+        self.scaler.partial_fit(X)
+        scaled = self.scaler.transform(X)
+        self.pca.partial_fit(scaled)
+
+        if self.centers is None:
+            points = self.pca.transform(scaled)
+            if self.n_clusters is None:
+                self.n_clusters, self.selection = select_n_clusters(points)
+            labels = _fit_clusters(points, self.n_clusters, self.clustering)
+            self.counts = np.zeros(self.n_clusters)
+            self.centers = np.zeros((self.n_clusters, X.shape[1]))
+        else:
+            labels = self._nearest(X)
+        self._set_centers(X, labels)
+        return self
+
+    def transform(self, dives):
+        """
+        :param dives: a pandas DataFrame of dive attributes
+        :return: the PCA output matrix of the dives, the same as from
+            ``cluster_dives()``
+        """
+        self._check_fitted()
+        points = self._project(self._values(dives))
+        return pd.DataFrame(
+            points,
+            columns=['PC_' + str(i) for i in range(points.shape[1])])
+
+    def predict(self, dives):
+        """
+        :param dives: a pandas DataFrame of dive attributes
+        :return: a NumPy array with the cluster of each dive
+        """
+        self._check_fitted()
+        return self._nearest(self._values(dives))
+
+    def save(self, path):
+        """
+        Saves the fitted model to a netCDF file.
+
+        :param path: the path of the netCDF file
+        """
+        import xarray as xr
+
+        self._check_fitted()
+        model = xr.Dataset(
+            {
+                'scaler_mean': ('attribute', self.scaler.mean_),
+                'scaler_var': ('attribute', self.scaler.var_),
+                'scaler_scale': ('attribute', self.scaler.scale_),
+                'pca_components': (('component', 'attribute'),
+                                   self.pca.components_),
+                'pca_mean': ('attribute', self.pca.mean_),
+                'pca_var': ('attribute', self.pca.var_),
+                'pca_singular_values': ('component',
+                                        self.pca.singular_values_),
+                'pca_explained_variance': ('component',
+                                           self.pca.explained_variance_),
+                'pca_explained_variance_ratio': (
+                    'component', self.pca.explained_variance_ratio_),
+                'cluster_centers': (('cluster', 'attribute'), self.centers),
+                'cluster_counts': ('cluster', self.counts)
+            },
+            coords={'attribute': self.attributes})
+        model.attrs['pca_components'] = self.pca_components
+        model.attrs['n_clusters'] = self.n_clusters
+        model.attrs['clustering'] = self.clustering
+        model.attrs['scaler_n_samples_seen'] = int(
+            self.scaler.n_samples_seen_)
+        model.attrs['pca_n_samples_seen'] = int(self.pca.n_samples_seen_)
+        model.attrs['pca_noise_variance'] = float(self.pca.noise_variance_)
+        model.to_netcdf(path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a model saved with ``save()``. The loaded model can keep being
+        updated with ``partial_fit()``.
+
+        :param path: the path of the netCDF file
+        :return: the ``DiveClusterModel``
+        """
+        import xarray as xr
+        from sklearn.decomposition import IncrementalPCA
+        from sklearn.preprocessing import StandardScaler
+
+        with xr.open_dataset(path) as model:
+            model.load()
+        attributes = [str(a) for a in model.attribute.values]
+        cluster_model = cls(
+            pca_components=int(model.attrs['pca_components']),
+            n_clusters=int(model.attrs['n_clusters']),
+            attributes=attributes,
+            clustering=model.attrs['clustering'])
+
+        cluster_model.scaler = StandardScaler()
+        cluster_model.scaler.mean_ = model.scaler_mean.values
+        cluster_model.scaler.var_ = model.scaler_var.values
+        cluster_model.scaler.scale_ = model.scaler_scale.values
+        cluster_model.scaler.n_samples_seen_ = int(model.attrs['scaler_n_samples_seen'])
+        cluster_model.scaler.n_features_in_ = len(attributes)
+
+        components = model.pca_components.values
+        cluster_model.pca = IncrementalPCA(n_components=components.shape[0])
+        cluster_model.pca.components_ = components
+        cluster_model.pca.n_components_ = components.shape[0]
+        cluster_model.pca.n_features_in_ = len(attributes)
+        cluster_model.pca.mean_ = model.pca_mean.values
+        cluster_model.pca.var_ = model.pca_var.values
+        cluster_model.pca.singular_values_ = model.pca_singular_values.values
+        cluster_model.pca.explained_variance_ = model.pca_explained_variance.values
+        cluster_model.pca.explained_variance_ratio_ = \
+            model.pca_explained_variance_ratio.values
+        cluster_model.pca.noise_variance_ = float(model.attrs['pca_noise_variance'])
+        cluster_model.pca.n_samples_seen_ = int(model.attrs['pca_n_samples_seen'])
+
+        cluster_model.centers = model.cluster_centers.values.copy()
+        cluster_model.counts = model.cluster_counts.values.copy()
+        return cluster_model
@@ -0,0 +1,200 @@
+import copy
+import mmap
+
+import numpy as np
+import pandas as pd
+
+from divebomb.kernels import segment_positions
+
+
+class DiveIndex:
+    """
+    The time and depth of a record held once as contiguous float64 arrays,
+    with the position of the first sample and the position after the last
+    sample of each dive. The samples of a dive are views of the record, so the
+    same index can be shared by profiling, exporting, and displaying the dives
+    without slicing the dataframe by time for every dive. The record can also
+    be the memory map of a ``RecordStore``, in which case the index is sent to
+    worker processes as the path of the file instead of a copy of the
+    samples.
+
+    :ivar time: a contiguous float64 NumPy array of the times of the record
+    :ivar depth: a contiguous float64 NumPy array of the depths of the record
+    :ivar record: the ``(2, n)`` array the times and depths are rows of when
+        the index was made with ``from_record()``, otherwise ``None``
+    :ivar starts: a NumPy array of the first position of each dive
+    :ivar stops: a NumPy array of the position after the last position of
+        each dive
+    """
+
+    def __init__(self, time, depth, starts, stops):
+        """
+        :param time: the times of the record in seconds sorted by time, only
+            copied if they aren't a contiguous float64 array already
+        :param depth: the depths of the record, only copied if they aren't a
+            contiguous float64 array already
+        :param starts: the first position of each dive
+        :param stops: the position after the last position of each dive,
+            positions past the end of the record are clipped to it
+        """
+        self.time = np.ascontiguousarray(time, dtype=np.float64)
+        self.depth = np.ascontiguousarray(depth, dtype=np.float64)
+        if len(self.time) != len(self.depth):
+            raise ValueError("The time and the depth must have the same "
+                             "length")
+        self.record = None
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.stops = np.clip(
+            np.asarray(stops, dtype=np.int64), None, len(time))
+
+    @classmethod
+    def from_record(cls, record, starts, stops):
+        """
+        :param record: a ``(2, n)`` float64 array of the times and depths,
+            such as the memory map of a ``RecordStore``, used without a copy
+        :param starts: the first position of each dive
+        :param stops: the position after the last position of each dive
+
+        :return: a ``DiveIndex`` of the dives backed by ``record``
+        """
+        index = cls.__new__(cls)
+        index.record = record
+        index.time = record[0]
+        index.depth = record[1]
+        index.starts = np.asarray(starts, dtype=np.int64)
+        index.stops = np.clip(
+            np.asarray(stops, dtype=np.int64), None, record.shape[1])
+        return index
+
+    @classmethod
+    def from_starts(cls, data, starts):
+        """
+        :param data: a dataframe with a time (in seconds) and a depth column,
+            sorted by time, or a ``RecordStore``
+        :param starts: a dataframe of dive starts with a ``start_block`` and
+            an ``end_block`` column, usually from
+            ``get_dive_starting_points()``
+
+        :return: a ``DiveIndex`` of the dives in ``starts``
+        """
+        if not isinstance(data, pd.DataFrame):
+            return cls.from_record(data.record, starts.start_block.values,
+                                   starts.end_block.values)
+        return cls(data.time.values, data.depth.values,
+                   starts.start_block.values, starts.end_block.values)
+
+    @classmethod
+    def from_dives(cls, data, dives):
+        """
+        Finds the samples of each dive from its ``dive_start`` and
+        ``dive_end`` times with ``searchsorted``, including both ends.
+
+        :param data: a dataframe with a time (in seconds) and a depth column,
+            sorted by time, or a ``RecordStore``
+        :param dives: a dataframe of dive profiles with a ``dive_start`` and
+            a ``dive_end`` column
+
+        :return: a ``DiveIndex`` of the dives in ``dives``
+        """
+        if not isinstance(data, pd.DataFrame):
+            starts = np.searchsorted(data.time, dives.dive_start.values,
+                                     side='left')
+            stops = np.searchsorted(data.time, dives.dive_end.values,
+                                    side='right')
+            return cls.from_record(data.record, starts,
+                                   np.maximum(starts, stops))
+        time = np.asarray(data.time.values, dtype=np.float64)
+        starts = np.searchsorted(time, dives.dive_start.values, side='left')
+        stops = np.searchsorted(time, dives.dive_end.values, side='right')
+        return cls(time, data.depth.values, starts, np.maximum(starts, stops))
+
+    @property
+    def is_mapped(self):
+        """
+        :return: a boolean indicating whether the record is the whole memory
+            map of a file
+        """
+        return isinstance(self.record, np.memmap) and isinstance(
+            self.record.base, mmap.mmap)
+
+    @property
+    def counts(self):
+        """
+        :return: the number of samples of each dive
+        """
+        return np.clip(self.stops - self.starts, 0, None)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def dive_time(self, index):
+        """
+        :param index: the position of the dive in the index
+
+        :return: a view of the times of the dive
+        """
+        return self.time[self.starts[index]:self.stops[index]]
+
+    def dive_depth(self, index):
+        """
+        :param index: the position of the dive in the index
+
+        :return: a view of the depths of the dive
+        """
+        return self.depth[self.starts[index]:self.stops[index]]
+
+    def frame(self, index):
+        """
+        :param index: the position of the dive in the index
+
+        :return: a dataframe of the time and depth of the dive backed by the
+            record instead of a copy
+        """
+        return pd.DataFrame({
+            'time': self.dive_time(index),
+            'depth': self.dive_depth(index)
+        }, copy=False)
+
+    def take(self, dives):
+        """
+        Gathers the samples of some of the dives into a new index where the
+        samples of each dive follow the previous dive, as they are written to
+        a file or sent to another process.
+
+        :param dives: the positions of the dives in the index
+
+        :return: a ``DiveIndex`` of the selected dives
+        """
+        positions, offsets, lengths = segment_positions(
+            self.starts[dives], self.stops[dives])
+        return DiveIndex(self.time[positions], self.depth[positions],
+                         offsets, offsets + lengths)
+
+    def select(self, dives):
+        """
+        :param dives: the positions of the dives in the index
+
+        :return: a ``DiveIndex`` of the selected dives that shares the record
+        """
+        index = copy.copy(self)
+        index.starts = self.starts[dives]
+        index.stops = self.stops[dives]
+        return index
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.is_mapped:
+            # Workers map the same file instead of receiving a copy
+            state['record'] = (self.record.filename, self.record.offset,
+                               self.record.shape)
+            del state['time'], state['depth']
+        return state
+
+    def __setstate__(self, state):
+        if isinstance(state['record'], tuple):
+            filename, offset, shape = state['record']
+            state['record'] = np.memmap(filename, dtype=np.float64, mode='r',
+                                        offset=offset, shape=shape)
+            state['time'] = state['record'][0]
+            state['depth'] = state['record'][1]
+        self.__dict__.update(state)
@@ -0,0 +1,1129 @@
+import heapq
+
+import numpy as np
+import pandas as pd
+
+
+def cumulative_std(values):
+    """
+    Computes the population standard deviation of every prefix of an array in
+    a single pass. ``NaN`` values are skipped the same way pandas skips them.
+
+    :param values: a 1D NumPy array of values
+
+    :return: a NumPy array where element ``i`` is the standard deviation of
+        ``values[:i + 1]``
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return np.full(len(values), np.nan)
+
+    # Shift by the first valid value to limit cancellation in the sums
+    shifted = np.where(valid, values - values[valid][0], 0)
+    count = np.cumsum(valid)
+    total = np.cumsum(shifted)
+    squares = np.cumsum(shifted * shifted)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        variance = (squares - (total * total) / count) / count
+    return np.sqrt(np.clip(variance, 0, None))
+
+
+def _exact_std(values, ddof=0):
+    """
+    :param values: a 1D NumPy array of values
+    :param ddof: the delta degrees of freedom
+
+    :return: the standard deviation of the values computed directly
+    """
+    values = values[~np.isnan(values)]
+    if len(values) <= ddof:
+        return np.nan
+    return np.std(values, ddof=ddof)
+
+
+def _resolve_ties(stds, previous, windows, deciding, tolerance=1e-9):
+    """
+    Recomputes the standard deviations directly wherever the cumulative and
+    previous values are too close to compare reliably, so the comparisons
+    match a direct computation on each window.
+
+    :param stds: the cumulative standard deviations
+    :param previous: the standard deviations each value is compared against
+    :param windows: a function returning the ``(current, previous)`` windows
+        for a position
+    :param deciding: a boolean array of the positions where the comparison
+        decides the result
+    :param tolerance: the relative difference under which a comparison is
+        recomputed
+
+    :return: the corrected ``stds`` and ``previous`` arrays
+    """
+    scale = np.maximum(np.maximum(np.abs(stds), np.abs(previous)), 1e-12)
+    close = np.flatnonzero(
+        deciding & (np.abs(stds - previous) <= scale * tolerance))
+    if len(close) == 0:
+        return stds, previous
+
+    stds = stds.copy()
+    previous = previous.copy()
+    for k in close:
+        current_window, previous_window = windows(k)
+        stds[k] = _exact_std(current_window)
+        previous[k] = _exact_std(previous_window) \
+            if previous_window is not None else 0
+    return stds, previous
+
+
+def find_bottom_start(depth, max_depth, at_depth_threshold=0.15):
+    """
+    Finds the first point of the bottom phase of a dive. A point is the bottom
+    start when it is deeper than the at depth threshold and either the
+    standard deviation of the depth stops increasing or the animal stops
+    descending. The last point is used when no other point qualifies.
+
+    :param depth: a NumPy array of depths sorted by time
+    :param max_depth: the max depth in the dive
+    :param at_depth_threshold: a value from 0 - 1 indicating distance from
+        the bottom of the dive at which the animal is considered to be at
+        depth
+
+    :return: the position of the bottom start in ``depth``
+    """
+    depth = np.asarray(depth, dtype=np.float64)
+    if len(depth) == 0:
+        raise ValueError("There is no data in the dive")
+
+    not_descending = np.zeros(len(depth), dtype=bool)
+    not_descending[:-1] = depth[:-1] >= depth[1:]
+    at_depth = depth > (max_depth * (1 - at_depth_threshold))
+
+    stds = cumulative_std(depth)
+    previous = np.concatenate(([0], stds[:-1]))
+    stds, previous = _resolve_ties(
+        stds, previous,
+        lambda k: (depth[:k + 1], depth[:k] if k > 0 else None),
+        at_depth & ~not_descending)
+
+    is_bottom = ((stds <= previous) | not_descending) & at_depth
+    is_bottom[-1] = True
+    return int(np.argmax(is_bottom))
+
+
+def find_bottom_end(depth,
+                    max_depth,
+                    surface_threshold=0,
+                    at_depth_threshold=0.15):
+    """
+    Finds the last point of the bottom phase of a dive and the crest of the
+    dive where the animal returns to the surface. The dive is walked backwards
+    from the crest until the point is deeper than the at depth threshold and
+    either the standard deviation of the depth stops increasing or the animal
+    stops ascending, or until the point is deeper than 90% of the max depth.
+
+    :param depth: a NumPy array of depths sorted by time
+    :param max_depth: the max depth in the dive
+    :param surface_threshold: the threshold at which is considered surface
+    :param at_depth_threshold: a value from 0 - 1 indicating distance from
+        the bottom of the dive at which the animal is considered to be at
+        depth
+
+    :return: the positions of the bottom end and the crest in ``depth``
+    """
+    depth = np.asarray(depth, dtype=np.float64)
+
+    # Find the crest of the dive
+    below_surface = np.flatnonzero(depth[:-1] > surface_threshold)
+    if len(below_surface) == 0:
+        raise ValueError("The dive never goes below the surface threshold")
+    end_index = int(below_surface[-1]) + 1
+
+    # Walk backwards from the crest, candidates[k] is depth[end_index - 1 - k]
+    reversed_depth = depth[end_index::-1]
+    candidates = reversed_depth[1:]
+    not_ascending = np.zeros(len(candidates), dtype=bool)
+    not_ascending[:-1] = candidates[:-1] >= candidates[1:]
+    at_depth = candidates > (max_depth * (1 - at_depth_threshold))
+    near_max = candidates > (max_depth * 0.90)
+
+    deciding = at_depth & ~not_ascending & ~near_max
+    deciding[-1] = True
+    stds = cumulative_std(reversed_depth)
+    previous = np.concatenate(([0], stds[:-1]))
+    stds, previous = _resolve_ties(
+        stds[1:], previous[1:],
+        lambda k: (reversed_depth[:k + 2], reversed_depth[:k + 1]),
+        deciding)
+
+    decreasing = stds < previous
+    is_bottom = ((decreasing | not_ascending) & at_depth) | near_max
+
+    # The first point of the dive has no previous point to compare against
+    is_bottom[-1] = decreasing[-1] & (at_depth[-1] | near_max[-1])
+    if not is_bottom.any():
+        raise ValueError("The bottom of the dive could not be found")
+    return end_index - 1 - int(np.argmax(is_bottom)), end_index
+
+
+def segment_positions(starts, ends):
+    """
+    Gathers the positions of a set of ``[start, end)`` segments into one
+    array so each segment is contiguous and segments no longer overlap.
+
+    :param starts: a NumPy array of the first position of each segment
+    :param ends: a NumPy array of the position after the last position of each
+        segment
+
+    :return: the gathered positions, the offset of each segment in the
+        gathered positions, and the length of each segment
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    lengths = np.clip(ends - starts, 0, None)
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+    positions = np.arange(lengths.sum(), dtype=np.int64) - \
+        np.repeat(offsets - starts, lengths)
+    return positions, offsets, lengths
+
+
+def segment_reduce(ufunc, values, offsets, lengths, empty=np.nan):
+    """
+    Applies ``ufunc.reduceat`` over contiguous segments of an array.
+
+    :param ufunc: a NumPy ufunc such as ``np.add`` or ``np.fmax``
+    :param values: the gathered values
+    :param offsets: the offset of each segment in ``values``
+    :param lengths: the length of each segment
+    :param empty: the value to use for empty segments
+
+    :return: a NumPy array with one reduced value per segment
+    """
+    values = np.asarray(values, dtype=np.float64)
+    indices = np.append(offsets, len(values))
+    result = ufunc.reduceat(np.append(values, 0), indices)[:-1]
+    result[lengths == 0] = empty
+    return result
+
+
+def segment_count(mask, offsets, lengths):
+    """
+    :param mask: a gathered boolean array
+    :param offsets: the offset of each segment in ``mask``
+    :param lengths: the length of each segment
+
+    :return: the number of ``True`` values in each segment
+    """
+    return segment_reduce(np.add, mask, offsets, lengths,
+                          empty=0).astype(np.int64)
+
+
+def segment_sum(values, mask, offsets, lengths):
+    """
+    :param values: the gathered values
+    :param mask: a gathered boolean array of the values to include
+    :param offsets: the offset of each segment in ``values``
+    :param lengths: the length of each segment
+
+    :return: the sum of the included, non ``NaN`` values in each segment
+    """
+    valid = mask & ~np.isnan(values)
+    return segment_reduce(np.add, np.where(valid, values, 0), offsets,
+                          lengths, empty=0)
+
+
+def segment_mean(values, mask, offsets, lengths):
+    """
+    :param values: the gathered values
+    :param mask: a gathered boolean array of the values to include
+    :param offsets: the offset of each segment in ``values``
+    :param lengths: the length of each segment
+
+    :return: the mean of the included, non ``NaN`` values in each segment
+    """
+    count = segment_count(mask & ~np.isnan(values), offsets, lengths)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return segment_sum(values, mask, offsets, lengths) / count
+
+
+def segment_max(values, mask, offsets, lengths):
+    """
+    :param values: the gathered values
+    :param mask: a gathered boolean array of the values to include
+    :param offsets: the offset of each segment in ``values``
+    :param lengths: the length of each segment
+
+    :return: the max of the included, non ``NaN`` values in each segment
+    """
+    return segment_reduce(np.fmax, np.where(mask, values, np.nan), offsets,
+                          lengths)
+
+
+def segment_min(values, mask, offsets, lengths):
+    """
+    :param values: the gathered values
+    :param mask: a gathered boolean array of the values to include
+    :param offsets: the offset of each segment in ``values``
+    :param lengths: the length of each segment
+
+    :return: the min of the included, non ``NaN`` values in each segment
+    """
+    return segment_reduce(np.fmin, np.where(mask, values, np.nan), offsets,
+                          lengths)
+
+
+def segment_std(values, mask, offsets, lengths, ddof=0):
+    """
+    :param values: the gathered values
+    :param mask: a gathered boolean array of the values to include
+    :param offsets: the offset of each segment in ``values``
+    :param lengths: the length of each segment
+    :param ddof: the delta degrees of freedom
+
+    :return: the standard deviation of the included, non ``NaN`` values in
+        each segment
+    """
+    valid = mask & ~np.isnan(values)
+    count = segment_count(valid, offsets, lengths)
+    mean = segment_mean(values, valid, offsets, lengths)
+    deviation = np.where(valid, values - np.repeat(mean, lengths), 0)
+    squares = segment_reduce(np.add, deviation * deviation, offsets, lengths)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std = np.sqrt(squares / (count - ddof))
+    std[count - ddof <= 0] = np.nan
+    return std
+
+
+def segment_diff(values, offsets, lengths):
+    """
+    :param values: the gathered values
+    :param offsets: the offset of each segment in ``values``
+    :param lengths: the length of each segment
+
+    :return: the difference between consecutive values with ``NaN`` at the
+        first position of each segment
+    """
+    diff = np.empty(len(values))
+    diff[0:1] = np.nan
+    diff[1:] = np.diff(values)
+    diff[offsets[lengths > 0]] = np.nan
+    return diff
+
+
+def epoch_seconds(time):
+    """
+    Converts times to seconds since 1970-01-01 from the int64 nanoseconds of
+    a ``datetime64[ns]`` array instead of a list of datetime objects.
+    Timezone aware times are converted to UTC, naive times are taken as UTC
+    the same as ``netCDF4.date2num``, and times that are already numbers are
+    returned as they are.
+
+    :param time: a Pandas Series, Index, or NumPy array of datetimes, strings,
+        or seconds since 1970-01-01
+
+    :return: a float64 NumPy array of seconds since 1970-01-01, NaN where the
+        time is missing
+    """
+    dtype = getattr(time, 'dtype', None)
+    if dtype is None:
+        time = np.asarray(time)
+        dtype = time.dtype
+    if dtype.kind in 'iuf':
+        return np.asarray(time, dtype=np.float64)
+
+    if isinstance(dtype, pd.DatetimeTZDtype):
+        nanoseconds = pd.DatetimeIndex(time).asi8
+    elif dtype.kind == 'M':
+        nanoseconds = np.asarray(time).astype('datetime64[ns]').view(np.int64)
+    else:
+        nanoseconds = pd.DatetimeIndex(pd.to_datetime(time, utc=True)).asi8
+
+    seconds = nanoseconds / 1e9
+    seconds[nanoseconds == np.iinfo(np.int64).min] = np.nan
+    return seconds
+
+
+def mean_time_step(time):
+    """
+    :param time: a NumPy array of times for a single dive
+
+    :return: the mean difference between consecutive times
+    """
+    diff = np.diff(time)
+    valid = ~np.isnan(diff)
+    if not valid.any():
+        return np.nan
+    return np.where(valid, diff, 0).sum() / valid.sum()
+
+
+def _indexes(y, thres, min_dist):
+    """
+    Calls ``peakutils.indexes`` with the threshold normalized while skipping
+    ``NaN`` values, the same way it is when ``y`` is a pandas Series.
+
+    :param y: a NumPy array to find the peaks in
+    :param thres: the normalized threshold
+    :param min_dist: the minimum distance between peaks
+
+    :return: the positions of the peaks
+    """
+    import peakutils as pk
+
+    low = np.nanmin(y)
+    return pk.indexes(y, thres=thres * (np.nanmax(y) - low) + low,
+                      min_dist=min_dist, thres_abs=True)
+
+
+def count_bottom_peaks(bottom_depth, mean_step, surface_threshold=0):
+    """
+    :param bottom_depth: a NumPy array of depths in the bottom of a dive
+    :param mean_step: the mean time between samples in the dive
+    :param surface_threshold: the threshold at which is considered surface
+
+    :return: number of peaks found within the bottom of a dive
+    """
+    bottom_difference = np.nanmax(bottom_depth) - np.nanmin(bottom_depth)
+    if bottom_difference != 0:
+        threshold = max((_exact_std(bottom_depth, ddof=1) /
+                         bottom_difference), 0.5)
+    else:
+        threshold = 0.5
+    peaks = _indexes(bottom_depth * (-1), threshold,
+                     max((10 / mean_step), 3))
+    return int(np.count_nonzero(bottom_depth[peaks] > surface_threshold))
+
+
+def count_peaks(depth, mean_step):
+    """
+    :param depth: a NumPy array of depths for a single dive
+    :param mean_step: the mean time between samples in the dive
+
+    :return: number of peaks found within a dive
+    """
+    peak_thres = (1 - (np.nanmin(depth) / np.nanmax(depth)))
+    peaks = _indexes(depth * (-1), min([0.1, peak_thres]),
+                     max((10 / mean_step), 3))
+    return len(peaks)
+
+
+def profile_dive_segments(time,
+                          depth,
+                          starts,
+                          ends,
+                          surface_threshold=0,
+                          at_depth_threshold=0.15):
+    """
+    Computes the ``Dive`` attributes for every dive segment of a record. The
+    phase and peak detection run on NumPy views of each dive and every other
+    attribute is computed for all dives at once with segmented reductions.
+
+    :param time: a NumPy array of times in seconds sorted by time
+    :param depth: a NumPy array of depths
+    :param starts: a NumPy array of the first position of each dive
+    :param ends: a NumPy array of the position after the last position of each
+        dive
+    :param surface_threshold: the threshold at which is considered surface
+    :param at_depth_threshold: a value from 0 - 1 indicating distance from
+        the bottom of the dive at which the animal is considered to be at
+        depth
+
+    :return: a dictionary of attribute arrays with one value per dive
+    """
+    time = np.asarray(time, dtype=np.float64)
+    depth = np.asarray(depth, dtype=np.float64)
+    positions, offsets, lengths = segment_positions(starts, ends)
+    n = len(offsets)
+    t = time[positions]
+    d = depth[positions]
+    everything = np.ones(len(positions), dtype=bool)
+
+    max_depth = segment_max(d, everything, offsets, lengths)
+    dive_start = segment_min(t, everything, offsets, lengths)
+    dive_end = segment_max(t, everything, offsets, lengths)
+    td_total_duration = dive_end - dive_start
+    mean_step = segment_mean(segment_diff(t, offsets, lengths), everything,
+                             offsets, lengths)
+
+    # Detect the phases of each dive
+    bottom_start = np.full(n, np.nan)
+    td_descent_duration = np.full(n, np.nan)
+    td_bottom_duration = np.full(n, np.nan)
+    td_ascent_duration = np.full(n, np.nan)
+    for i in range(n):
+        dive_time = t[offsets[i]:offsets[i] + lengths[i]]
+        dive_depth = d[offsets[i]:offsets[i] + lengths[i]]
+        try:
+            start = find_bottom_start(dive_depth, max_depth[i],
+                                      at_depth_threshold)
+            bottom_start[i] = dive_time[start]
+            td_descent_duration[i] = dive_time[start] - dive_time[0]
+            end, crest = find_bottom_end(dive_depth, max_depth[i],
+                                         surface_threshold,
+                                         at_depth_threshold)
+        except ValueError:
+            continue
+        td_bottom_duration[i] = dive_time[end] - bottom_start[i]
+        td_ascent_duration[i] = dive_time[crest] - dive_time[end]
+    profiled = ~np.isnan(td_ascent_duration)
+
+    td_surface_duration = td_total_duration - td_descent_duration - \
+        td_bottom_duration - td_ascent_duration
+    bottom_end = bottom_start + td_bottom_duration
+
+    # Split the samples into phases
+    rep_dive_start = np.repeat(dive_start, lengths)
+    rep_bottom_start = np.repeat(bottom_start, lengths)
+    rep_bottom_end = np.repeat(bottom_end, lengths)
+    rep_ascent_end = np.repeat(dive_end - td_surface_duration, lengths)
+    rep_dive_end = np.repeat(bottom_end + td_ascent_duration, lengths)
+    descent_mask = t <= rep_bottom_start
+    bottom_mask = (t >= rep_bottom_start) & (t <= rep_bottom_end)
+    ascent_mask = (t >= rep_bottom_end) & (t <= rep_ascent_end)
+    dive_mask = (t >= rep_dive_start) & (t <= rep_dive_end)
+
+    dive_variance = segment_std(d, dive_mask, offsets, lengths)
+    bottom_variance = segment_std(d, bottom_mask, offsets, lengths)
+    bottom_difference = segment_max(d, bottom_mask, offsets, lengths) - \
+        segment_min(d, bottom_mask, offsets, lengths)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        descent_velocity = np.where(
+            td_descent_duration > 0,
+            (segment_max(d, descent_mask, offsets, lengths) -
+             segment_min(d, descent_mask, offsets, lengths)) /
+            td_descent_duration, 0)
+        ascent_velocity = (segment_max(d, ascent_mask, offsets, lengths) -
+                           segment_min(d, ascent_mask, offsets, lengths)) / \
+            td_ascent_duration
+
+    right_skew = (td_ascent_duration > td_descent_duration).astype(np.int64)
+    left_skew = (td_descent_duration > td_ascent_duration).astype(np.int64)
+    no_skew = 1 - right_skew - left_skew
+
+    # Count the peaks in the bottom of each dive, an empty bottom has none
+    peaks = np.where(profiled, 0.0, np.nan)
+    bottom_count = segment_count(bottom_mask, offsets, lengths)
+    for i in np.flatnonzero(profiled & (bottom_count > 0)):
+        segment = slice(offsets[i], offsets[i] + lengths[i])
+        peaks[i] = count_bottom_peaks(d[segment][bottom_mask[segment]],
+                                      mean_step[i], surface_threshold)
+    insufficient_data = np.isnan(peaks)
+
+    # Only keep the attributes the profile got to before it failed
+    for values in (td_surface_duration, dive_variance, bottom_variance,
+                   bottom_difference, descent_velocity, ascent_velocity):
+        values[~profiled] = np.nan
+
+    return {
+        'surface_threshold': np.repeat(surface_threshold, n),
+        'max_depth': max_depth,
+        'dive_start': dive_start,
+        'dive_end': dive_end,
+        'bottom_start': bottom_start,
+        'td_bottom_duration': td_bottom_duration,
+        'bottom_difference': bottom_difference,
+        'td_total_duration': td_total_duration,
+        'td_descent_duration': td_descent_duration,
+        'td_ascent_duration': td_ascent_duration,
+        'td_surface_duration': td_surface_duration,
+        'dive_variance': dive_variance,
+        'bottom_variance': bottom_variance,
+        'descent_velocity': descent_velocity,
+        'ascent_velocity': ascent_velocity,
+        'td_dive_duration': td_total_duration - td_surface_duration,
+        'no_skew': np.where(profiled, no_skew, np.nan),
+        'right_skew': np.where(profiled, right_skew, np.nan),
+        'left_skew': np.where(profiled, left_skew, np.nan),
+        'peaks': peaks,
+        'insufficient_data': insufficient_data
+    }
+
+
+def profile_deepdive_segments(time,
+                              depth,
+                              starts,
+                              ends,
+                              at_depth_threshold=0.15):
+    """
+    Computes the ``DeepDive`` attributes for every dive segment of a record
+    with segmented reductions. Only the peak detection runs per dive.
+
+    :param time: a NumPy array of times in seconds sorted by time
+    :param depth: a NumPy array of depths
+    :param starts: a NumPy array of the first position of each dive
+    :param ends: a NumPy array of the position after the last position of each
+        dive
+    :param at_depth_threshold: a value from 0 - 1 indicating distance from
+        the bottom of the dive at which the animal is considered to be at
+        depth
+
+    :return: a dictionary of attribute arrays with one value per dive
+    """
+    time = np.asarray(time, dtype=np.float64)
+    depth = np.asarray(depth, dtype=np.float64)
+    positions, offsets, lengths = segment_positions(starts, ends)
+    n = len(offsets)
+    if n == 1 and len(positions) == len(time) and \
+            (len(positions) == 0 or positions[0] == 0):
+        # A single dive covering the whole record is used as is
+        t = time
+        d = depth
+    else:
+        t = time[positions]
+        d = depth[positions]
+    everything = np.ones(len(positions), dtype=bool)
+
+    max_depth = segment_max(d, everything, offsets, lengths)
+    min_depth = segment_min(d, everything, offsets, lengths)
+    dive_start = segment_min(t, everything, offsets, lengths)
+    dive_end = segment_max(t, everything, offsets, lengths)
+
+    depth_diff = segment_diff(d, offsets, lengths)
+    time_diff = segment_diff(t, offsets, lengths)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        velocity = depth_diff / time_diff
+    descending = velocity > 0
+    ascending = velocity < 0
+
+    # Find the samples at depth, ignoring the first one in each dive
+    threshold = max_depth - ((max_depth - min_depth) * at_depth_threshold)
+    at_depth = d > np.repeat(threshold, lengths)
+    at_depth_count = np.concatenate(([0], np.cumsum(at_depth)))
+    at_depth &= (at_depth_count[1:] -
+                 np.repeat(at_depth_count[offsets], lengths)) > 1
+    pre_depth = t < np.repeat(segment_min(t, at_depth, offsets, lengths),
+                              lengths)
+    post_depth = t > np.repeat(segment_max(t, at_depth, offsets, lengths),
+                               lengths)
+
+    td_time_pre_depth = segment_sum(time_diff, pre_depth, offsets, lengths)
+    td_time_post_depth = segment_sum(time_diff, post_depth, offsets, lengths)
+    left_skew = ((td_time_pre_depth > td_time_post_depth) |
+                 (td_time_post_depth > td_time_pre_depth)).astype(np.int64)
+
+    mean_step = segment_mean(time_diff, everything, offsets, lengths)
+    peaks = np.zeros(n, dtype=np.int64)
+    for i in range(n):
+        peaks[i] = count_peaks(d[offsets[i]:offsets[i] + lengths[i]],
+                               mean_step[i])
+
+    return {
+        'max_depth': max_depth,
+        'min_depth': min_depth,
+        'dive_start': dive_start,
+        'dive_end': dive_end,
+        'td_total_duration': dive_end - dive_start,
+        'depth_variance': segment_std(d, everything, offsets, lengths),
+        'average_vertical_velocity': segment_mean(
+            np.absolute(velocity), everything, offsets, lengths),
+        'average_descent_velocity': np.absolute(
+            segment_mean(velocity, descending, offsets, lengths)),
+        'average_ascent_velocity': np.absolute(
+            segment_mean(velocity, ascending, offsets, lengths)),
+        'number_of_descent_transitions': segment_count(descending, offsets,
+                                                       lengths),
+        'number_of_ascent_transitions': segment_count(ascending, offsets,
+                                                      lengths),
+        'total_descent_distance_traveled': np.absolute(
+            segment_sum(depth_diff, depth_diff > 0, offsets, lengths)),
+        'total_ascent_distance_traveled': np.absolute(
+            segment_sum(depth_diff, depth_diff < 0, offsets, lengths)),
+        'overall_change_in_depth': segment_sum(depth_diff, everything,
+                                               offsets, lengths),
+        'td_time_at_depth': segment_sum(time_diff, at_depth, offsets,
+                                        lengths),
+        'td_time_pre_depth': td_time_pre_depth,
+        'td_time_post_depth': td_time_post_depth,
+        'peaks': peaks,
+        'no_skew': 1 - left_skew,
+        'right_skew': np.zeros(n, dtype=np.int64),
+        'left_skew': left_skew
+    }
+
+
+def dive_statistics(time, depth, surface_threshold=0, at_depth_threshold=0.15):
+    """
+    Computes the ``Dive`` attributes of a single dive.
+
+    :param time: a NumPy array of times in seconds sorted by time
+    :param depth: a NumPy array of depths
+    :param surface_threshold: the threshold at which is considered surface
+    :param at_depth_threshold: a value from 0 - 1 indicating distance from
+        the bottom of the dive at which the animal is considered to be at
+        depth
+
+    :return: a dictionary of the dive attributes as Python scalars
+    """
+    attributes = profile_dive_segments(time, depth, [0], [len(time)],
+                                       surface_threshold, at_depth_threshold)
+    return {k: v[0].item() for k, v in attributes.items()}
+
+
+def deepdive_statistics(time, depth, at_depth_threshold=0.15):
+    """
+    Computes the ``DeepDive`` attributes of a single dive. The depth and time
+    differences and the velocities are computed once on the arrays and every
+    attribute is derived from them.
+
+    :param time: a NumPy array of times in seconds sorted by time
+    :param depth: a NumPy array of depths
+    :param at_depth_threshold: a value from 0 - 1 indicating distance from
+        the bottom of the dive at which the animal is considered to be at
+        depth
+
+    :return: a dictionary of the dive attributes as Python scalars
+    """
+    attributes = profile_deepdive_segments(time, depth, [0], [len(time)],
+                                           at_depth_threshold)
+    return {k: v[0].item() for k, v in attributes.items()}
+
+
+def _suppress_peaks(indices, heights, min_dist):
+    """
+    Keeps the highest peaks so that no two kept peaks are within ``min_dist``
+    of each other. The peaks are visited in the same order as
+    ``peakutils.indexes``, the reverse of ``np.argsort`` of the heights, so
+    peaks of the same height are resolved the same way when ``indices`` are
+    all of the peaks above the threshold.
+
+    :param indices: a NumPy array of peak positions sorted ascending
+    :param heights: a NumPy array of the peak heights
+    :param min_dist: the minimum distance between peaks
+
+    :return: a NumPy array of the kept peak positions
+    """
+    if len(indices) < 2 or min_dist <= 1:
+        return indices
+    return indices[_keep_peaks(indices, np.argsort(heights)[::-1], min_dist)]
+
+
+def _keep_peaks(indices, order, min_dist):
+    """
+    :param indices: a NumPy array of peak positions sorted ascending
+    :param order: the order to visit the peaks in, highest first
+    :param min_dist: the minimum distance between peaks
+
+    :return: a boolean NumPy array of the peaks that are kept when each peak
+        that is visited suppresses the ones within ``min_dist``
+    """
+    lows = np.searchsorted(indices, indices - min_dist, side='left')
+    highs = np.searchsorted(indices, indices + min_dist, side='right')
+    removed = np.zeros(len(indices), dtype=bool)
+    kept = np.zeros(len(indices), dtype=bool)
+    for k in order.tolist():
+        if not removed[k]:
+            removed[lows[k]:highs[k]] = True
+            kept[k] = True
+    return kept
+
+
+class PeakDetector:
+    """
+    A streaming equivalent of ``peakutils.indexes`` with an absolute
+    threshold. Values are fed in consecutive chunks with ``update()`` and the
+    peaks are returned as soon as nothing later in the series can change
+    them.
+
+    Plateaus are handled the same way as ``peakutils``, with the peak placed
+    in the middle of the plateau, and peaks are only suppressed by higher
+    peaks within ``min_dist``. The first and the last value of the series
+    are never peaks. With a ``min_dist`` the peaks of each cluster of close
+    peaks are resolved on their own, so peaks of the same height can be
+    resolved differently than ``peakutils.indexes``. ``find_peaks()`` and the
+    streaming functions keep every peak above the threshold and resolve them
+    together to match it.
+    """
+
+    def __init__(self, thres, min_dist=1):
+        """
+        :param thres: the absolute threshold a peak has to be above
+        :param min_dist: the minimum distance between each detected peak
+        """
+        self.thres = thres
+        self.min_dist = int(min_dist)
+        self.position = 0
+        self.previous_value = np.nan
+        self.run_value = None
+        self.run_start = 0
+        self.cluster_indices = np.array([], dtype=np.int64)
+        self.cluster_heights = np.array([])
+
+    def update(self, values):
+        """
+        :param values: a NumPy array with the next chunk of the series
+
+        :return: a NumPy array of the peak positions that are final
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return np.array([], dtype=np.int64)
+
+        # Split the chunk into runs of equal values
+        change = np.flatnonzero(values[1:] != values[:-1]) + 1
+        run_starts = np.concatenate(([0], change)) + self.position
+        run_values = values[np.concatenate(([0], change))]
+
+        if self.run_value is not None and self.run_value == run_values[0]:
+            run_starts[0] = self.run_start
+        elif self.run_value is not None:
+            run_starts = np.concatenate(([self.run_start], run_starts))
+            run_values = np.concatenate(([self.run_value], run_values))
+
+        self.position += len(values)
+        run_ends = np.append(run_starts[1:], self.position) - 1
+
+        # Every run but the last one is complete
+        peaks = self._runs_to_peaks(run_starts[:-1], run_ends[:-1],
+                                    run_values[:-1], run_values[1:])
+        self.run_start = run_starts[-1]
+        self.run_value = run_values[-1]
+        return peaks
+
+    def finish(self):
+        """
+        The last run of the series can't be a peak, so this only closes the
+        open cluster of peaks.
+
+        :return: a NumPy array of the remaining peak positions once the series
+            has ended
+        """
+        self.run_value = None
+        return self._close_cluster().astype(np.int64)
+
+    def _runs_to_peaks(self, starts, ends, values, next_values):
+        """
+        :param starts: the first position of each complete run
+        :param ends: the last position of each complete run
+        :param values: the value of each complete run
+        :param next_values: the value of the run after each complete run
+
+        :return: the final peak positions
+        """
+        previous_values = np.concatenate(([self.previous_value], values[:-1]))
+        if len(values):
+            self.previous_value = values[-1]
+
+        is_peak = (values > previous_values) & (values > next_values) & \
+            (values > self.thres)
+        indices = ((starts[is_peak] + ends[is_peak]) // 2).astype(np.int64)
+        heights = values[is_peak]
+
+        if self.min_dist <= 1:
+            return indices
+
+        # Peaks further than min_dist apart can't suppress each other, so
+        # only the last cluster of close peaks is still open
+        indices = np.concatenate((self.cluster_indices, indices))
+        heights = np.concatenate((self.cluster_heights, heights))
+        breaks = np.flatnonzero(np.diff(indices) > self.min_dist) + 1
+        if len(breaks) == 0:
+            self.cluster_indices = indices
+            self.cluster_heights = heights
+            return np.array([], dtype=np.int64)
+
+        self.cluster_indices = indices[breaks[-1]:]
+        self.cluster_heights = heights[breaks[-1]:]
+        bounds = np.concatenate(([0], breaks))
+        return np.concatenate([
+            _suppress_peaks(indices[a:b], heights[a:b], self.min_dist)
+            for a, b in zip(bounds[:-1], bounds[1:])
+        ]).astype(np.int64)
+
+    def _close_cluster(self):
+        """
+        :return: the kept peak positions from the open cluster
+        """
+        peaks = _suppress_peaks(self.cluster_indices, self.cluster_heights,
+                                self.min_dist)
+        self.cluster_indices = np.array([], dtype=np.int64)
+        self.cluster_heights = np.array([])
+        return peaks
+
+
+class _SortedSums:
+    """
+    Weights kept sorted by a key to sum the weights above any key. The
+    weights are held in sorted runs that are merged like the digits of a
+    binary counter, so adding a batch merges a logarithmic number of runs
+    on average and a sum takes a binary search in each run.
+    """
+
+    def __init__(self):
+        self._runs = []
+
+    def add(self, keys, weights):
+        """
+        :param keys: a NumPy array of keys
+        :param weights: a NumPy array of the weights of the keys
+        """
+        keys = np.asarray(keys, dtype=np.float64)
+        weights = np.asarray(weights, dtype=np.float64)
+        if len(keys) == 0:
+            return
+        while self._runs and len(self._runs[-1][0]) <= len(keys):
+            run_keys, run_weights, _ = self._runs.pop()
+            keys = np.concatenate((run_keys, keys))
+            weights = np.concatenate((run_weights, weights))
+        order = np.argsort(keys, kind='stable')
+        weights = weights[order]
+        self._runs.append((keys[order], weights, np.cumsum(weights)))
+
+    def above(self, key):
+        """
+        :param key: the key to sum above
+
+        :return: the sum of the weights of the keys greater than ``key``
+        """
+        total = 0.0
+        for keys, weights, totals in self._runs:
+            start = np.searchsorted(keys, key, side='right')
+            if start < len(keys):
+                total += totals[-1] - (totals[start - 1] if start else 0.0)
+        return total
+
+
+class _PeakCounter:
+    """
+    Counts the peaks that ``count_peaks()`` finds in a series that grows by
+    updating which peaks are kept instead of suppressing all of them again.
+    Every peak is kept or suppressed as if the threshold was below all of
+    them, visiting them from the highest first, so the peaks kept with any
+    threshold are the ones above it. When peaks are added, only the peaks
+    visited after one that changed and within ``min_dist`` of it are visited
+    again. The order of peaks of the same height only matters when two of
+    them are within ``min_dist`` of each other, so the highest such pair is
+    tracked, and while it is above the threshold the peaks above the
+    threshold are suppressed again with ``_suppress_peaks()`` in the order of
+    ``peakutils.indexes``.
+    """
+
+    def __init__(self):
+        self.min_dist = None
+        self.size = 0
+        self._positions = np.empty(64, dtype=np.int64)
+        self._heights = np.empty(64, dtype=np.float64)
+        self._kept = np.zeros(64, dtype=bool)
+        self._kept_heights = _SortedSums()
+        self._tie_height = -np.inf
+        self._suppressed = None
+
+    def add(self, positions, heights, min_dist):
+        """
+        :param positions: a NumPy array of the positions of new peaks, after
+            the positions of the peaks already added
+        :param heights: a NumPy array of the heights of the new peaks
+        :param min_dist: the minimum distance between peaks
+        """
+        stop = self.size + len(positions)
+        if stop > len(self._positions):
+            capacity = max(stop, 2 * len(self._positions))
+            for name in ('_positions', '_heights', '_kept'):
+                buffer = np.zeros(capacity, dtype=getattr(self, name).dtype)
+                buffer[:self.size] = getattr(self, name)[:self.size]
+                setattr(self, name, buffer)
+        self._positions[self.size:stop] = positions
+        self._heights[self.size:stop] = heights
+        start, self.size = self.size, stop
+
+        min_dist = int(min_dist)
+        if min_dist != self.min_dist:
+            self.min_dist = min_dist
+            self._rebuild()
+            self._tie_height = self._highest_tie(0)
+        else:
+            self._revisit(list(range(start, stop)))
+            if stop > start:
+                first = np.searchsorted(
+                    self._positions[:self.size],
+                    self._positions[start] - self.min_dist, side='left')
+                self._tie_height = max(self._tie_height,
+                                       self._highest_tie(first))
+        if stop > start:
+            self._suppressed = None
+
+    def count(self, thres):
+        """
+        :param thres: the absolute threshold a peak has to be above
+
+        :return: the number of kept peaks above ``thres``
+        """
+        if self._tie_height <= thres:
+            return int(round(self._kept_heights.above(thres)))
+        if self._suppressed is None or self._suppressed[0] != thres:
+            heights = self._heights[:self.size]
+            above = heights > thres
+            peaks = _suppress_peaks(self._positions[:self.size][above],
+                                    heights[above], self.min_dist)
+            self._suppressed = (thres, len(peaks))
+        return self._suppressed[1]
+
+    def _highest_tie(self, first):
+        """
+        :param first: the index of the first peak to look at
+
+        :return: the highest height shared by two peaks from ``first`` on
+            that are within ``min_dist`` of each other, or ``-inf``
+        """
+        positions = self._positions[first:self.size]
+        heights = self._heights[first:self.size]
+        # The closest peaks of a height are next to each other by position
+        order = np.lexsort((positions, heights))
+        positions = positions[order]
+        heights = heights[order]
+        tied = (heights[1:] == heights[:-1]) & (
+            positions[1:] - positions[:-1] <= self.min_dist)
+        return heights[1:][tied].max() if tied.any() else -np.inf
+
+    def _rebuild(self):
+        """
+        Visits every peak again, after ``min_dist`` changed.
+        """
+        positions = self._positions[:self.size]
+        heights = self._heights[:self.size]
+        kept = _keep_peaks(positions, np.lexsort((-positions, -heights)),
+                           self.min_dist)
+        self._kept[:self.size] = kept
+        self._kept_heights = _SortedSums()
+        self._kept_heights.add(heights[kept], np.ones(int(kept.sum())))
+
+    def _revisit(self, queue):
+        """
+        :param queue: the indices of the peaks to visit again
+        """
+        positions = self._positions[:self.size]
+        heights = self._heights[:self.size]
+        queue = [(-heights[i], -positions[i], i) for i in queue]
+        heapq.heapify(queue)
+        previous = None
+        while queue:
+            i = heapq.heappop(queue)[2]
+            if i == previous:
+                continue
+            previous = i
+            low = np.searchsorted(positions, positions[i] - self.min_dist,
+                                  side='left')
+            high = np.searchsorted(positions, positions[i] + self.min_dist,
+                                   side='right')
+            near = np.arange(low, high)
+            near = near[near != i]
+            before = (heights[near] > heights[i]) | (
+                (heights[near] == heights[i]) &
+                (positions[near] > positions[i]))
+            kept = not self._kept[near[before]].any()
+            if kept == self._kept[i]:
+                continue
+            self._kept[i] = kept
+            self._kept_heights.add([heights[i]], [1.0 if kept else -1.0])
+            for j in near[~before].tolist():
+                heapq.heappush(queue, (-heights[j], -positions[j], j))
+
+
+def peak_threshold(y_min, y_max, thres):
+    """
+    :param y_min: the minimum of the series, ignoring ``NaN``
+    :param y_max: the maximum of the series, ignoring ``NaN``
+    :param thres: the normalized threshold between 0 and 1
+
+    :return: the absolute threshold used by ``peakutils.indexes``
+    """
+    return thres * (y_max - y_min) + y_min
+
+
+def find_peaks(y, thres=0.3, min_dist=1):
+    """
+    Finds the peaks in a series the same way as ``peakutils.indexes`` with
+    ``NaN`` values skipped when normalizing the threshold, including which of
+    the peaks of the same height within ``min_dist`` are kept.
+
+    :param y: a NumPy array of values
+    :param thres: the normalized threshold between 0 and 1
+    :param min_dist: the minimum distance between each detected peak
+
+    :return: a NumPy array of the peak positions
+    """
+    y = np.asarray(y, dtype=np.float64)
+    if len(y) == 0 or np.isnan(y).all():
+        return np.array([], dtype=np.int64)
+    detector = PeakDetector(
+        peak_threshold(np.nanmin(y), np.nanmax(y), thres))
+    indices = np.concatenate((detector.update(y), detector.finish()))
+    return _suppress_peaks(indices, y[indices], int(min_dist))
+
+
+def local_maxima(y):
+    """
+    Finds every peak of a series that ``find_peaks()`` could return, with no
+    threshold and no minimum distance, so different thresholds and
+    distances can be applied later with ``select_peaks()``.
+
+    :param y: a NumPy array of values
+
+    :return: a NumPy array of the peak positions and a NumPy array of their
+        values
+    """
+    y = np.asarray(y, dtype=np.float64)
+    if len(y) == 0:
+        return np.array([], dtype=np.int64), np.array([])
+    detector = PeakDetector(-np.inf)
+    indices = np.concatenate((detector.update(y), detector.finish()))
+    return indices, y[indices]
+
+
+def select_peaks(indices, heights, thres, min_dist=1):
+    """
+    Applies an absolute threshold and a minimum distance to the peaks from
+    ``local_maxima()``. The result is the same as ``find_peaks()`` with the
+    same threshold and minimum distance.
+
+    :param indices: a NumPy array of peak positions sorted ascending
+    :param heights: a NumPy array of the peak values
+    :param thres: the absolute threshold a peak has to be above
+    :param min_dist: the minimum distance between each detected peak
+
+    :return: a NumPy array of the peak positions
+    """
+    above = heights > thres
+    return _suppress_peaks(indices[above], heights[above],
+                           int(min_dist)).astype(np.int64)
+
+
+def refine_dive_starts(depth,
+                       starts,
+                       ends,
+                       surface_threshold=0,
+                       first_below=False):
+    """
+    Moves the start of each of a surfacing animal's dive segments to the last
+    point near the surface (1 meter or less) before the animal goes below the
+    surface threshold, for every segment at once.
+
+    :param depth: a NumPy array of depths sorted by time
+    :param starts: a NumPy array of the first position of each segment
+    :param ends: a NumPy array of the position after the last position of each
+        segment
+    :param surface_threshold: the threshold at which is considered surface
+    :param first_below: a boolean indicating whether to start the dives one
+        point before the first point below the surface threshold, used for
+        sample rates of 10 seconds or more
+
+    :return: a NumPy array of the refined start positions and a boolean
+        NumPy array of the segments that go below the surface threshold
+    """
+    depth = np.asarray(depth, dtype=np.float64)
+    starts = np.asarray(starts, dtype=np.int64)
+    positions, offsets, lengths = segment_positions(starts, ends)
+    d = depth[positions]
+    local = np.arange(len(positions)) - np.repeat(offsets, lengths)
+    everything = np.ones(len(positions), dtype=bool)
+
+    is_dive = segment_max(d, everything, offsets, lengths) > surface_threshold
+    first_above = segment_min(local, d > surface_threshold, offsets, lengths)
+    first_above = np.where(is_dive, first_above, 0).astype(np.int64)
+    if first_below:
+        return starts + first_above - 1, is_dive
+
+    shallow = (d <= 1) & (local < np.repeat(first_above, lengths))
+    shallow_count = segment_count(shallow, offsets, lengths)
+    last_shallow = segment_max(local, shallow, offsets, lengths)
+    refined = np.where(shallow_count > 1, last_shallow,
+                       np.clip(first_above - 1, 0, None))
+    return starts + refined.astype(np.int64), is_dive
@@ -0,0 +1,234 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from divebomb.kernels import epoch_seconds
+from divebomb.record_store import RecordStore
+
+
+def _import_pyarrow():
+    """
+    :return: the ``pyarrow``, ``pyarrow.parquet``, and ``pyarrow.dataset``
+        modules
+    """
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError as error:
+        raise ImportError(
+            "Reading and writing Parquet needs pyarrow, install it with "
+            "`pip install pyarrow` or `pip install divebomb[parquet]`"
+        ) from error
+    return pyarrow, pyarrow.parquet, pyarrow.dataset
+
+
+def _to_table(frame):
+    """
+    :param frame: a Pandas DataFrame
+
+    :return: an Arrow table of ``frame`` without its index or ``attrs``
+    """
+    pyarrow, _, _ = _import_pyarrow()
+    # attrs can hold fitted models that can't be stored as metadata
+    frame = frame.copy(deep=False)
+    frame.attrs = {}
+    return pyarrow.Table.from_pandas(frame, preserve_index=False)
+
+
+def write_parquet(frame, path, partition_cols=None, compression='snappy'):
+    """
+    Writes a DataFrame to a Parquet file, or to a folder of Parquet files
+    with a subfolder per value of the ``partition_cols`` (``cluster=1``,
+    ``deployment=seal1``) so readers can skip the partitions they don't
+    need.
+
+    :param frame: a Pandas DataFrame
+    :param path: the path of the Parquet file, or of the folder when
+        ``partition_cols`` are given
+    :param partition_cols: an optional list of the columns to partition by,
+        the partitions being written replace the ones already in the folder
+    :param compression: the Parquet compression codec, default is ``snappy``
+    """
+    _, parquet, _ = _import_pyarrow()
+    table = _to_table(frame)
+    if partition_cols:
+        parquet.write_to_dataset(
+            table,
+            path,
+            partition_cols=list(partition_cols),
+            compression=compression,
+            existing_data_behavior='delete_matching')
+    else:
+        parquet.write_table(table, path, compression=compression)
+
+
+def read_parquet(path, columns=None, filters=None):
+    """
+    Reads a Parquet file or a partitioned folder of Parquet files. Only the
+    ``columns`` are read, and ``filters`` skip the partitions and row groups
+    that can't match before any data is read.
+
+    :param path: the path of a Parquet file or folder
+    :param columns: an optional list of the columns to read, default is every
+        column
+    :param filters: an optional list of ``(column, operator, value)`` tuples
+        that every row must match, such as ``[('cluster', '=', 2),
+        ('max_depth', '>', 100)]``, or a list of such lists where a row has
+        to match one of them
+
+    :return: a Pandas DataFrame with the partition columns as regular columns
+    """
+    _, parquet, _ = _import_pyarrow()
+    frame = parquet.read_table(path, columns=columns,
+                               filters=filters).to_pandas()
+    for column in frame.columns:
+        # Partition values are read back as categories
+        if isinstance(frame[column].dtype, pd.CategoricalDtype):
+            frame[column] = frame[column].astype(
+                frame[column].cat.categories.dtype)
+    return frame
+
+
+def iter_parquet_chunks(path, columns=None, filters=None, chunksize=1000000):
+    """
+    Reads a Parquet file or a partitioned folder of Parquet files in
+    chunks.
+
+    :param path: the path of a Parquet file or folder
+    :param columns: an optional list of the columns to read
+    :param filters: an optional list of ``(column, operator, value)`` tuples
+        that every row must match, as in ``read_parquet()``
+    :param chunksize: the largest number of rows in a chunk
+
+    :return: an iterator of Pandas DataFrames
+    """
+    _, parquet, dataset = _import_pyarrow()
+    record = dataset.dataset(path, format='parquet', partitioning='hive')
+    expression = None
+    if filters:
+        expression = parquet.filters_to_expression(filters)
+    for batch in record.to_batches(columns=columns, filter=expression,
+                                   batch_size=chunksize):
+        if batch.num_rows:
+            yield batch.to_pandas()
+
+
+def _write_store(store, path, deployment, chunksize):
+    """
+    Writes a ``RecordStore`` to Parquet a row group at a time.
+
+    :param store: a ``RecordStore``
+    :param path: the path of the Parquet file, or of the folder with a
+        ``deployment``
+    :param deployment: an optional name of the deployment of the record
+    :param chunksize: the number of samples in a row group
+    """
+    pyarrow, parquet, _ = _import_pyarrow()
+    if deployment is not None:
+        # Replace the partition the same way as write_to_dataset
+        path = os.path.join(path, f'deployment={deployment}')
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+        path = os.path.join(path, 'part-0.parquet')
+    schema = pyarrow.schema([('time', pyarrow.float64()),
+                             ('depth', pyarrow.float64())])
+    with parquet.ParquetWriter(path, schema, compression='snappy') as writer:
+        for start, time, depth in store.chunks(chunksize):
+            writer.write_table(
+                pyarrow.table({'time': time, 'depth': depth}, schema=schema))
+
+
+def write_record(data,
+                 path,
+                 deployment=None,
+                 columns={
+                     'depth': 'depth',
+                     'time': 'time'
+                 },
+                 chunksize=1000000):
+    """
+    Writes a time and depth record to Parquet with the time in seconds since
+    1970-01-01. With a ``deployment`` the record is written to the
+    ``deployment=<deployment>`` partition of the folder at ``path``, so the
+    records of every tag can be kept in one dataset and read one deployment
+    at a time.
+
+    :param data: a Pandas DataFrame consisting of a time and a depth column,
+        or a ``RecordStore`` that is written ``chunksize`` samples at a time
+    :param path: the path of the Parquet file, or of the folder with a
+        ``deployment``
+    :param deployment: an optional name of the deployment of the record
+    :param columns: column renaming dictionary if needed
+    :param chunksize: the number of samples of a ``RecordStore`` to write at
+        a time
+    """
+    if isinstance(data, RecordStore):
+        _write_store(data, path, deployment, chunksize)
+        return
+
+    record = pd.DataFrame({
+        'time': epoch_seconds(data[columns['time']]),
+        'depth': np.asarray(data[columns['depth']], dtype=np.float64)
+    })
+    if deployment is None:
+        write_parquet(record, path)
+    else:
+        record['deployment'] = str(deployment)
+        write_parquet(record, path, partition_cols=['deployment'])
+
+
+def export_to_parquet(folder,
+                      data,
+                      dives,
+                      loadings,
+                      pca_output_matrix,
+                      insufficient_dives=None,
+                      partition_cols=['cluster']):
+    """
+    Will output the record, dive profiles, loadings, PCA Matrix, and
+    inssufficent dive into the indicated folder as Parquet. The record is
+    written to ``record.parquet``, and the dive profiles to an
+    ``all_profiled_dives`` folder partitioned by ``partition_cols``.
+
+    :param folder: the path to export all files to, the folder will be
+        overwritten
+    :param data: a Pandas DataFrame of the time and depth of the record, or
+        a ``RecordStore``
+    :param dives: a Pandas DataFrame of the dive profiles and clusters, usually
+        generated from ``cluster_dives()``
+    :param loadings: a Pandas DataFrame of the Principle Component Analysis
+        loadings from ``cluster_dives()``
+    :param pca_output_matrix: a Pandas DataFrame of the Principle Component
+        Analysis results from ``cluster_dives()``
+    :param insufficent_dives: a Pandas DataFrame of dives that could not be
+        profiled from ``cluster_dives()``
+    :param partition_cols: the columns of ``dives`` to partition the profiles
+        by, default is ``cluster``, an empty list writes a single
+        ``all_profiled_dives.parquet``
+    """
+    _import_pyarrow()
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.makedirs(folder)
+
+    write_record(data, os.path.join(folder, 'record.parquet'))
+    dives['dive_id'] = dives.index + 1
+    if partition_cols:
+        write_parquet(dives, os.path.join(folder, 'all_profiled_dives'),
+                      partition_cols=partition_cols)
+    else:
+        write_parquet(dives,
+                      os.path.join(folder, 'all_profiled_dives.parquet'))
+    write_parquet(loadings, os.path.join(folder, 'pca_loadings.parquet'))
+    pca_output_matrix = pca_output_matrix.copy(deep=False)
+    pca_output_matrix['dive_id'] = dives.dive_id.values
+    write_parquet(pca_output_matrix,
+                  os.path.join(folder, 'pca_output_matrix.parquet'))
+    if insufficient_dives is not None and not insufficient_dives.empty:
+        write_parquet(insufficient_dives,
+                      os.path.join(folder, 'insufficient_dives.parquet'))
+    print(f"Files have been exported to {os.getcwd()}/{folder}")
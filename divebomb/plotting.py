@@ -1,6 +1,7 @@
 import os
 
 import colorlover as cl
+import numpy as np
 import pandas as pd
 import plotly.graph_objs as go
 import plotly.offline as py
@@ -39,6 +40,53 @@ def plot_from_nc(folder,
                                  filename)
 
 
+def _read_dive(folder, cluster, dive_id):
+    """
+    Reads a single dive from either a file per dive from ``export_dives()``
+    or the ``dive_archive.nc`` from ``export_dive_archive()``.
+
+    :param folder: the path to the results folder contianing the cluster
+        folders or the dive archive
+    :param cluster: the number of the cluster of the dive
+    :param dive_id: the number of of the dive
+
+    :return: a dataframe of the time and depth of the dive and a dictionary of
+        the dive attributes
+    """
+    archive = os.path.join(folder, 'dive_archive.nc')
+    data = pd.DataFrame()
+    if os.path.exists(archive):
+        rootgrp = Dataset(archive)
+        found = np.flatnonzero(rootgrp.variables['dive_id'][:] == dive_id)
+        if len(found) == 0:
+            rootgrp.close()
+            raise ValueError('Dive {} is not in the archive'.format(dive_id))
+        index = int(found[0])
+        attributes = {
+            name: np.ma.getdata(variable[index]).item()
+            for name, variable in rootgrp.variables.items()
+            if variable.dimensions == ('dive', )
+        }
+        attributes['time_units'] = rootgrp.time_units
+        start = attributes['sample_offset']
+        stop = start + attributes['sample_count']
+        data['time'] = rootgrp.variables['time'][start:stop]
+        data['depth'] = rootgrp.variables['depth'][start:stop]
+        rootgrp.close()
+        if attributes['cluster'] != cluster:
+            raise ValueError('Dive {} is not in cluster {}'.format(
+                dive_id, cluster))
+        return data, attributes
+
+    dive_file = '%s/cluster_%d/dive_%05d.nc' % (folder, cluster, dive_id)
+    rootgrp = Dataset(dive_file)
+    data['time'] = rootgrp.variables['time'][:]
+    data['depth'] = rootgrp.variables['depth'][:]
+    attributes = {name: rootgrp.getncattr(name) for name in rootgrp.ncattrs()}
+    rootgrp.close()
+    return data, attributes
+
+
 def plot_dive_from_nc(folder,
                       cluster,
                       dive_id,
@@ -62,34 +110,30 @@ def plot_dive_from_nc(folder,
     :return: a plotly line chart of the dive
 
     """
-    dive_file = '%s/cluster_%d/dive_%05d.nc' % (folder, cluster, dive_id)
-    rootgrp = Dataset(dive_file)
-    data = pd.DataFrame()
-    data['time'] = rootgrp.variables['time'][:]
-    data['depth'] = rootgrp.variables['depth'][:]
+    data, dive = _read_dive(folder, cluster, dive_id)
 
     # Get and set the surface data
     surface_data = data[data.time >= (
-        data.time.max() - rootgrp.td_surface_duration)]
+        data.time.max() - dive['td_surface_duration'])]
 
     surface = go.Scatter(
-        x=num2date(surface_data.time.tolist(), units=rootgrp.time_units),
+        x=num2date(surface_data.time.tolist(), units=dive['time_units']),
         y=surface_data.depth,
         mode='lines',
         name='Surface')
 
     # Get and set the bottom data
-    bottom_data = data[(data.time >= rootgrp.bottom_start) & (
-        data.time <= (rootgrp.bottom_start + rootgrp.td_bottom_duration))]
+    bottom_data = data[(data.time >= dive['bottom_start']) & (
+        data.time <= (dive['bottom_start'] + dive['td_bottom_duration']))]
     bottom = go.Scatter(
-        x=num2date(bottom_data.time.tolist(), units=rootgrp.time_units),
+        x=num2date(bottom_data.time.tolist(), units=dive['time_units']),
         y=bottom_data.depth,
         mode='lines',
         name='Bottom')
 
     descent_data = data[data.time <= bottom_data.time.min()]
     descent = go.Scatter(
-        x=num2date(descent_data.time.tolist(), units=rootgrp.time_units),
+        x=num2date(descent_data.time.tolist(), units=dive['time_units']),
         y=descent_data.depth,
         mode='lines',
         name='Descent')
@@ -100,17 +144,16 @@ def plot_dive_from_nc(folder,
         (data.time <= surface_data.time.min())
     ]
     ascent = go.Scatter(
-        x=num2date(ascent_data.time.tolist(), units=rootgrp.time_units),
+        x=num2date(ascent_data.time.tolist(), units=dive['time_units']),
         y=ascent_data.depth,
         mode='lines',
         name='Ascent')
 
     layout = go.Layout(
-        title='Dive {} from Cluster {}'.format(rootgrp.dive_id,
-                                               rootgrp.cluster),
+        title='Dive {} from Cluster {}'.format(dive['dive_id'],
+                                               dive['cluster']),
         xaxis=dict(title='Time'),
         yaxis=dict(title='Depth in Meters', autorange='reversed'))
-    rootgrp.close()
 
     plot_data = [descent, bottom, ascent, surface]
     fig = go.Figure(data=plot_data, layout=layout)
@@ -143,12 +186,8 @@ def plot_deepdive_from_nc(folder,
     :return: a plotly line chart of the dive
 
     """
-    dive_file = '%s/cluster_%d/dive_%05d.nc' % (folder, cluster, dive_id)
-    rootgrp = Dataset(dive_file)
-    data = pd.DataFrame()
-    data['time'] = rootgrp.variables['time'][:]
-    data['depth'] = rootgrp.variables['depth'][:]
-    units = rootgrp.variables['time'].units
+    data, dive = _read_dive(folder, cluster, dive_id)
+    units = dive['time_units']
     at_depth_data = data[data.depth > (data.depth.max() - (
         (data.depth.max() - data.depth.min()) * at_depth_threshold))]
     pre_depth_data = data[(data.depth < (data.depth.max() - (
@@ -181,11 +220,10 @@ def plot_deepdive_from_nc(folder,
         name='Post Depth')
 
     layout = go.Layout(
-        title='Dive {} from Cluster {}'.format(rootgrp.dive_id,
-                                               rootgrp.cluster),
+        title='Dive {} from Cluster {}'.format(dive['dive_id'],
+                                               dive['cluster']),
         xaxis=dict(title='Time'),
         yaxis=dict(title='Depth in Meters', autorange='reversed'))
-    rootgrp.close()
     plot_data = [pre_depth, post_depth, at_depth]
     fig = go.Figure(data=plot_data, layout=layout)
     if ipython_display:
@@ -195,6 +233,45 @@ def plot_deepdive_from_nc(folder,
         return py.plot(fig, filename=filename)
 
 
+def _archive_summary_data(archive, scale):
+    """
+    Reads every dive from a ``dive_archive.nc`` with the time of each sample
+    relative to the start of its dive, as used by ``cluster_summary_plot()``.
+
+    :param archive: the path of the dive archive
+    :param scale: a dictionary of whether to scale the ``time`` and ``depth``
+        of each dive to a percentage
+
+    :return: a dataframe of the depth, time, and cluster of every sample
+    """
+    rootgrp = Dataset(archive)
+    time = np.ma.getdata(rootgrp.variables['time'][:])
+    depth = np.ma.getdata(rootgrp.variables['depth'][:])
+    offsets = np.ma.getdata(rootgrp.variables['sample_offset'][:])
+    counts = np.ma.getdata(rootgrp.variables['sample_count'][:])
+    clusters = np.ma.getdata(rootgrp.variables['cluster'][:])
+    rootgrp.close()
+
+    offsets = offsets[counts > 0]
+    clusters = clusters[counts > 0]
+    counts = counts[counts > 0]
+    time = time - np.repeat(time[offsets], counts)
+    dive_data = pd.DataFrame({
+        'depth': depth,
+        'time': time,
+        'cluster': np.repeat(clusters, counts)
+    })
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if 'time' in scale.keys() and scale['time']:
+            last = np.repeat(time[offsets + counts - 1], counts)
+            dive_data['progress_into_dive'] = np.round(time / last * 100, 0)
+        if 'depth' in scale.keys() and scale['depth']:
+            deepest = np.repeat(np.fmax.reduceat(depth, offsets), counts)
+            dive_data['dive_relative_depth_percentage'] = np.round(
+                depth / deepest * 100, 0)
+    return dive_data
+
+
 def cluster_summary_plot(folder,
                          ipython_display=True,
                          filename='index.html',
@@ -227,33 +304,43 @@ def cluster_summary_plot(folder,
     yaxis = 'depth'
     yaxis_title = 'Depth in Meters'
 
-    dive_data = pd.DataFrame()
-    for group, data in df.groupby('cluster'):
-        for index, row in data.iterrows():
-            dive_file = '%s/cluster_%d/dive_%05d.nc' % (folder, row.cluster,
-                                                        row.dive_id)
-            rootgrp = Dataset(dive_file)
-            single_dive_data = pd.DataFrame()
-            single_dive_data['depth'] = rootgrp.variables['depth'][:]
-            single_dive_data['time'] = rootgrp.variables['time'][:]
-            single_dive_data['time'] = single_dive_data['time'] - \
-                single_dive_data['time'].min()
-            if 'time' in scale.keys() and scale['time']:
-                single_dive_data['progress_into_dive'] = round(
-                    single_dive_data.time / single_dive_data.time.max() * 100,
-                    0)
-                xaxis = 'progress_into_dive'
-                xaxis_title = 'Progress Through Dive (%)'
-
-            if 'depth' in scale.keys() and scale['depth']:
-                single_dive_data['dive_relative_depth_percentage'] = round(
-                    single_dive_data.depth / single_dive_data.depth.max() *
-                    100, 0)
-                yaxis = 'dive_relative_depth_percentage'
-                yaxis_title = 'Depth (%) Relative to the Dive'
-            single_dive_data['cluster'] = rootgrp.cluster
-            dive_data = dive_data.append(single_dive_data)
-            rootgrp.close()
+    archive = os.path.join(folder, 'dive_archive.nc')
+    if os.path.exists(archive):
+        dive_data = _archive_summary_data(archive, scale)
+        if 'time' in scale.keys() and scale['time']:
+            xaxis = 'progress_into_dive'
+            xaxis_title = 'Progress Through Dive (%)'
+        if 'depth' in scale.keys() and scale['depth']:
+            yaxis = 'dive_relative_depth_percentage'
+            yaxis_title = 'Depth (%) Relative to the Dive'
+    else:
+        dive_data = pd.DataFrame()
+        for group, data in df.groupby('cluster'):
+            for index, row in data.iterrows():
+                dive_file = '%s/cluster_%d/dive_%05d.nc' % (folder, row.cluster,
+                                                            row.dive_id)
+                rootgrp = Dataset(dive_file)
+                single_dive_data = pd.DataFrame()
+                single_dive_data['depth'] = rootgrp.variables['depth'][:]
+                single_dive_data['time'] = rootgrp.variables['time'][:]
+                single_dive_data['time'] = single_dive_data['time'] - \
+                    single_dive_data['time'].min()
+                if 'time' in scale.keys() and scale['time']:
+                    single_dive_data['progress_into_dive'] = round(
+                        single_dive_data.time / single_dive_data.time.max() * 100,
+                        0)
+                    xaxis = 'progress_into_dive'
+                    xaxis_title = 'Progress Through Dive (%)'
+
+                if 'depth' in scale.keys() and scale['depth']:
+                    single_dive_data['dive_relative_depth_percentage'] = round(
+                        single_dive_data.depth / single_dive_data.depth.max() *
+                        100, 0)
+                    yaxis = 'dive_relative_depth_percentage'
+                    yaxis_title = 'Depth (%) Relative to the Dive'
+                single_dive_data['cluster'] = rootgrp.cluster
+                dive_data = dive_data.append(single_dive_data)
+                rootgrp.close()
 
     aggregated_data = dive_data.groupby([xaxis, 'cluster']).agg(
         ['min', 'mean', 'max', 'median', 'count']).reset_index(level=[0, 1])
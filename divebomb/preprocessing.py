@@ -1,9 +1,17 @@
 import math
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import pandas as pd
-import xarray as xr
-from netCDF4 import Dataset, date2num, num2date
+from netCDF4 import Dataset
+from scipy.ndimage import rank_filter
+
+from divebomb.kernels import epoch_seconds
+from divebomb.streaming import iter_record_chunks
+
+units = 'seconds since 1970-01-01'
 
 
 def zlib_encoding(ds):
@@ -20,6 +28,164 @@ def zlib_encoding(ds):
     return encoding
 
 
+def rolling_median(values, window):
+    """
+    The same as ``pd.Series(values).rolling(window).median()``, computed with
+    the sorted window rank filter of SciPy instead of a skip list.
+
+    :param values: a NumPy array without ``NaN`` values
+    :param window: the number of values in each window
+
+    :return: a NumPy array of the median of the ``window`` values ending at
+        each position, ``NaN`` for the first ``window - 1`` positions
+    """
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(len(values), np.nan)
+    if window < 1 or window > len(values):
+        return result
+    median = rank_filter(values, (window - 1) // 2, size=window,
+                         mode='nearest')
+    if window % 2 == 0:
+        median = (median + rank_filter(
+            values, window // 2, size=window, mode='nearest')) / 2
+    # The filter is centred, so shift it to the window ending at each value
+    result[window - 1:] = median[np.arange(window - 1, len(values)) -
+                                 window + 1 + window // 2]
+    return result
+
+
+def _surface_samples(depth, surface_threshold):
+    """
+    Takes the surface samples and the weights of their rolling medians in
+    the mean offset of the record. The medians are linearly interpolated
+    between the surface samples, so each sample between two surface samples
+    adds a share of both medians, and the samples after the last surface
+    sample keep its median.
+
+    :param depth: a NumPy array of the depths of the whole record
+    :param surface_threshold: the maximum depth that will be considered for
+        the offset
+
+    :return: the depths at or above ``surface_threshold``, the weights of
+        each median but the last from the samples up to the next surface
+        sample, the weights of each median but the first from the samples
+        since the previous surface sample, the number of samples after the
+        last surface sample, and for each surface sample the number of non
+        ``NaN`` depths from it to the end of the record
+    """
+    valid = ~np.isnan(depth)
+    count = np.cumsum(valid, dtype=np.int64)
+    position = np.cumsum(np.where(valid, np.arange(len(depth)), 0),
+                         dtype=np.int64)
+    surface = np.flatnonzero(depth <= surface_threshold)
+    before = np.clip(surface - 1, 0, None)
+    total = int(count[-1]) if len(count) else 0
+    if not len(surface):
+        empty = np.empty(0)
+        return depth[surface], empty, empty, 0, np.empty(0, dtype=np.int64)
+
+    # Samples strictly between consecutive surface samples, and how far
+    # along the gap they are in total
+    between = count[before[1:]] - count[surface[:-1]]
+    distance = position[before[1:]] - position[surface[:-1]] - \
+        surface[:-1] * between
+    upper = distance / np.diff(surface)
+    lower = between - upper
+    after = total - int(count[surface[-1]])
+    remaining = np.cumsum((between + 1)[::-1])[::-1]
+    remaining = np.append(remaining, 0) + 1 + after
+    return depth[surface], lower, upper, after, remaining
+
+
+def _window_offset_means(surface_depth, lower, upper, after, remaining,
+                         windows):
+    """
+    Computes the ``calculate_window_mean()`` offset for each window. The
+    rolling medians of a window start at its ``window - 1``-th surface
+    sample, and the mean of the interpolated offset over the record is the
+    weighted sum of the medians from ``_surface_samples()``, instead of
+    interpolating every sample for each window.
+
+    :param surface_depth: the depths from ``_surface_samples()``
+    :param lower: the weights of each median but the last
+    :param upper: the weights of each median but the first
+    :param after: the number of samples after the last surface sample
+    :param remaining: the number of samples from each surface sample on
+    :param windows: a list of window sizes
+
+    :return: a NumPy array of the average offset of each window
+    """
+    means = np.full(len(windows), np.nan)
+    for i, window in enumerate(windows):
+        window = int(window)
+        if window < 1 or window > len(surface_depth):
+            continue
+        medians = rolling_median(surface_depth, window)[window - 1:]
+        offset_sum = medians.sum() + \
+            medians[:-1] @ lower[window - 1:] + \
+            medians[1:] @ upper[window - 1:] + after * medians[-1]
+        means[i] = offset_sum / remaining[window - 1]
+    return means
+
+
+def window_offset_curve(data,
+                        surface_threshold,
+                        windows=np.arange(10, 1001, step=10),
+                        n_jobs=1,
+                        executor=None):
+    """
+    Computes the average offset of ``calculate_window_mean()`` for every
+    window size without copying the data. The surface samples and the
+    weights of their medians are taken once and shared by every window.
+    Each window is a rolling median of the ``m`` surface samples in
+    ``O(m log w)`` for a window of ``w`` samples, followed by ``O(m)``
+    weighted sums, so the curve takes ``O(W m log w)`` for ``W`` windows.
+    The medians are the cost, around 0.25 seconds per window per million
+    surface samples, or about six minutes on one process for the 100
+    default windows over a year of 1 Hz samples with half of them at the
+    surface, so ``n_jobs`` divides it between processes.
+
+    :param data: Pandas Dataframe of the dive data
+    :param surface_threshold: the maximum depth that will be considered for
+        the offset
+    :param windows: a list of window sizes for the rolling median
+    :param n_jobs: the number of worker processes the windows are split
+        between, ``-1`` uses every CPU, default is 1
+    :param executor: an optional ``concurrent.futures.Executor`` to compute
+        the windows on instead of a new process pool
+
+    :return: a dataframe of the ``window_size`` and the ``offset_mean``
+    """
+    windows = np.asarray(windows, dtype=np.int64)
+    samples = _surface_samples(
+        np.asarray(data.depth.values, dtype=np.float64), surface_threshold)
+
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    if executor is None and n_jobs <= 1:
+        means = _window_offset_means(*samples, windows)
+    else:
+        pool = None
+        try:
+            if executor is None:
+                pool = executor = ProcessPoolExecutor(max_workers=n_jobs)
+            # Interleave the windows so each worker gets small and large ones
+            chunks = [windows[i::max(n_jobs, 1)]
+                      for i in range(min(len(windows), max(n_jobs, 1)))]
+            futures = [
+                executor.submit(_window_offset_means, *samples, chunk)
+                for chunk in chunks
+            ]
+            means = np.empty(len(windows))
+            for i, future in enumerate(futures):
+                means[i::max(n_jobs, 1)] = future.result()
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    return pd.DataFrame({'window_size': windows, 'offset_mean': means})
+
+
 def calculate_window_mean(window, surface_threshold, df):
     """
 
@@ -30,14 +196,228 @@ def calculate_window_mean(window, surface_threshold, df):
 
     :return: An average offset in meters using the defined window
     """
-    data = df.copy(deep=True)
-    data['adjusted_depth'] = data[
-        data.depth <= surface_threshold].depth.rolling(window).median()
-    data.adjusted_depth = data.adjusted_depth.interpolate()
-    data.adjusted_depth = data.depth - data.adjusted_depth
-    avg_adjustment = (data.depth - data.adjusted_depth).mean()
-    del data
-    return avg_adjustment
+    return window_offset_curve(df, surface_threshold,
+                               windows=[window]).offset_mean.iloc[0]
+
+
+def rolling_minimum(time, depth, window=3600, max_gap=None):
+    """
+    The rolling minimum of ``RollingMinimum`` over a whole record in memory.
+    Each window is covered by two overlapping runs of a power of two samples,
+    and the minimums of the runs are built by halving passes over the record,
+    so it takes ``O(n log w)`` vectorised steps for windows of up to ``w``
+    samples instead of a Python loop over every sample.
+
+    :param time: a NumPy array of times in seconds, sorted by time
+    :param depth: a NumPy array of depths
+    :param window: the time window in seconds, default is 3600
+    :param max_gap: the longest time in seconds between two samples before
+        the window is restarted, default is no limit
+
+    :return: a NumPy array of the minimum depth over the ``window`` seconds
+        up to and including each sample, since the start of the record or
+        the last gap, NaN where there is no depth in the window
+    """
+    if window <= 0:
+        raise ValueError("The window must be a positive number of seconds")
+    time = np.asarray(time, dtype=np.float64)
+    depth = np.asarray(depth, dtype=np.float64)
+    steps = np.diff(time)
+    if (steps < 0).any():
+        raise ValueError("The record must be sorted by time")
+
+    positions = np.arange(len(time))
+    first = np.searchsorted(time, time - window, side='right')
+    if max_gap is not None:
+        restarts = np.zeros(len(time), dtype=np.int64)
+        gaps = np.flatnonzero(steps > max_gap) + 1
+        restarts[gaps] = gaps
+        first = np.maximum(first, np.maximum.accumulate(restarts))
+
+    minimum = np.full(len(time), np.nan)
+    if not len(time):
+        return minimum
+    # The largest power of two that fits in the window of each sample
+    level = np.frexp(positions - first + 1)[1] - 1
+    runs = depth
+    for k in range(int(level.max()) + 1):
+        # runs[j] is the minimum of the 2 ** k samples starting at j
+        span = 2**k
+        at_level = np.flatnonzero(level == k)
+        minimum[at_level] = np.fmin(runs[first[at_level]],
+                                    runs[at_level - span + 1])
+        runs = np.fmin(runs[:-span], runs[span:])
+    return minimum
+
+
+class RollingMinimum:
+    """
+    A rolling minimum of the depth over a time window in seconds, updated a
+    chunk at a time with a monotonic deque. The deque only holds the samples
+    of the window that can still become the minimum, so memory is bounded by
+    the window and not by the record. Windows follow the time of the samples
+    instead of their count, so irregular or duty cycled sampling doesn't
+    change the time they cover. ``rolling_minimum()`` computes the same
+    minimum over a record that is already in memory.
+
+    :ivar window: the time window in seconds
+    :ivar max_gap: the longest time in seconds between two samples before
+        the window is restarted, or ``None`` to only drop the samples older
+        than the window
+    :ivar gaps: the number of times the window was restarted at a gap
+    """
+
+    def __init__(self, window=3600, max_gap=None):
+        """
+        :param window: the time window in seconds, default is 3600
+        :param max_gap: the longest time in seconds between two samples
+            before the window is restarted, default is no limit
+        """
+        if window <= 0:
+            raise ValueError("The window must be a positive number of "
+                             "seconds")
+        self.window = window
+        self.max_gap = max_gap
+        self.gaps = 0
+        self._deque = deque()
+        self._last_time = -math.inf
+
+    def update(self, time, depth):
+        """
+        The minimum of each sample is over the samples in the ``window``
+        seconds up to and including it, since the start of the record or the
+        last gap. Depths that are NaN are left out of the minimum.
+
+        :param time: a NumPy array of times in seconds, sorted by time and
+            after the times of the previous chunk
+        :param depth: a NumPy array of depths
+
+        :return: a NumPy array of the rolling minimum of each sample, NaN
+            where there is no depth in the window
+        """
+        window = self.window
+        max_gap = math.inf if self.max_gap is None else self.max_gap
+        samples = self._deque
+        last_time = self._last_time
+        minimum = []
+        for t, d in zip(
+                np.asarray(time, dtype=np.float64).tolist(),
+                np.asarray(depth, dtype=np.float64).tolist()):
+            if t < last_time:
+                raise ValueError("The record must be sorted by time to be "
+                                 "streamed")
+            if t - last_time > max_gap and last_time > -math.inf:
+                samples.clear()
+                self.gaps += 1
+            last_time = t
+            while samples and samples[0][0] <= t - window:
+                samples.popleft()
+            if d == d:
+                while samples and samples[-1][1] >= d:
+                    samples.pop()
+                samples.append((t, d))
+            minimum.append(samples[0][1] if samples else math.nan)
+        self._last_time = last_time
+        return np.array(minimum, dtype=np.float64)
+
+
+def stream_depth_offset(source,
+                        window=3600,
+                        max_gap=None,
+                        columns={
+                            'depth': 'depth',
+                            'time': 'time'
+                        },
+                        chunksize=1000000):
+    """
+    Corrects the depth offset of a record a chunk at a time with the rolling
+    minimum of the depth over ``window`` seconds, the same as the ``rolling``
+    method of ``correct_depth_offset()`` without holding the record or
+    writing an auxiliary file. The chunks can be passed straight to
+    ``stream_profile_dives()``, or concatenated for ``profile_dives()``.
+
+    :param source: a path to a CSV, netCDF, or Parquet file, a DataFrame, or an
+        iterable of Pandas DataFrames with a time and a depth column, sorted
+        by time
+    :param window: time window (in seconds) of the rolling minimum
+    :param max_gap: the longest time in seconds between two samples before
+        the window is restarted, default is no limit
+    :param columns: column renaming dictionary if needed
+    :param chunksize: the number of rows to read at a time
+
+    :return: an iterator of Pandas DataFrames with the ``time`` in seconds
+        since 1970-01-01, the corrected ``depth``, and the ``depth_offset``
+    """
+    rolling_minimum = RollingMinimum(window=window, max_gap=max_gap)
+    for time, depth in iter_record_chunks(source, columns=columns,
+                                          chunksize=chunksize):
+        offset = rolling_minimum.update(time, depth)
+        yield pd.DataFrame({
+            'time': time,
+            'depth': depth - offset,
+            'depth_offset': offset
+        })
+
+
+def write_offset_file(filename,
+                      time,
+                      offset,
+                      window,
+                      name='offset',
+                      offset_curve=None,
+                      complevel=4,
+                      chunksize=100000):
+    """
+    Writes a depth offset series to netCDF a chunk at a time, so only one
+    chunk of times is converted and compressed at once. The window size is
+    stored as the ``window_size_in_seconds`` attribute of the file.
+
+    :param filename: the path of the netCDF file
+    :param time: the times of the offsets, as datetimes or in seconds since
+        1970-01-01
+    :param offset: a NumPy array of the depth offsets
+    :param window: the window size used to calculate the offsets
+    :param name: the name of the offset variable, default is ``offset``
+    :param offset_curve: an optional dataframe with a ``window_size`` and an
+        ``offset_mean`` column from ``window_offset_curve()``
+    :param complevel: the zlib compression level from 0 (none) to 9, default
+        is 4
+    :param chunksize: the number of samples written at a time and in each
+        netCDF chunk
+    """
+    time = pd.Series(time)
+    length = len(time)
+    chunksize = max(1, min(int(chunksize), max(length, 1)))
+    compression = dict(zlib=complevel > 0, complevel=max(complevel, 1))
+
+    rootgrp = Dataset(filename, 'w')
+    try:
+        rootgrp.setncattr('window_size_in_seconds', window)
+        rootgrp.createDimension('time', length)
+        time_variable = rootgrp.createVariable(
+            'time', 'f8', ('time', ), chunksizes=(chunksize, ), **compression)
+        time_variable.units = units
+        offset_variable = rootgrp.createVariable(
+            name, 'f8', ('time', ), chunksizes=(chunksize, ), **compression)
+        offset_variable.units = 'meters'
+        offset_variable.positive = 'down'
+
+        for start in range(0, length, chunksize):
+            stop = min(start + chunksize, length)
+            time_variable[start:stop] = epoch_seconds(time.iloc[start:stop])
+            offset_variable[start:stop] = offset[start:stop]
+
+        if offset_curve is not None:
+            rootgrp.createDimension('window_size', len(offset_curve))
+            window_size = rootgrp.createVariable(
+                'window_size', 'i8', ('window_size', ), **compression)
+            window_size[:] = offset_curve.window_size.values
+            offset_mean = rootgrp.createVariable(
+                'offset_mean', 'f8', ('window_size', ), **compression)
+            offset_mean.units = 'meters'
+            offset_mean[:] = offset_curve.offset_mean.values
+    finally:
+        rootgrp.close()
 
 
 def correct_depth_offset(data,
@@ -48,59 +428,86 @@ def correct_depth_offset(data,
                          },
                          aux_file='corrected_depth_auxillary_data.nc',
                          method='max',
-                         surface_threshold=4):
+                         surface_threshold=4,
+                         n_jobs=1,
+                         executor=None,
+                         aux_complevel=4,
+                         aux_chunksize=100000,
+                         max_gap=None):
     """
     :param data: The dataset consisting of a time and a depth column
     :param window: time window (in seconds) to use in the calculation
-    :param aux_file: A netCDF file to write all of the calculated offsets and
-        window size
+    :param aux_file: A netCDF file to write the calculated offsets and window
+        size to with ``write_offset_file()``, ``None`` skips the file
     :param columns: column renaming dictionary if needed
-    :param method: either 'max' or 'mean' declaring the calculation method,
-        default is max
+    :param method: either 'max', 'mean', or 'rolling' declaring the
+        calculation method, default is max
     :param surface_threshold: maximum values (in meters) to use when using the
         mean the calculate
+    :param n_jobs: the number of worker processes the candidate windows of the
+        mean method are split between, ``-1`` uses every CPU, default is 1
+    :param executor: an optional ``concurrent.futures.Executor`` for the
+        candidate windows of the mean method
+    :param aux_complevel: the zlib compression level of the auxiliary file
+        from 0 (none) to 9, default is 4
+    :param aux_chunksize: the number of samples written to the auxiliary
+        file at a time and in each of its netCDF chunks
+    :param max_gap: the longest time in seconds between two samples before
+        the window of the rolling method is restarted, default is no limit
 
-    :return: A DataFrame with a corrected depth
+    :return: A DataFrame with a corrected depth, with the mean method the
+        average offset of every candidate window is in the ``offset_curve``
+        entry of its ``attrs``
     """
 
+    window_means = None
     if method == 'mean':
-        window_means = pd.DataFrame(
-            np.arange(10, 1001, step=10), columns=['window_size'])
-        window_means['offset_mean'] = window_means.window_size.apply(
-            calculate_window_mean, args=(surface_threshold, data))
+        window_means = window_offset_curve(data, surface_threshold,
+                                           n_jobs=n_jobs, executor=executor)
         window = window_means.iloc[(
             (window_means.offset_mean.diff() / window_means.window_size).diff(
             ) / window_means.window_size).idxmin()].window_size.astype(int)
 
-        data['depth_offset'] = data[data.depth < animal_length].depth.rolling(
-            window).median()
-        data.depth_offset = data.depth_offset.interpolate().fillna(0)
+        depth = np.asarray(data.depth.values, dtype=np.float64)
+        surface = np.flatnonzero(depth < surface_threshold)
+        medians = rolling_median(depth[surface], window)
+        known = ~np.isnan(medians)
+        depth_offset = np.zeros(len(depth))
+        if known.any():
+            # Interpolate between the medians and keep 0 before the first
+            positions = np.arange(len(depth))
+            depth_offset = np.interp(positions, surface[known],
+                                     medians[known])
+            depth_offset[positions < surface[known][0]] = 0
+        data['depth_offset'] = depth_offset
         data['corrected_depth'] = data.depth - data.depth_offset
+    elif method == 'rolling':
+        data['offset'] = rolling_minimum(epoch_seconds(data.time),
+                                         data.depth.values, window=window,
+                                         max_gap=max_gap)
+        data['corrected_depth'] = data.depth - data.offset
     else:
         data['offset'] = data.depth.rolling(
             int(window / data.time.diff().mean().total_seconds())).min()
         data.offset.fillna(data.offset.min(), inplace=True)
         data['corrected_depth'] = data.depth - data.offset
 
-    data['window_size_in_seconds'] = window
     corrected_data = pd.DataFrame()
     corrected_data['time'] = data.time
     corrected_data['depth'] = data.corrected_depth
+    if window_means is not None:
+        corrected_data.attrs['offset_curve'] = window_means
 
-    time_units = 'seconds since 1970-01-01'
-    data.time = date2num(pd.to_datetime(data.time).tolist(), units=time_units)
-    xarray_data = xr.Dataset(data)
-    xarray_data.variables['time'].attrs = {'units': time_units}
-    xarray_data.variables['depth'].attrs = {
-        'units': 'meters',
-        'positive': 'down'
-    }
-    xarray_data.variables['corrected_depth'].attrs = {
-        'units': 'meters',
-        'positive': 'down'
-    }
-    xarray_data.to_netcdf(
-        aux_file, mode='w', encoding=zlib_encoding(xarray_data))
-    xarray_data.close()
+    if aux_file is not None:
+        offset_column = 'depth_offset' if method == 'mean' else 'offset'
+        write_offset_file(
+            aux_file,
+            data.time,
+            data[offset_column].values,
+            window,
+            name=offset_column,
+            offset_curve=window_means,
+            complevel=aux_complevel,
+            chunksize=aux_chunksize)
 
     return corrected_data
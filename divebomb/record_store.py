@@ -0,0 +1,297 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+
+class RecordSpool:
+    """
+    A time and depth record written to a temporary binary file and read back
+    through a memory map, so the record can be passed over several times
+    without holding it in memory.
+
+    :ivar length: the number of samples in the record
+    :ivar depth_min: the minimum depth in the record
+    :ivar depth_max: the maximum depth in the record
+    :ivar mean_time_step: the mean difference between consecutive times
+    """
+
+    def __init__(self, directory=None):
+        """
+        :param directory: the folder to write the temporary file to, default
+            is the system temporary folder
+        """
+        handle, self.path = tempfile.mkstemp(suffix='.divebomb',
+                                             dir=directory)
+        self._file = os.fdopen(handle, 'wb')
+        self._record = None
+        self.length = 0
+        self._reset_summary()
+
+    def _reset_summary(self):
+        self._depth_min = np.nan
+        self._depth_max = np.nan
+        self._step_sum = 0.0
+        self._step_count = 0
+        self._last_time = np.nan
+
+    def _summarize(self, time, depth):
+        """
+        Adds a chunk of the record to the depth range and the time steps.
+
+        :param time: a NumPy array of times in seconds
+        :param depth: a NumPy array of depths
+        """
+        steps = np.diff(np.concatenate(([self._last_time], time)))
+        if (steps < 0).any():
+            raise ValueError("The record must be sorted by time to be "
+                             "streamed")
+        valid = ~np.isnan(steps)
+        self._step_sum += steps[valid].sum()
+        self._step_count += int(valid.sum())
+        self._last_time = time[-1]
+
+        if not np.isnan(depth).all():
+            self._depth_min = np.fmin(self._depth_min, np.nanmin(depth))
+            self._depth_max = np.fmax(self._depth_max, np.nanmax(depth))
+
+    @property
+    def depth_min(self):
+        return self._depth_min
+
+    @property
+    def depth_max(self):
+        return self._depth_max
+
+    @property
+    def mean_time_step(self):
+        if self._step_count:
+            return self._step_sum / self._step_count
+        return np.nan
+
+    def append(self, time, depth):
+        """
+        :param time: a NumPy array of times in seconds
+        :param depth: a NumPy array of depths
+        """
+        time = np.asarray(time, dtype=np.float64)
+        depth = np.asarray(depth, dtype=np.float64)
+        if len(time) == 0:
+            return
+
+        self._summarize(time, depth)
+        self._file.write(np.column_stack((time, depth)).tobytes())
+        self.length += len(time)
+
+    def close_writer(self):
+        """
+        Finishes writing and opens the memory map of the record.
+        """
+        self._file.close()
+        if self.length:
+            self._record = np.memmap(self.path, dtype=np.float64, mode='r',
+                                     shape=(self.length, 2))
+
+    def read(self, start, stop):
+        """
+        :param start: the first position to read
+        :param stop: the position after the last position to read
+
+        :return: NumPy arrays of the times and depths in ``[start, stop)``
+        """
+        window = np.array(self._record[start:stop])
+        return window[:, 0], window[:, 1]
+
+    def take(self, positions):
+        """
+        :param positions: a NumPy array of positions to read
+
+        :return: NumPy arrays of the times and depths at the positions
+        """
+        window = np.array(self._record[np.asarray(positions, dtype=np.int64)])
+        return window[:, 0], window[:, 1]
+
+    def chunks(self, chunksize):
+        """
+        :param chunksize: the number of samples per chunk
+
+        :return: an iterator of the chunk offset, times, and depths
+        """
+        for start in range(0, self.length, chunksize):
+            time, depth = self.read(start, start + chunksize)
+            yield start, time, depth
+
+    def close(self):
+        """
+        Removes the temporary file.
+        """
+        if not self._file.closed:
+            self._file.close()
+        self._record = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class RecordStore(RecordSpool):
+    """
+    A time and depth record kept in a ``.npy`` file of a ``(2, n)`` float64
+    array and opened as a read-only memory map. Only the pages of the samples
+    that are used are read from the file, so a record larger than memory can
+    be split, profiled, exported, and displayed a dive at a time, and worker
+    processes share the record through the page cache instead of each
+    holding a copy. A ``RecordStore`` can be passed as the ``data`` of
+    ``get_dive_starting_points()``, ``profile_dives()``, ``export_dives()``,
+    ``export_to_netcdf()``, ``export_to_parquet()``, and ``display_dive()``,
+    and as a ``RecordSpool`` to the functions of ``divebomb.streaming``.
+    Unlike a spool, the file is kept when the store is closed.
+
+    :ivar path: the path of the ``.npy`` file
+    :ivar record: the ``(2, n)`` memory map of the times in seconds since
+        1970-01-01 and the depths
+    """
+
+    def __init__(self, path):
+        """
+        :param path: the path of a ``.npy`` file written by ``create()``
+        """
+        self.path = path
+        self.record = np.load(path, mmap_mode='r')
+        if self.record.ndim != 2 or self.record.shape[0] != 2 or \
+                self.record.dtype != np.float64:
+            raise ValueError("A record store must be a (2, n) float64 array")
+        self.length = self.record.shape[1]
+        self._summarized = False
+
+    @classmethod
+    def create(cls,
+               path,
+               source,
+               columns={
+                   'depth': 'depth',
+                   'time': 'time'
+               },
+               chunksize=1000000):
+        """
+        Writes a record to a ``.npy`` file a chunk at a time. The record is
+        first spooled to a temporary file next to ``path``, since the length
+        of the record is only known at the end.
+
+        :param path: the path of the ``.npy`` file, overwritten if it exists
+        :param source: a path to a CSV, netCDF, or Parquet file, a DataFrame,
+            or an iterable of Pandas DataFrames with a time and a depth
+            column, sorted by time
+        :param columns: column renaming dictionary if needed
+        :param chunksize: the number of rows to read at a time
+
+        :return: a ``RecordStore`` of the file
+        """
+        from divebomb.streaming import spool_record
+
+        with spool_record(source, columns=columns, chunksize=chunksize,
+                          directory=os.path.dirname(os.path.abspath(path))
+                          ) as spool:
+            record = np.lib.format.open_memmap(
+                path, mode='w+', dtype=np.float64, shape=(2, spool.length))
+            for start, time, depth in spool.chunks(chunksize):
+                record[0, start:start + len(time)] = time
+                record[1, start:start + len(depth)] = depth
+            record.flush()
+            del record
+        return cls(path)
+
+    def _summarize_record(self):
+        """
+        Reads the depth range and the time steps from the file a chunk at a
+        time the first time they are needed.
+        """
+        if not self._summarized:
+            self._reset_summary()
+            for start, time, depth in self.chunks(1000000):
+                self._summarize(time, depth)
+            self._summarized = True
+
+    @property
+    def depth_min(self):
+        self._summarize_record()
+        return super().depth_min
+
+    @property
+    def depth_max(self):
+        self._summarize_record()
+        return super().depth_max
+
+    @property
+    def mean_time_step(self):
+        self._summarize_record()
+        return super().mean_time_step
+
+    @property
+    def time(self):
+        """
+        :return: the memory map of the times of the whole record
+        """
+        return self.record[0]
+
+    @property
+    def depth(self):
+        """
+        :return: the memory map of the depths of the whole record
+        """
+        return self.record[1]
+
+    def __len__(self):
+        return self.length
+
+    def read(self, start, stop):
+        """
+        :param start: the first position to read
+        :param stop: the position after the last position to read
+
+        :return: NumPy arrays of the times and depths in ``[start, stop)``
+        """
+        window = np.array(self.record[:, start:stop])
+        return window[0], window[1]
+
+    def take(self, positions):
+        """
+        :param positions: a NumPy array of positions to read
+
+        :return: NumPy arrays of the times and depths at the positions
+        """
+        window = self.record[:, np.asarray(positions, dtype=np.int64)]
+        return window[0], window[1]
+
+    def frame(self, start=0, stop=None):
+        """
+        :param start: the first position of the samples
+        :param stop: the position after the last position of the samples,
+            default is the end of the record
+
+        :return: a dataframe of the time and depth of the samples backed by
+            the memory map instead of a copy, indexed by their positions in
+            the record
+        """
+        record = self.record[:, start:stop]
+        return pd.DataFrame(
+            record.T,
+            columns=['time', 'depth'],
+            index=pd.RangeIndex(start, start + record.shape[1]),
+            copy=False)
+
+    def close(self):
+        """
+        Keeps the file, a store is only read.
+        """
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
@@ -0,0 +1,386 @@
+import os
+
+import numpy as np
+import pandas as pd
+from netCDF4 import Dataset, date2num, num2date
+
+from divebomb.kernels import (PeakDetector, _suppress_peaks, epoch_seconds,
+                              peak_threshold,
+                              profile_deepdive_segments, profile_dive_segments,
+                              refine_dive_starts)
+from divebomb.parquet import iter_parquet_chunks
+from divebomb.record_store import RecordSpool
+
+units = 'seconds since 1970-01-01'
+
+
+def _clean_chunk(chunk, columns):
+    """
+    :param chunk: a Pandas DataFrame with a time and a depth column
+    :param columns: column renaming dictionary if needed
+
+    :return: NumPy arrays of the times in seconds since 1970-01-01 and the
+        depths
+    """
+    return epoch_seconds(chunk[columns['time']]), \
+        chunk[columns['depth']].values.astype(np.float64)
+
+
+def iter_record_chunks(source,
+                       columns={
+                           'depth': 'depth',
+                           'time': 'time'
+                       },
+                       chunksize=1000000):
+    """
+    Reads a time and depth record in chunks.
+
+    :param source: a path to a CSV, netCDF, or Parquet file, a DataFrame, or an
+        iterable of Pandas DataFrames with a time and a depth column
+    :param columns: column renaming dictionary if needed
+    :param chunksize: the number of rows to read at a time
+
+    :return: an iterator of NumPy arrays of times in seconds since
+        1970-01-01 and depths
+    """
+    if isinstance(source, pd.DataFrame):
+        for start in range(0, len(source), chunksize):
+            yield _clean_chunk(source.iloc[start:start + chunksize], columns)
+    elif isinstance(source, str) and source.endswith('.nc'):
+        rootgrp = Dataset(source)
+        try:
+            time = rootgrp.variables[columns['time']]
+            depth = rootgrp.variables[columns['depth']]
+            time_units = getattr(time, 'units', units)
+            for start in range(0, len(time), chunksize):
+                values = np.ma.filled(
+                    time[start:start + chunksize].astype(np.float64), np.nan)
+                if time_units != units:
+                    values = date2num(num2date(values, time_units),
+                                      units=units)
+                yield np.asarray(values, dtype=np.float64), np.ma.filled(
+                    depth[start:start + chunksize].astype(np.float64),
+                    np.nan)
+        finally:
+            rootgrp.close()
+    elif isinstance(source, str) and (source.endswith('.parquet')
+                                      or os.path.isdir(source)):
+        for chunk in iter_parquet_chunks(
+                source, columns=[columns['time'], columns['depth']],
+                chunksize=chunksize):
+            yield _clean_chunk(chunk, columns)
+    elif isinstance(source, str):
+        for chunk in pd.read_csv(source, chunksize=chunksize):
+            yield _clean_chunk(chunk, columns)
+    else:
+        for chunk in source:
+            yield _clean_chunk(chunk, columns)
+
+
+def spool_record(source,
+                 columns={
+                     'depth': 'depth',
+                     'time': 'time'
+                 },
+                 chunksize=1000000,
+                 directory=None):
+    """
+    Reads a record once in chunks into a ``RecordSpool``. The record has to
+    be sorted by time.
+
+    :param source: a path to a CSV, netCDF, or Parquet file, a DataFrame, or an
+        iterable of Pandas DataFrames with a time and a depth column
+    :param columns: column renaming dictionary if needed
+    :param chunksize: the number of rows to read at a time
+    :param directory: the folder to write the temporary file to
+
+    :return: a ``RecordSpool`` of the record
+    """
+    spool = RecordSpool(directory=directory)
+    try:
+        for time, depth in iter_record_chunks(source, columns=columns,
+                                              chunksize=chunksize):
+            spool.append(time, depth)
+        spool.close_writer()
+    except BaseException:
+        spool.close()
+        raise
+    return spool
+
+
+def _find_peak_starts(spool, dive_detection_sensitivity,
+                      minimal_time_between_dives, chunksize):
+    """
+    :param spool: a ``RecordSpool`` of the record
+    :param dive_detection_sensitivity: a value bteween 0 and 1 indicating the
+        peak detection threshold
+    :param minimal_time_between_dives: the minimum time in seconds between
+        dive starts
+    :param chunksize: the number of samples to read at a time
+
+    :return: a NumPy array of the candidate dive start positions
+    """
+    detector = PeakDetector(
+        peak_threshold(-spool.depth_max, -spool.depth_min,
+                       dive_detection_sensitivity))
+    # Only the peaks above the threshold are kept, they are resolved together
+    # at the end to keep peaks of the same height the same as peakutils
+    peaks = [detector.update(depth * -1)
+             for offset, time, depth in spool.chunks(chunksize)]
+    peaks.append(detector.finish())
+    peaks = np.concatenate(peaks)
+    if len(peaks):
+        depth = spool.take(peaks)[1]
+    else:
+        depth = np.array([])
+    peaks = _suppress_peaks(
+        peaks, depth * -1,
+        int(minimal_time_between_dives / spool.mean_time_step))
+    return np.unique(np.concatenate(([0], peaks)))
+
+
+def _time_diff(spool, positions):
+    """
+    :param spool: a ``RecordSpool`` of the record
+    :param positions: a NumPy array of sorted positions
+
+    :return: the time difference to the previous sample at each position
+    """
+    time_diff = spool.take(positions)[0] - \
+        spool.take(np.clip(positions - 1, 0, None))[0]
+    time_diff[positions == 0] = np.nan
+    return time_diff
+
+
+def _batches(start_blocks, end_blocks, chunksize):
+    """
+    Groups consecutive segments into batches covering about ``chunksize``
+    samples, a long segment is always in a batch of its own.
+
+    :param start_blocks: a NumPy array of the first position of each segment
+    :param end_blocks: a NumPy array of the position after the last position
+        of each segment
+    :param chunksize: the number of samples to read at a time
+
+    :return: an iterator of the first and the last segment of each batch and
+        the window of samples they cover
+    """
+    first = 0
+    while first < len(start_blocks):
+        last = first + 1
+        while last < len(start_blocks) and \
+                end_blocks[last] - start_blocks[first] <= chunksize:
+            last += 1
+        window_start = start_blocks[first]
+        window_end = max(window_start, end_blocks[first:last].max())
+        yield first, last, window_start, window_end
+        first = last
+
+
+def _starts_frame(spool, positions, time_diff, end_blocks):
+    """
+    :param spool: a ``RecordSpool`` of the record
+    :param positions: a NumPy array of the dive start positions
+    :param time_diff: a NumPy array of the time differences at the starts
+    :param end_blocks: a NumPy array of the dive end positions
+
+    :return: a Pandas DataFrame of dive starts in the same layout as
+        ``get_dive_starting_points()``
+    """
+    time, depth = spool.take(positions)
+    return pd.DataFrame({
+        'time': time,
+        'depth': depth,
+        'time_diff': time_diff,
+        'start_block': positions,
+        'end_block': end_blocks
+    })
+
+
+def compute_dive_starting_points(spool,
+                                 dive_detection_sensitivity=None,
+                                 is_surfacing_animal=True,
+                                 minimal_time_between_dives=120,
+                                 surface_threshold=0,
+                                 chunksize=1000000):
+    """
+    Computes the dive starts of a spooled record with the same results as
+    ``get_dive_starting_points()``. Only the dive start positions are held in
+    memory; the samples are read from the spool a chunk or a dive at a time.
+
+    :param spool: a ``RecordSpool`` from ``spool_record()``
+    :param dive_detection_sensitivity: a value bteween 0 and 1 indicating the
+        peak detection threshold, the lower the value the deeper the threshold
+    :param is_surfacing_animal: a boolean indicating whether it's an animal
+        that is gaurantedd to surface between dives
+    :param minimal_time_between_dives: the minimum time in seconds that needs
+        to occur before there can be a new dive segement
+    :param surface_threshold: the threshold at which is considered surface for
+        surfacing animals, default is 0
+    :param chunksize: the number of samples to read at a time
+
+    :return: a Pandas DataFrame of the dive starts
+    """
+    if is_surfacing_animal and dive_detection_sensitivity is None:
+        dive_detection_sensitivity = 0.98
+    elif dive_detection_sensitivity is None:
+        dive_detection_sensitivity = 0.5
+
+    last_index = spool.length - 1
+    positions = _find_peak_starts(spool, dive_detection_sensitivity,
+                                  minimal_time_between_dives, chunksize)
+    time_diff = _time_diff(spool, positions)
+    end_blocks = np.append(positions[1:] + 1, last_index)
+
+    # Ignore large time gaps in the data, as in get_dive_starting_points
+    next_time_diff = np.append(time_diff[1:], np.nan)
+    end_blocks[next_time_diff > pd.Series(time_diff).mode()[0]] -= 1
+
+    if not is_surfacing_animal:
+        return _starts_frame(spool, positions, time_diff, end_blocks)
+
+    refined = []
+    for first, last, window_start, window_end in _batches(
+            positions, end_blocks, chunksize):
+        depth = spool.read(window_start, window_end)[1]
+        starts, is_dive = refine_dive_starts(
+            depth,
+            positions[first:last] - window_start,
+            end_blocks[first:last] - window_start,
+            surface_threshold=surface_threshold,
+            first_below=spool.mean_time_step >= 10)
+        refined.append(starts[is_dive] + window_start)
+    refined = np.concatenate(refined)
+    positions = np.unique(refined[(refined >= 0) & (refined <= last_index)])
+
+    time_diff = np.append(np.nan, np.diff(spool.take(positions)[0]))
+    end_blocks = np.append(positions[1:], last_index)
+    return _starts_frame(spool, positions, time_diff, end_blocks)
+
+
+def stream_dive_starting_points(source,
+                                dive_detection_sensitivity=None,
+                                is_surfacing_animal=True,
+                                minimal_time_between_dives=120,
+                                surface_threshold=0,
+                                columns={
+                                    'depth': 'depth',
+                                    'time': 'time'
+                                },
+                                chunksize=1000000,
+                                directory=None):
+    """
+    Finds the dive starts of a record that doesn't fit in memory. The record
+    is read once in chunks into a temporary file, then the peaks are found a
+    chunk at a time and the dive starts are refined a batch of dives at a
+    time. The rows are the same as the ones from
+    ``get_dive_starting_points()`` on the whole record. The starts are not
+    yielded as the record is read: the peak threshold depends on the depth
+    range of the whole record, and the time gaps between dives are found from
+    the most common time step at every start. Every start is found before
+    the first rows are yielded, so the memory held is the start positions
+    and not the samples.
+
+    :param source: a path to a CSV, netCDF, or Parquet file, a DataFrame, or an
+        iterable of Pandas DataFrames with a time and a depth column, sorted
+        by time
+    :param dive_detection_sensitivity: a value bteween 0 and 1 indicating the
+        peak detection threshold, the lower the value the deeper the threshold
+    :param is_surfacing_animal: a boolean indicating whether it's an animal
+        that is gaurantedd to surface between dives
+    :param minimal_time_between_dives: the minimum time in seconds that needs
+        to occur before there can be a new dive segement
+    :param surface_threshold: the threshold at which is considered surface for
+        surfacing animals, default is 0
+    :param columns: column renaming dictionary if needed
+    :param chunksize: the number of rows to read at a time
+    :param directory: the folder to write the temporary file to
+
+    :return: an iterator of Pandas DataFrames of dive starts
+    """
+    with spool_record(source, columns=columns, chunksize=chunksize,
+                      directory=directory) as spool:
+        starts = compute_dive_starting_points(
+            spool,
+            dive_detection_sensitivity=dive_detection_sensitivity,
+            is_surfacing_animal=is_surfacing_animal,
+            minimal_time_between_dives=minimal_time_between_dives,
+            surface_threshold=surface_threshold,
+            chunksize=chunksize)
+        for start in range(0, len(starts), chunksize):
+            yield starts.iloc[start:start + chunksize]
+
+
+def stream_profile_dives(source,
+                         is_surfacing_animal=True,
+                         dive_detection_sensitivity=None,
+                         minimal_time_between_dives=120,
+                         surface_threshold=0,
+                         at_depth_threshold=0.15,
+                         columns={
+                             'depth': 'depth',
+                             'time': 'time'
+                         },
+                         chunksize=1000000,
+                         directory=None):
+    """
+    Splits and profiles the dives of a record that doesn't fit in memory.
+    The dives are profiled a batch at a time from the samples they cover, so
+    only about ``chunksize`` samples are held in memory at once. The profiles
+    are the same as the ones from ``profile_dives()`` with the ``numpy``
+    backend, including the ``insufficient_data`` column for surfacing
+    animals.
+
+    :param source: a path to a CSV, netCDF, or Parquet file, a DataFrame, or an
+        iterable of Pandas DataFrames with a time and a depth column, sorted
+        by time
+    :param is_surfacing_animal: a boolean indicating whether it's an animal
+        that is gauranteed to surface between dives
+    :param dive_detection_sensitivity: a value bteween 0 and 1 indicating the
+        peak detection threshold, the lower the value the deeper the threshold
+    :param minimal_time_between_dives: the minimum time in seconds that needs
+        to occur before there can be a new dive segement
+    :param surface_threshold: the threshold at which is considered surface for
+        surfacing animals, default is 0
+    :param at_depth_threshold: a value from 0 - 1 indicating distance from the
+        bottom of the dive at which the animal is considered to be at depth
+    :param columns: column renaming dictionary if needed
+    :param chunksize: the number of rows to read at a time
+    :param directory: the folder to write the temporary file to
+
+    :return: an iterator of Pandas DataFrames of dive profiles
+    """
+    with spool_record(source, columns=columns, chunksize=chunksize,
+                      directory=directory) as spool:
+        starts = compute_dive_starting_points(
+            spool,
+            dive_detection_sensitivity=dive_detection_sensitivity,
+            is_surfacing_animal=is_surfacing_animal,
+            minimal_time_between_dives=minimal_time_between_dives,
+            surface_threshold=surface_threshold,
+            chunksize=chunksize)
+
+        start_blocks = starts.start_block.values.astype(np.int64)
+        end_blocks = np.clip(starts.end_block.values.astype(np.int64),
+                             start_blocks, spool.length)
+
+        for first, last, window_start, window_end in _batches(
+                start_blocks, end_blocks, chunksize):
+            time, depth = spool.read(window_start, window_end)
+            if is_surfacing_animal:
+                attributes = profile_dive_segments(
+                    time,
+                    depth,
+                    start_blocks[first:last] - window_start,
+                    end_blocks[first:last] - window_start,
+                    surface_threshold=surface_threshold,
+                    at_depth_threshold=at_depth_threshold)
+            else:
+                attributes = profile_deepdive_segments(
+                    time,
+                    depth,
+                    start_blocks[first:last] - window_start,
+                    end_blocks[first:last] - window_start,
+                    at_depth_threshold=at_depth_threshold)
+            yield pd.DataFrame(attributes,
+                               index=pd.RangeIndex(first, last))
@@ -22,5 +22,7 @@ setup(
     url='https://github.com/ocean-tracking-network/divebomb',
     download_url='https://github.com/ocean-tracking-network/divebomb',
     license='GPLv2',
-    packages=find_packages(exclude=('tests', 'docs'))
+    packages=find_packages(exclude=('tests', 'docs')),
+    extras_require={'parquet': ['pyarrow']},
+    entry_points={'console_scripts': ['divebomb = divebomb.cli:main']}
 )
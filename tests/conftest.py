@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from divebomb import clean_dive_data
+
+SEAL = os.path.join(os.path.dirname(__file__), os.pardir, 'docs', '_static',
+                    'seal_dive_data.csv')
+
+
+def _frame(depth, step=10.0):
+    return pd.DataFrame({
+        'time': 1.5e9 + step * np.arange(len(depth)),
+        'depth': np.asarray(depth, dtype=np.float64)
+    })
+
+
+def surfacing_depths(n_dives, seed=0):
+    """
+    :return: a NumPy array of the depths of ``n_dives`` dives with a descent,
+        a noisy bottom and an ascent separated by time at the surface
+    """
+    rng = np.random.default_rng(seed)
+    depth = []
+    for dive in range(n_dives):
+        bottom = rng.uniform(20, 80)
+        depth.extend(rng.uniform(0, 0.5, rng.integers(20, 40)))
+        depth.extend(np.linspace(0, bottom, rng.integers(10, 30)))
+        depth.extend(bottom + rng.uniform(-3, 3, rng.integers(10, 40)))
+        depth.extend(np.linspace(bottom, 0, rng.integers(10, 30)))
+    depth.extend(rng.uniform(0, 0.5, 30))
+    return np.array(depth)
+
+
+def deepdive_depths(n_dives, seed=0):
+    """
+    :return: a NumPy array of the depths of ``n_dives`` dives between 100 and
+        600 metres that never return to the surface
+    """
+    rng = np.random.default_rng(seed)
+    depth = [rng.uniform(80, 120)]
+    for dive in range(n_dives):
+        bottom = rng.uniform(300, 600)
+        top = rng.uniform(80, 150)
+        depth.extend(np.linspace(depth[-1], bottom, rng.integers(20, 40)))
+        depth.extend(bottom + rng.uniform(-5, 5, rng.integers(10, 30)))
+        depth.extend(np.linspace(bottom, top, rng.integers(20, 40)))
+    return np.array(depth)
+
+
+@pytest.fixture
+def make_record():
+    """
+    :return: a function building a record from depths sampled every 10
+        seconds
+    """
+    return _frame
+
+
+@pytest.fixture
+def surfacing_record():
+    return _frame(surfacing_depths(12))
+
+
+@pytest.fixture
+def deepdive_record():
+    return _frame(deepdive_depths(12))
+
+
+@pytest.fixture(scope='session')
+def seal():
+    data = clean_dive_data(pd.read_csv(SEAL))
+    return data.sort_values('time').reset_index(drop=True)
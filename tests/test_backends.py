@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from divebomb import profile_dives
+
+from conftest import surfacing_depths
+
+
+def _profile_both(data, **kwargs):
+    return [profile_dives(data.copy(), backend=backend, **kwargs)
+            for backend in ('numpy', 'pandas')]
+
+
+def _assert_frames_equal(left, right):
+    if left is None or right is None:
+        assert left is None and right is None
+        return
+    # The pandas backend appends a dict per dive, so the dtypes of its
+    # columns depend on which values are missing
+    pd.testing.assert_frame_equal(left, right, check_dtype=False)
+
+
+@pytest.mark.parametrize('surface_threshold', [0, 1])
+def test_surfacing_backends_match(surfacing_record, surface_threshold):
+    (dives, insufficient, _), (expected, expected_insufficient, _) = \
+        _profile_both(surfacing_record, surface_threshold=surface_threshold)
+
+    assert len(dives) >= 10
+    _assert_frames_equal(dives, expected)
+    _assert_frames_equal(insufficient, expected_insufficient)
+
+
+def test_deepdive_backends_match(deepdive_record):
+    (dives, insufficient, _), (expected, expected_insufficient, _) = \
+        _profile_both(deepdive_record, is_surfacing_animal=False)
+
+    assert len(dives) >= 10
+    assert insufficient is None and expected_insufficient is None
+    _assert_frames_equal(dives, expected)
+
+
+def test_insufficient_dives_match(make_record):
+    # A short segment of the noise at the surface is split off as a dive
+    # that can't be profiled
+    (dives, insufficient, _), (expected, expected_insufficient, _) = \
+        _profile_both(make_record(surfacing_depths(3, 0)),
+                      surface_threshold=0)
+
+    assert len(insufficient) == 1
+    assert insufficient.insufficient_data.all()
+    _assert_frames_equal(dives, expected)
+    _assert_frames_equal(insufficient, expected_insufficient)
+
+
+def test_dive_without_bottom_samples_matches(make_record):
+    # The record ends during the descent of the last dive
+    depth = np.concatenate((surfacing_depths(3, 5), np.linspace(0, 50, 12)))
+    (dives, insufficient, _), (expected, expected_insufficient, _) = \
+        _profile_both(make_record(depth), surface_threshold=1)
+
+    assert len(dives) == 4
+    assert dives.peaks.iloc[-1] == 0
+    _assert_frames_equal(dives, expected)
+    _assert_frames_equal(insufficient, expected_insufficient)
+
+
+@pytest.mark.parametrize('is_surfacing_animal', [True, False])
+def test_single_dive_backends_match(make_record, is_surfacing_animal):
+    (dives, insufficient, _), (expected, expected_insufficient, _) = \
+        _profile_both(make_record(surfacing_depths(1, 3)),
+                      is_surfacing_animal=is_surfacing_animal,
+                      surface_threshold=1)
+
+    if is_surfacing_animal:
+        assert len(dives) == 1
+    _assert_frames_equal(dives, expected)
+    _assert_frames_equal(insufficient, expected_insufficient)
@@ -0,0 +1,114 @@
+import itertools
+
+import pandas as pd
+import pytest
+
+import divebomb.cache
+from divebomb import (ProfileCache, get_dive_starting_points, profile_dives,
+                      profile_dives_batch)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    :return: a list holding the time the cache sees, in seconds
+    """
+    current = [1000.0]
+    monkeypatch.setattr(divebomb.cache, 'now', lambda: current[0])
+    return current
+
+
+@pytest.fixture
+def cache(tmp_path):
+    with ProfileCache(str(tmp_path / 'cache.sqlite')) as cache:
+        yield cache
+
+
+@pytest.mark.parametrize('is_surfacing_animal', [True, False])
+def test_profile_dives_reuses_cached_profiles(seal, cache,
+                                              is_surfacing_animal):
+    expected = profile_dives(seal.copy(),
+                             is_surfacing_animal=is_surfacing_animal,
+                             surface_threshold=3)[0]
+
+    first = profile_dives(seal.copy(),
+                          is_surfacing_animal=is_surfacing_animal,
+                          surface_threshold=3,
+                          cache=cache)[0]
+    assert cache.hits == 0
+    assert cache.misses == len(cache) > 0
+    second = profile_dives(seal.copy(),
+                           is_surfacing_animal=is_surfacing_animal,
+                           surface_threshold=3,
+                           cache=cache)[0]
+
+    assert cache.hits == cache.misses
+    pd.testing.assert_frame_equal(first, expected, check_dtype=False)
+    pd.testing.assert_frame_equal(second, first)
+
+
+def test_profile_dives_batch_only_profiles_missing_dives(seal, cache):
+    starts = get_dive_starting_points(seal.copy(), None, surface_threshold=3)
+    expected = profile_dives_batch(seal, starts, surface_threshold=3)
+    profile_dives_batch(seal, starts.iloc[::2], surface_threshold=3,
+                        cache=cache)
+    stored = len(cache)
+
+    dives = profile_dives_batch(seal, starts, surface_threshold=3,
+                                cache=cache)
+
+    assert cache.hits == stored
+    assert len(cache) == len(starts)
+    pd.testing.assert_frame_equal(dives, expected, check_dtype=False)
+
+
+def test_parameters_are_part_of_the_key(seal, cache):
+    starts = get_dive_starting_points(seal.copy(), None, surface_threshold=3)
+    profile_dives_batch(seal, starts, surface_threshold=3, cache=cache)
+
+    profile_dives_batch(seal, starts, surface_threshold=3,
+                        at_depth_threshold=0.3, cache=cache)
+
+    assert cache.hits == 0
+    assert len(cache) == 2 * len(starts)
+
+
+def _put(cache, *names):
+    cache.put_many((name, {'max_depth': 1.0}) for name in names)
+
+
+def test_least_recently_used_profiles_are_evicted(cache, clock):
+    ticks = itertools.count()
+    for name in ('a', 'b', 'c', 'd'):
+        clock[0] = 1000.0 + next(ticks)
+        _put(cache, name)
+    entry = cache.size // 4
+    clock[0] = 1000.0 + next(ticks)
+    assert set(cache.get_many(['a', 'b'])) == {'a', 'b'}
+
+    cache.max_size = 3 * entry
+    clock[0] = 1000.0 + next(ticks)
+    _put(cache, 'e')
+
+    # c and d were used the longest time ago
+    assert cache.evictions == 2
+    assert set(cache.get_many(['a', 'b', 'c', 'd', 'e'])) == {'a', 'b', 'e'}
+    assert cache.stats() == {
+        'hits': 5,
+        'misses': 2,
+        'evictions': 2,
+        'profiles': 3,
+        'size': 3 * entry
+    }
+
+
+def test_profiles_older_than_max_age_are_evicted(cache, clock):
+    _put(cache, 'a', 'b')
+    clock[0] += 50
+    cache.get_many(['a'])
+
+    cache.max_age = 60
+    clock[0] += 30
+
+    assert cache.evict() == 1
+    assert set(cache.get_many(['a', 'b'])) == {'a'}
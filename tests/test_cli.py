@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+from divebomb.cli import main, output_folders, run
+
+
+def _touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write('time,depth\n')
+    return str(path)
+
+
+def test_output_folders_keep_the_relative_path(tmp_path):
+    first = _touch(tmp_path / 'tags' / 'a' / 'seal1.csv')
+    second = _touch(tmp_path / 'tags' / 'b' / 'seal1.csv')
+
+    folders = output_folders('results', [first, second])
+
+    assert folders == {
+        first: os.path.join('results', 'a', 'seal1'),
+        second: os.path.join('results', 'b', 'seal1')
+    }
+
+
+def test_output_folder_of_a_single_file_is_its_name(tmp_path):
+    path = _touch(tmp_path / 'seal1.csv')
+
+    assert output_folders('results', [path]) == {
+        path: os.path.join('results', 'seal1')
+    }
+
+
+def test_files_sharing_a_results_folder_are_rejected(tmp_path):
+    _touch(tmp_path / 'tags' / 'seal1.csv')
+    _touch(tmp_path / 'tags' / 'seal1.nc')
+
+    with pytest.raises(ValueError, match='seal1'):
+        run([str(tmp_path / 'tags')], str(tmp_path / 'results'), {})
+    assert not os.path.exists(tmp_path / 'results' / 'manifest.json')
+    assert main([str(tmp_path / 'tags'), '-o',
+                 str(tmp_path / 'results')]) == 1
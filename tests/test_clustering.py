@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('sklearn')
+
+from divebomb import get_dive_starting_points, profile_dives_batch
+from divebomb.clustering import DiveClusterModel
+
+from conftest import _frame, surfacing_depths
+
+
+@pytest.fixture(scope='module')
+def dives():
+    data = _frame(surfacing_depths(80, seed=2))
+    starts = get_dive_starting_points(data.copy(), None)
+    return profile_dives_batch(data, starts)
+
+
+def test_predict_assigns_the_nearest_centre(dives):
+    model = DiveClusterModel(n_clusters=4).fit(dives)
+
+    labels = model.predict(dives)
+
+    points = model.transform(dives).values
+    centers = model._project(model.centers)
+    distance = ((points[:, None, :] - centers[None, :, :])**2).sum(axis=2)
+    np.testing.assert_array_equal(labels, distance.argmin(axis=1))
+    assert labels.dtype.kind == 'i'
+    assert len(np.unique(labels)) > 1
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from divebomb.DeepDive import DeepDive, DeepDiveAccumulator
+
+from conftest import deepdive_depths
+
+
+def _assert_snapshots_match(time, depth, batch):
+    accumulator = DeepDiveAccumulator()
+    for start in range(0, len(time), batch):
+        stop = min(start + batch, len(time))
+        accumulator.update(time[start:stop], depth[start:stop])
+        if stop < 3:
+            continue
+        expected = DeepDive(pd.DataFrame({
+            'time': time[:stop],
+            'depth': depth[:stop]
+        })).to_dict()
+        snapshot = accumulator.to_dict()
+        assert snapshot.keys() == expected.keys()
+        for key, value in expected.items():
+            assert snapshot[key] == pytest.approx(value, nan_ok=True), key
+
+
+@pytest.mark.parametrize('batch', [1, 7])
+def test_snapshots_match_deepdive(batch):
+    depth = deepdive_depths(3)
+    time = 1.5e9 + 10.0 * np.arange(len(depth))
+
+    _assert_snapshots_match(time, depth, batch)
+
+
+def test_snapshots_match_deepdive_with_missing_depths():
+    depth = deepdive_depths(3, 1)
+    depth[np.random.default_rng(1).integers(0, len(depth), 10)] = np.nan
+    time = 1.5e9 + 10.0 * np.arange(len(depth))
+
+    _assert_snapshots_match(time, depth, 5)
+
+
+def test_snapshots_match_deepdive_with_irregular_steps():
+    # The minimum distance between peaks changes with the mean time step
+    depth = deepdive_depths(3, 2)
+    time = 1.5e9 + np.cumsum(
+        np.random.default_rng(2).uniform(0.5, 6, len(depth)))
+
+    _assert_snapshots_match(time, depth, 3)
+
+
+@pytest.mark.parametrize('seed', [0, 3, 4])
+def test_snapshots_match_deepdive_with_whole_metre_depths(seed):
+    # Tags record whole metres, so close peaks often have the same height
+    depth = np.round(deepdive_depths(3, seed))
+    time = 1.5e9 + 2.0 * np.arange(len(depth))
+
+    _assert_snapshots_match(time, depth, 4)
+
+
+def test_peaks_match_deepdive_with_whole_metre_depths():
+    for seed in range(40):
+        depth = np.round(deepdive_depths(3, seed))
+        time = 1.5e9 + 2.0 * np.arange(len(depth))
+        accumulator = DeepDiveAccumulator()
+        for start in range(0, len(depth), 4):
+            accumulator.update(time[start:start + 4], depth[start:start + 4])
+
+        expected = DeepDive(pd.DataFrame({'time': time, 'depth': depth}))
+        assert accumulator.to_dict()['peaks'] == \
+            expected.to_dict()['peaks'], seed
+
+
+def test_to_dict_only_reads_the_counters():
+    depth = deepdive_depths(2)
+    time = 1.5e9 + 10.0 * np.arange(len(depth))
+    accumulator = DeepDiveAccumulator()
+    accumulator.update(time, depth)
+    snapshot = accumulator.to_dict()
+
+    # Clearing the samples doesn't change the snapshot
+    accumulator._depth[:] = np.nan
+    accumulator._time_diff[:] = np.nan
+
+    assert accumulator.to_dict() == snapshot
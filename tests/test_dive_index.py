@@ -0,0 +1,82 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from divebomb import DiveIndex, RecordStore
+
+
+@pytest.fixture
+def starts():
+    return pd.DataFrame({'start_block': [0, 10, 25],
+                         'end_block': [10, 25, 40]})
+
+
+def test_float64_columns_are_not_copied(make_record, starts):
+    data = make_record(np.arange(40.0))
+
+    index = DiveIndex.from_starts(data, starts)
+
+    assert np.shares_memory(index.time, data.time.values)
+    assert np.shares_memory(index.depth, data.depth.values)
+    assert index.time.flags['C_CONTIGUOUS']
+    assert index.record is None
+
+
+def test_other_columns_are_copied_to_float64(starts):
+    data = pd.DataFrame({'time': np.arange(40), 'depth': np.arange(40)})
+
+    index = DiveIndex.from_starts(data, starts)
+
+    assert index.time.dtype == index.depth.dtype == np.float64
+    assert not np.shares_memory(index.time, data.time.values)
+    np.testing.assert_array_equal(index.depth, data.depth.values)
+
+
+def test_time_and_depth_must_have_the_same_length():
+    with pytest.raises(ValueError, match='length'):
+        DiveIndex(np.arange(5.0), np.arange(4.0), [0], [5])
+
+
+def test_dives_are_views_of_the_record(make_record, starts):
+    data = make_record(np.arange(40.0))
+    index = DiveIndex.from_starts(data, starts)
+
+    frame = index.frame(1)
+
+    assert np.shares_memory(frame.depth.values, data.depth.values)
+    np.testing.assert_array_equal(frame.depth.values, np.arange(10.0, 25.0))
+    np.testing.assert_array_equal(index.dive_time(2),
+                                  data.time.values[25:40])
+    selected = index.select([2, 0])
+    assert np.shares_memory(selected.depth, data.depth.values)
+    np.testing.assert_array_equal(selected.dive_depth(0), index.dive_depth(2))
+
+
+def test_take_gathers_the_dives(make_record, starts):
+    data = make_record(np.arange(40.0))
+    index = DiveIndex.from_starts(data, starts)
+
+    taken = index.take([2, 0])
+
+    np.testing.assert_array_equal(taken.depth,
+                                  np.r_[np.arange(25.0, 40.0), np.arange(10)])
+    np.testing.assert_array_equal(taken.dive_depth(1), index.dive_depth(0))
+
+
+def test_mapped_index_is_pickled_as_its_file(make_record, starts, tmp_path):
+    data = make_record(np.arange(40.0))
+    store = RecordStore.create(str(tmp_path / 'record.npy'), data)
+    index = DiveIndex.from_starts(store, starts)
+    assert index.is_mapped
+    assert np.shares_memory(index.depth, store.record)
+
+    state = index.__getstate__()
+    assert 'depth' not in state
+    restored = pickle.loads(pickle.dumps(index))
+
+    assert restored.is_mapped
+    np.testing.assert_array_equal(restored.dive_depth(1),
+                                  index.dive_depth(1))
+    np.testing.assert_array_equal(restored.dive_time(1), index.dive_time(1))
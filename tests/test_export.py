@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('netCDF4')
+pytest.importorskip('xarray')
+pytest.importorskip('sklearn')
+
+from divebomb import (RecordStore, cluster_dives, export_to_netcdf,
+                      profile_dives)
+from divebomb.plotting import _archive_summary_data, _read_dive
+
+
+@pytest.fixture(scope='module')
+def clustered(seal):
+    dives = profile_dives(seal.copy(), surface_threshold=3)[0]
+    return cluster_dives(dives, n_clusters=3)
+
+
+def _export(folder, data, clustered, layout):
+    dives, loadings, pca_output_matrix = clustered
+    export_to_netcdf(str(folder), data, dives.copy(), loadings,
+                     pca_output_matrix, layout=layout)
+    return str(folder)
+
+
+@pytest.mark.parametrize('from_store', [False, True])
+def test_archive_matches_dive_files(seal, clustered, tmp_path, from_store):
+    data = seal.copy()
+    if from_store:
+        data = RecordStore.create(str(tmp_path / 'seal.npy'), seal)
+    files = _export(tmp_path / 'files', seal.copy(), clustered, 'files')
+    archive = _export(tmp_path / 'archive', data, clustered, 'archive')
+    assert os.path.exists(os.path.join(archive, 'dive_archive.nc'))
+    assert not os.path.exists(os.path.join(archive, 'cluster_0'))
+
+    dives = clustered[0]
+    for position in np.linspace(0, len(dives) - 1, 25).astype(int):
+        cluster = int(dives.cluster.iloc[position])
+        dive_id = int(dives.index[position]) + 1
+        file_data, file_attributes = _read_dive(files, cluster, dive_id)
+        archive_data, archive_attributes = _read_dive(
+            archive, cluster, dive_id)
+
+        assert len(file_data) > 0
+        np.testing.assert_array_equal(archive_data.time.values,
+                                      file_data.time.values)
+        np.testing.assert_array_equal(archive_data.depth.values,
+                                      file_data.depth.values)
+        shared = set(file_attributes) & set(archive_attributes)
+        assert {'max_depth', 'dive_start', 'cluster'} <= shared
+        for name in shared:
+            assert archive_attributes[name] == pytest.approx(
+                file_attributes[name], nan_ok=True), name
+
+
+def test_archive_summary_has_every_sample(seal, clustered, tmp_path):
+    archive = _export(tmp_path / 'archive', seal.copy(), clustered,
+                      'archive')
+    dives = clustered[0]
+
+    summary = _archive_summary_data(
+        os.path.join(archive, 'dive_archive.nc'), {
+            'time': True,
+            'depth': True
+        })
+
+    first = _read_dive(archive, int(dives.cluster.iloc[0]),
+                       int(dives.index[0]) + 1)[0]
+    assert summary.depth.iloc[:len(first)].tolist() == \
+        first.depth.tolist()
+    assert summary.time.iloc[0] == 0
+    assert set(summary.cluster.unique()) == set(dives.cluster.unique())
+    assert summary.progress_into_dive.max() == 100
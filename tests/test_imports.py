@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+OPTIONAL = ('sklearn', 'netCDF4', 'plotly', 'pyarrow', 'scipy', 'xarray',
+            'peakutils', 'ipywidgets')
+
+# What importing divebomb may take on top of numpy and pandas, well above the
+# few tens of milliseconds it takes so a slow machine doesn't fail the test
+IMPORT_BUDGET = 0.3
+
+
+def _import_divebomb():
+    # pandas imports pyarrow itself when it is installed
+    code = ("import sys, time, numpy, pandas; before = set(sys.modules); "
+            "start = time.perf_counter(); import divebomb; "
+            "print(time.perf_counter() - start); "
+            f"print(' '.join(m for m in {OPTIONAL!r} "
+            "if m in sys.modules and m not in before))")
+    result = subprocess.run([sys.executable, '-c', code],
+                            cwd=os.path.join(os.path.dirname(__file__),
+                                             os.pardir),
+                            capture_output=True,
+                            text=True,
+                            check=True)
+    lines = result.stdout.split('\n')
+    return float(lines[0]), lines[1].split()
+
+
+def test_import_skips_optional_dependencies():
+    assert _import_divebomb()[1] == []
+
+
+def test_import_time_is_within_budget():
+    # The fastest of a few runs, so a busy machine doesn't fail the test
+    elapsed = min(_import_divebomb()[0] for run in range(3))
+
+    assert elapsed < IMPORT_BUDGET
@@ -0,0 +1,112 @@
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from divebomb import (RecordStore, get_dive_starting_points,
+                      profile_dives, profile_dives_batch)
+
+from conftest import _frame, deepdive_depths, surfacing_depths
+
+
+class _ReversedFuture(Future):
+
+    def __init__(self, executor):
+        super().__init__()
+        self._executor = executor
+
+    def result(self, timeout=None):
+        self._executor.run()
+        return super().result(timeout)
+
+
+class _ReversedExecutor(Executor):
+    """
+    Runs the submitted calls in the reverse order once a result is asked
+    for, so the last chunk finishes first.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def submit(self, fn, *args, **kwargs):
+        future = _ReversedFuture(self)
+        self.calls.append((future, fn, args, kwargs))
+        return future
+
+    def run(self):
+        calls, self.calls = self.calls, []
+        for future, fn, args, kwargs in reversed(calls):
+            future.set_result(fn(*args, **kwargs))
+
+
+@pytest.fixture(scope='module', params=[True, False],
+                ids=['surfacing', 'deepdive'])
+def record(request):
+    is_surfacing_animal = request.param
+    if is_surfacing_animal:
+        data = _frame(surfacing_depths(120, seed=5))
+    else:
+        data = _frame(deepdive_depths(120, seed=5))
+    starts = get_dive_starting_points(data.copy(),
+                                      None,
+                                      is_surfacing_animal=is_surfacing_animal)
+    return data, starts, is_surfacing_animal
+
+
+def _profile(data, starts, is_surfacing_animal, **kwargs):
+    return profile_dives_batch(data,
+                               starts,
+                               is_surfacing_animal=is_surfacing_animal,
+                               **kwargs)
+
+
+def test_process_pool_matches_a_single_process(record):
+    data, starts, is_surfacing_animal = record
+    expected = _profile(data, starts, is_surfacing_animal)
+
+    dives = _profile(data, starts, is_surfacing_animal, n_jobs=3)
+
+    assert len(expected) == len(starts) >= 100
+    pd.testing.assert_frame_equal(dives, expected)
+
+
+@pytest.mark.parametrize('executor', [ThreadPoolExecutor, _ReversedExecutor])
+def test_chunks_are_put_back_in_dive_order(record, executor):
+    data, starts, is_surfacing_animal = record
+    expected = _profile(data, starts, is_surfacing_animal)
+
+    dives = _profile(data, starts, is_surfacing_animal,
+                     executor=executor())
+
+    pd.testing.assert_frame_equal(dives, expected)
+    np.testing.assert_array_equal(dives.dive_start.values,
+                                  np.sort(dives.dive_start.values))
+
+
+def test_mapped_store_matches_a_single_process(record, tmp_path):
+    data, starts, is_surfacing_animal = record
+    store = RecordStore.create(str(tmp_path / 'record.npy'), data)
+    expected = _profile(data, starts, is_surfacing_animal)
+
+    dives = _profile(store, starts, is_surfacing_animal,
+                     executor=_ReversedExecutor())
+
+    pd.testing.assert_frame_equal(dives, expected)
+
+
+def test_profile_dives_n_jobs_matches_a_single_process(record):
+    data, starts, is_surfacing_animal = record
+
+    expected = profile_dives(data.copy(),
+                             is_surfacing_animal=is_surfacing_animal)
+    profiled = profile_dives(data.copy(),
+                             is_surfacing_animal=is_surfacing_animal,
+                             n_jobs=2)
+
+    for frame, expected_frame in zip(profiled[:2], expected[:2]):
+        if expected_frame is None:
+            assert frame is None
+        else:
+            pd.testing.assert_frame_equal(frame, expected_frame)
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from divebomb import get_dive_starting_points
+from divebomb.kernels import (_indexes, find_peaks, local_maxima,
+                              peak_threshold, select_peaks)
+from divebomb.streaming import stream_dive_starting_points
+
+pytest.importorskip('peakutils')
+
+
+def _tied_record():
+    # Depths rounded to whole metres give many peaks of the same height
+    rng = np.random.default_rng(4)
+    return -np.round(np.abs(np.cumsum(rng.normal(size=20000))) % 25)
+
+
+@pytest.mark.parametrize('thres', [0.98, 0.8, 0.5, 0.3])
+@pytest.mark.parametrize('min_dist', [1, 6, 12.5])
+def test_find_peaks_matches_peakutils(seal, thres, min_dist):
+    for y in (seal.depth.values * -1, _tied_record()):
+        expected = _indexes(y, thres, min_dist)
+        np.testing.assert_array_equal(find_peaks(y, thres, min_dist),
+                                      expected)
+
+        indices, heights = local_maxima(y)
+        threshold = peak_threshold(np.nanmin(y), np.nanmax(y), thres)
+        np.testing.assert_array_equal(
+            select_peaks(indices, heights, threshold, min_dist), expected)
+
+
+@pytest.mark.parametrize('is_surfacing_animal', [True, False])
+@pytest.mark.parametrize('sensitivity', [None, 0.5])
+def test_streamed_starts_match_in_memory_starts(seal, is_surfacing_animal,
+                                                sensitivity):
+    starts = get_dive_starting_points(seal.copy(),
+                                      sensitivity,
+                                      is_surfacing_animal=is_surfacing_animal,
+                                      surface_threshold=3)
+    streamed = pd.concat(
+        stream_dive_starting_points(seal,
+                                    sensitivity,
+                                    is_surfacing_animal=is_surfacing_animal,
+                                    surface_threshold=3,
+                                    chunksize=5000))
+
+    np.testing.assert_array_equal(streamed.start_block.values,
+                                  starts.start_block.values)
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('netCDF4')
+
+from netCDF4 import Dataset
+
+from divebomb.preprocessing import (RollingMinimum, correct_depth_offset,
+                                    rolling_minimum, stream_depth_offset,
+                                    window_offset_curve, write_offset_file)
+
+
+def _irregular_record(n=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    time = np.cumsum(rng.choice([0, 1, 2, 5, 60, 900, 7200], size=n,
+                                p=[.05, .4, .3, .15, .05, .04, .01]))
+    depth = rng.gamma(2.0, 20.0, size=n) + 1.5
+    depth[rng.random(n) < 0.05] = np.nan
+    return time.astype(np.float64), depth
+
+
+@pytest.mark.parametrize('window', [1, 5, 60, 3600])
+def test_rolling_minimum_matches_a_time_based_pandas_window(window):
+    time, depth = _irregular_record()
+    expected = pd.Series(
+        depth, index=pd.to_datetime(time, unit='s')).rolling(
+            f'{window}s', min_periods=1).min().values
+
+    np.testing.assert_array_equal(rolling_minimum(time, depth, window),
+                                  expected)
+
+
+@pytest.mark.parametrize('max_gap', [None, 60, 600])
+@pytest.mark.parametrize('window', [5, 3600])
+def test_rolling_minimum_matches_the_streamed_minimum(window, max_gap):
+    time, depth = _irregular_record(seed=1)
+
+    np.testing.assert_array_equal(
+        rolling_minimum(time, depth, window, max_gap),
+        RollingMinimum(window, max_gap).update(time, depth))
+
+
+def test_rolling_minimum_restarts_after_a_gap():
+    time = np.array([0., 10., 20., 1000., 1010.])
+    depth = np.array([1., 5., 6., 8., 7.])
+
+    np.testing.assert_array_equal(
+        rolling_minimum(time, depth, 3600, max_gap=100), [1, 1, 1, 8, 7])
+    np.testing.assert_array_equal(rolling_minimum(time, depth, 3600),
+                                  [1, 1, 1, 1, 1])
+
+
+def test_rolling_minimum_rejects_unsorted_times():
+    with pytest.raises(ValueError, match='sorted'):
+        rolling_minimum(np.array([0., 2., 1.]), np.zeros(3))
+
+
+def test_correct_depth_offset_rolling_uses_max_gap():
+    time, depth = _irregular_record(seed=2)
+    data = pd.DataFrame({'time': pd.to_datetime(time, unit='s'),
+                         'depth': depth})
+
+    corrected = correct_depth_offset(data.copy(), window=3600,
+                                     method='rolling', aux_file=None,
+                                     max_gap=600)
+    streamed = pd.concat(
+        stream_depth_offset(data, window=3600, max_gap=600, chunksize=700))
+
+    np.testing.assert_array_equal(corrected.depth.values,
+                                  streamed.depth.values)
+
+
+def _pandas_window_mean(data, window, surface_threshold):
+    # The calculate_window_mean() of divebomb 1.1.0, copying the record
+    data = data.copy(deep=True)
+    data['adjusted_depth'] = data[
+        data.depth <= surface_threshold].depth.rolling(window).median()
+    data.adjusted_depth = data.adjusted_depth.interpolate()
+    data.adjusted_depth = data.depth - data.adjusted_depth
+    return (data.depth - data.adjusted_depth).mean()
+
+
+@pytest.mark.parametrize('missing', [0.0, 0.1])
+def test_window_offset_curve_matches_the_pandas_window_mean(missing):
+    rng = np.random.default_rng(3)
+    depth = rng.gamma(1.5, 3.0, size=2000)
+    depth[rng.random(len(depth)) < missing] = np.nan
+    data = pd.DataFrame({'depth': depth})
+    windows = [1, 2, 10, 55, 400, 2000]
+
+    curve = window_offset_curve(data, 4, windows=windows)
+
+    expected = [_pandas_window_mean(data, window, 4) for window in windows]
+    np.testing.assert_allclose(curve.offset_mean.values, expected,
+                               rtol=1e-9)
+
+
+@pytest.mark.parametrize('complevel', [0, 4])
+def test_offset_file_reads_back(tmp_path, complevel):
+    time, depth = _irregular_record(n=1050, seed=4)
+    offset = rolling_minimum(time, depth, 600)
+    curve = pd.DataFrame({'window_size': [10, 20],
+                          'offset_mean': [1.5, 1.25]})
+    filename = str(tmp_path / 'offset.nc')
+
+    write_offset_file(filename, pd.to_datetime(time, unit='s'), offset, 600,
+                      offset_curve=curve, complevel=complevel,
+                      chunksize=100)
+
+    rootgrp = Dataset(filename)
+    try:
+        assert rootgrp.window_size_in_seconds == 600
+        assert rootgrp.variables['offset'].chunking() == [100]
+        assert rootgrp.variables['offset'].filters()['zlib'] == \
+            (complevel > 0)
+        np.testing.assert_array_equal(rootgrp.variables['time'][:], time)
+        np.testing.assert_array_equal(
+            np.ma.filled(rootgrp.variables['offset'][:], np.nan), offset)
+        np.testing.assert_array_equal(rootgrp.variables['window_size'][:],
+                                      [10, 20])
+        np.testing.assert_array_equal(rootgrp.variables['offset_mean'][:],
+                                      [1.5, 1.25])
+    finally:
+        rootgrp.close()
@@ -0,0 +1,108 @@
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from divebomb import (RecordStore, get_dive_starting_points,
+                      profile_dive_records, profile_dives)
+from divebomb.parquet import export_to_parquet, read_parquet, write_record
+from divebomb.streaming import spool_record
+
+@pytest.fixture
+def store(seal, tmp_path):
+    return RecordStore.create(str(tmp_path / 'seal.npy'), seal,
+                              chunksize=5000)
+
+
+def test_store_summary_matches_spool(seal, store):
+    with spool_record(seal, chunksize=5000) as spool:
+        assert store.length == len(store) == spool.length == len(seal)
+        assert store.depth_min == spool.depth_min
+        assert store.depth_max == spool.depth_max
+        assert store.mean_time_step == pytest.approx(spool.mean_time_step)
+        np.testing.assert_array_equal(store.read(100, 200)[1],
+                                      spool.read(100, 200)[1])
+        np.testing.assert_array_equal(store.take([3, 7])[0],
+                                      spool.take([3, 7])[0])
+    assert os.path.exists(store.path)
+
+
+def test_unsorted_record_is_rejected(seal, tmp_path):
+    with pytest.raises(ValueError, match='sorted'):
+        RecordStore.create(str(tmp_path / 'seal.npy'), seal.iloc[::-1])
+
+
+@pytest.mark.parametrize('is_surfacing_animal', [True, False])
+def test_store_profiles_match_dataframe(seal, store, is_surfacing_animal):
+    starts = get_dive_starting_points(seal.copy(),
+                                      None,
+                                      is_surfacing_animal=is_surfacing_animal,
+                                      surface_threshold=3)
+    store_starts = get_dive_starting_points(
+        store,
+        None,
+        is_surfacing_animal=is_surfacing_animal,
+        surface_threshold=3)
+    np.testing.assert_array_equal(store_starts.start_block.values,
+                                  starts.start_block.values)
+    np.testing.assert_array_equal(store_starts.end_block.values,
+                                  starts.end_block.values)
+
+    dives = profile_dives(seal, is_surfacing_animal=is_surfacing_animal,
+                          surface_threshold=3)[0]
+    store_dives = profile_dives(store,
+                                is_surfacing_animal=is_surfacing_animal,
+                                surface_threshold=3)[0]
+    pd.testing.assert_frame_equal(store_dives, dives)
+
+
+@pytest.mark.parametrize('is_surfacing_animal', [True, False])
+def test_profile_data_is_sliced_from_store(seal, store, is_surfacing_animal):
+    starts = get_dive_starting_points(store,
+                                      None,
+                                      is_surfacing_animal=is_surfacing_animal,
+                                      surface_threshold=3)
+    records = profile_dive_records(store, starts.iloc[:5],
+                                   is_surfacing_animal=is_surfacing_animal,
+                                   surface_threshold=3)
+    for record in records:
+        pd.testing.assert_frame_equal(
+            record.data, seal.iloc[record.start:record.stop][['time',
+                                                              'depth']])
+
+
+def test_store_is_pickled_as_its_path(store):
+    restored = pickle.loads(pickle.dumps(store))
+    assert restored.path == store.path
+    np.testing.assert_array_equal(restored.record, store.record)
+
+
+def test_write_record_from_store(seal, store, tmp_path):
+    pytest.importorskip('pyarrow')
+    write_record(store, str(tmp_path / 'record.parquet'), chunksize=5000)
+    record = read_parquet(str(tmp_path / 'record.parquet'))
+    np.testing.assert_array_equal(record.time.values, seal.time.values)
+    np.testing.assert_array_equal(record.depth.values, seal.depth.values)
+
+    write_record(store, str(tmp_path / 'records'), deployment='seal1')
+    write_record(store, str(tmp_path / 'records'), deployment='seal1')
+    record = read_parquet(str(tmp_path / 'records'),
+                          filters=[('deployment', '=', 'seal1')])
+    assert len(record) == len(seal)
+    assert (record.deployment == 'seal1').all()
+
+
+def test_export_to_parquet_from_store(seal, store, tmp_path):
+    pytest.importorskip('pyarrow')
+    dives = profile_dives(store, surface_threshold=3)[0].iloc[:10].copy()
+    dives['cluster'] = np.arange(len(dives)) % 2
+    loadings = pd.DataFrame({'component': ['a'], 'PC1': [1.0]})
+    pca = pd.DataFrame({'PC1': np.zeros(len(dives))})
+    folder = str(tmp_path / 'results')
+
+    export_to_parquet(folder, store, dives, loadings, pca)
+
+    record = read_parquet(os.path.join(folder, 'record.parquet'))
+    np.testing.assert_array_equal(record.depth.values, seal.depth.values)
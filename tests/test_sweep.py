@@ -0,0 +1,35 @@
+import itertools
+
+import pytest
+
+from divebomb import profile_dives, sweep_dive_detection
+
+
+@pytest.mark.parametrize('is_surfacing_animal', [True, False])
+def test_sweep_matches_profile_dives(seal, is_surfacing_animal):
+    sensitivities = [None, 0.7]
+    min_gaps = [60, 600]
+
+    table = sweep_dive_detection(seal,
+                                 sensitivities,
+                                 min_gaps,
+                                 is_surfacing_animal=is_surfacing_animal,
+                                 surface_threshold=3)
+
+    assert len(table) == 4
+    grid = itertools.product(sensitivities, min_gaps)
+    for row, (sensitivity, min_gap) in zip(table.itertuples(), grid):
+        assert row.minimal_time_between_dives == min_gap
+        dives, insufficient, _ = profile_dives(
+            seal.copy(),
+            is_surfacing_animal=is_surfacing_animal,
+            dive_detection_sensitivity=sensitivity,
+            minimal_time_between_dives=min_gap,
+            surface_threshold=3)
+        assert row.dives == len(dives)
+        assert row.insufficient_dives == (
+            0 if insufficient is None else len(insufficient))
+        assert row.median_duration == pytest.approx(
+            dives.td_total_duration.median())
+    # A longer gap between dives merges some of them
+    assert table.dives.iloc[1] < table.dives.iloc[0]